@@ -6,7 +6,16 @@ Params = {
     'port': 8000,
     'url': '/assets/report/',
     'request_timeout': 30,
+    # 服务器没有返回汇报间隔时使用的默认间隔(秒)
+    'default_interval': 3600,
+    # 请求签名使用的密钥ID和密钥, 必须与服务器端 REPORT_AUTH 中的配置一致
+    # 密钥只从环境变量读取, 没有配置时客户端拒绝发送
+    'key_id': os.environ.get('CMDB_REPORT_KEY_ID', 'default'),
+    'secret': os.environ.get('CMDB_REPORT_SECRET', ''),
 }
 
 # 日志文件配置
 PATH = os.path.join(os.path.dirname(os.getcwd()), 'log', 'cmdb.log')
+
+# 记录服务器下发的下一次汇报时间
+STATE_PATH = os.path.join(os.path.dirname(os.getcwd()), 'log', 'next_report')
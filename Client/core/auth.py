@@ -0,0 +1,28 @@
+import hashlib
+import hmac
+import time
+import uuid
+
+
+def sign_headers(key_id, secret, method, path, sn, body):
+    """ 生成请求签名相关的请求头
+    签名内容与服务器端 assets/agent_auth.py 中的 string_to_sign 保持一致:
+    请求方法、路径、时间戳、随机数、SN和请求体的 sha256, 用换行符连接后做 HMAC-SHA256,
+    服务器按请求头 X-CMDB-SN 限流, 并检查它与汇报数据中的SN一致
+    """
+    if not secret:
+        raise ValueError('没有配置签名密钥, 请设置环境变量 CMDB_REPORT_SECRET')
+    timestamp = str(int(time.time()))
+    nonce = uuid.uuid4().hex
+    content = '\n'.join([
+        method.upper(), path, timestamp, nonce, sn,
+        hashlib.sha256(body).hexdigest()
+    ]).encode()
+    signature = hmac.new(secret.encode(), content, hashlib.sha256).hexdigest()
+    return {
+        'X-CMDB-SN': sn,
+        'X-CMDB-Key-Id': key_id,
+        'X-CMDB-Timestamp': timestamp,
+        'X-CMDB-Nonce': nonce,
+        'X-CMDB-Signature': signature,
+    }
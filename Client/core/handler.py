@@ -1,7 +1,9 @@
 import json
 import time
+import urllib.error
 import urllib.parse
 import urllib.request
+from . import auth
 from . import info_collection
 from conf import settings
 
@@ -31,7 +33,9 @@ class ArgvHandler(object):
         mag = '''
         参数名           功能
         collect_data    测试收集硬件信息的功能
-        report_data     收集硬件信息并汇报
+        report_data     到了服务器指定的汇报时间时, 收集硬件信息并汇报
+        force_report    立即收集硬件信息并汇报
+        report_loop     常驻运行, 按服务器指定的间隔循环汇报
         '''
         print(mag)
 
@@ -42,10 +46,31 @@ class ArgvHandler(object):
         asset_data = info.collect()
         print(asset_data)
 
-    @staticmethod
-    def report_data():
+    @classmethod
+    def report_data(cls):
+        """
+        按服务器下发的间隔汇报: 还没有到下一次汇报时间时直接跳过,
+        所以 cron 可以配置得比较频繁(例如每10分钟), 实际的汇报频率由服务器决定
+        :return:
+        """
+        next_report_at = cls.read_next_report_at()
+        if time.time() < next_report_at:
+            print('还未到汇报时间, 下一次汇报: %s' % time.strftime(
+                '%Y-%m-%d %H:%M:%S', time.localtime(next_report_at)))
+            return
+        cls.force_report()
+
+    @classmethod
+    def report_loop(cls):
+        """ 常驻运行, 每次汇报之后按服务器下发的间隔休眠 """
+        while True:
+            interval = cls.force_report()
+            time.sleep(interval)
+
+    @classmethod
+    def force_report(cls):
         """
-        收集硬件信息, 然后发送到服务器
+        收集硬件信息, 然后发送到服务器, 返回距离下一次汇报的秒数
         :return:
         """
         # 收集信息
@@ -57,20 +82,62 @@ class ArgvHandler(object):
         url = "http://%s:%s%s" % (settings.Params['server'],
                                   settings.Params['port'], settings.Params['url'])
         print('正在将数据发送至: [%s].........' % url)
+        interval = settings.Params['default_interval']
         try:
             # 使用Python内置的urllib.request库, 发送post请求
             # 需要先将数据进行封装, 并转换为bytes类型
             data_encode = urllib.parse.urlencode(data).encode()
+            # 使用时间戳和随机数对请求签名, 服务器验证失败时返回 401
+            # SN 放在请求头 X-CMDB-SN 中一起签名, 服务器根据它做限流, 不需要先解析数据
+            headers = auth.sign_headers(
+                settings.Params['key_id'], settings.Params['secret'], 'POST',
+                settings.Params['url'], asset_data.get('sn') or '', data_encode)
+            request = urllib.request.Request(
+                url=url, data=data_encode, headers=headers)
             respose = urllib.request.urlopen(
-                url=url, data=data_encode, timeout=settings.Params['request_timeout'])
+                request, timeout=settings.Params['request_timeout'])
             print("\033[31;1m发送完毕！\033[0m ")
             message = respose.read().decode()
             print('返回结果: %s' % message)
+            interval = cls.parse_interval(message, interval)
+        except urllib.error.HTTPError as e:
+            # 服务器繁忙时返回 429, 按 Retry-After 推迟
+            message = '发送失败' + '错误原因:   {}'.format(e)
+            print("\033[31;1m发送失败，错误原因： %s\033[0m" % e)
+            if e.headers.get('Retry-After', '').isdigit():
+                interval = int(e.headers['Retry-After'])
         except Exception as e:
             message = '发送失败' + '错误原因:   {}'.format(e)
             print("\033[31;1m发送失败，错误原因： %s\033[0m" % e)
+        cls.write_next_report_at(time.time() + interval)
+        print('下一次汇报在 %d 秒之后' % interval)
         with open(settings.PATH, 'ab') as f:  # 以byte的方式写入, 防止出现编码错误
             log = '发送时间: %s \t 服务器地址: %s \t 返回结果: %s \n' % (
                 time.strftime('%Y-%m-%d %H:%M:%S'), url, message)
             f.write(log.encode())
             print('日志记录成功!')
+        return interval
+
+    @staticmethod
+    def parse_interval(message, default):
+        """ 从服务器返回的 JSON 中取出下一次汇报的间隔, 旧版本服务器返回纯文本时使用默认间隔 """
+        try:
+            interval = json.loads(message).get('next_report_in')
+        except (ValueError, AttributeError):
+            return default
+        if isinstance(interval, int) and interval > 0:
+            return interval
+        return default
+
+    @staticmethod
+    def read_next_report_at():
+        try:
+            with open(settings.STATE_PATH) as f:
+                return float(f.read().strip() or 0)
+        except (IOError, ValueError):
+            return 0
+
+    @staticmethod
+    def write_next_report_at(timestamp):
+        with open(settings.STATE_PATH, 'w') as f:
+            f.write(str(timestamp))
@@ -27,5 +27,6 @@ class InfoCollection(object):
     @staticmethod
     def build_report_data(data):
         # 留下一个接口, 方便以后增加功能或者过滤数据
-        pass
+        # 声明数据格式版本, 服务器按对应版本校验, 参见 assets/report_schema.py
+        data['schema_version'] = 1
         return data
@@ -0,0 +1,174 @@
+"""
+ASGI config for DjangoCMDB project.
+
+Django 2.2 本身不支持 ASGI，这里是一个不依赖第三方库的最小 ASGI 应用:
+请求体在事件循环中异步读完之后，连同已经读完的请求体一起交给线程池中的 WSGI 处理器，
+所有请求（包括汇报接口）都经过完整的中间件链和视图装饰器，签名验证等工作也都在线程池中执行；
+慢速客户端上传数据期间不占用任何线程，响应体按 WSGI 处理器返回的分段逐段发送。
+
+部署:
+    uvicorn DjangoCMDB.asgi:application --workers 4
+"""
+
+import asyncio
+import io
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'DjangoCMDB.settings')
+django.setup(set_prefix=False)
+
+from django.conf import settings  # noqa: E402
+from django.core.handlers.wsgi import WSGIHandler  # noqa: E402
+
+
+class RequestTooLarge(Exception):
+    pass
+
+
+class ClientDisconnected(Exception):
+    pass
+
+
+class ASGIApplication(object):
+    """ ASGI 3 应用
+    WSGI 处理器在一个大小为 ASGI_THREADS 的线程池中执行，线程数即同时处理的请求数上限。
+    """
+
+    def __init__(self):
+        self.wsgi = WSGIHandler()
+        self.executor = ThreadPoolExecutor(getattr(settings, 'ASGI_THREADS',
+                                                   16))
+        self.max_body_size = getattr(settings, 'ASGI_MAX_BODY_SIZE',
+                                     10 * 1024 * 1024)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+        if scope['type'] != 'http':
+            raise ValueError('不支持的连接类型: %s' % scope['type'])
+        try:
+            body = await self.read_body(receive)
+        except RequestTooLarge:
+            return await self.send_response(send, 413, [],
+                                            b'Request Entity Too Large')
+        except ClientDisconnected:
+            # 客户端在上传完成之前断开，没有占用过线程，直接丢弃
+            return
+        environ = self.build_environ(scope, body)
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(self.executor, self.call_wsgi, environ,
+                                   send, loop)
+
+    @staticmethod
+    async def lifespan(receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def read_body(self, receive):
+        """ 异步读取完整的请求体，超过 ASGI_MAX_BODY_SIZE 时停止读取 """
+        chunks = []
+        size = 0
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                raise ClientDisconnected()
+            chunk = message.get('body', b'')
+            size += len(chunk)
+            if size > self.max_body_size:
+                raise RequestTooLarge()
+            chunks.append(chunk)
+            if not message.get('more_body', False):
+                break
+        return b''.join(chunks)
+
+    @staticmethod
+    def build_environ(scope, body):
+        """ 把 ASGI 的 scope 转换成 WSGI 的 environ，请求体已经在内存中 """
+        server = scope.get('server') or ('localhost', 80)
+        client = scope.get('client') or ('', 0)
+        environ = {
+            'REQUEST_METHOD': scope['method'],
+            'SCRIPT_NAME': scope.get('root_path', ''),
+            # WSGI 规定 environ 中的字符串按 latin1 解码
+            'PATH_INFO': scope['path'].encode('utf-8').decode('latin1'),
+            'QUERY_STRING': scope.get('query_string', b'').decode('latin1'),
+            'SERVER_NAME': str(server[0]),
+            'SERVER_PORT': str(server[1]),
+            'SERVER_PROTOCOL': 'HTTP/%s' % scope.get('http_version', '1.1'),
+            'REMOTE_ADDR': client[0],
+            'REMOTE_PORT': str(client[1]),
+            'CONTENT_LENGTH': str(len(body)),
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': scope.get('scheme', 'http'),
+            'wsgi.input': io.BytesIO(body),
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': True,
+            'wsgi.run_once': False,
+        }
+        for name, value in scope.get('headers', []):
+            name = name.decode('latin1').upper().replace('-', '_')
+            value = value.decode('latin1')
+            if name == 'CONTENT_LENGTH':
+                continue
+            if name != 'CONTENT_TYPE':
+                name = 'HTTP_' + name
+            if name in environ:
+                value = environ[name] + ',' + value
+            environ[name] = value
+        return environ
+
+    def call_wsgi(self, environ, send, loop):
+        """ 在线程池中执行 WSGI 处理器，响应头和每一段响应体都交回事件循环发送 """
+
+        def emit(message):
+            asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+        result = {}
+
+        def start_response(status, headers, exc_info=None):
+            result['status'] = int(status.split(' ', 1)[0])
+            # Django 生成的 Set-Cookie 值带有前导空格，ASGI 服务器会拒绝
+            result['headers'] = [(key.encode('latin1'),
+                                  value.strip().encode('latin1'))
+                                 for key, value in headers]
+
+        response = self.wsgi(environ, start_response)
+        try:
+            emit({
+                'type': 'http.response.start',
+                'status': result['status'],
+                'headers': result['headers'],
+            })
+            for chunk in response:
+                if chunk:
+                    emit({
+                        'type': 'http.response.body',
+                        'body': chunk,
+                        'more_body': True
+                    })
+            emit({'type': 'http.response.body', 'body': b''})
+        finally:
+            if hasattr(response, 'close'):
+                response.close()
+
+    @staticmethod
+    async def send_response(send, status, headers, content):
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': headers,
+        })
+        await send({'type': 'http.response.body', 'body': content})
+
+
+application = ASGIApplication()
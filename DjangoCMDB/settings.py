@@ -12,6 +12,8 @@ https://docs.djangoproject.com/en/2.2/ref/settings/
 
 import os
 
+from django.core.exceptions import ImproperlyConfigured
+
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
@@ -23,7 +25,8 @@ BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 SECRET_KEY = 't&l13@!gmf%4ai!#_h($u%&_e%y!=(q47wxt#p(r53o7-c*(6('
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+# 压测时设置 CMDB_DEBUG=0, DEBUG 模式下 Django 会在内存中记录每一条 SQL
+DEBUG = os.environ.get('CMDB_DEBUG', '1') == '1'
 
 ALLOWED_HOSTS = ["*"]
 
@@ -48,6 +51,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'assets.db_router.PrimaryPinningMiddleware',
 ]
 
 ROOT_URLCONF = 'DjangoCMDB.urls'
@@ -70,20 +74,146 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'DjangoCMDB.wsgi.application'
 
+# ASGI 部署(DjangoCMDB/asgi.py)中处理请求的线程数和请求体大小上限
+ASGI_THREADS = int(os.environ.get('CMDB_ASGI_THREADS', 16))
+ASGI_MAX_BODY_SIZE = 10 * 1024 * 1024
+
 
 # Database
 # https://docs.djangoproject.com/en/2.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.mysql', # 配置为mysql数据库
-        'NAME': 'djangocmdb', # 数据库名称, 数据库需要自己提前建好, django不会自动创建
-        'USER': 'root', # 数据库用户名
-        'PASSWORD': '123456', # 数据库密码
-        'HOST': '192.168.0.159', # 数据库主机IP地址, 留空为localhost
-        'PORT': '3306', # 数据库端口
+# 数据库配置全部来自环境变量, CMDB_DB_PROFILE 选择配置方案:
+#   mysql   生产环境, 持久连接 + 连接健康检查, 必须设置 CMDB_DB_NAME/USER/PASSWORD/HOST
+#   sqlite  本地开发和压测, 开启 WAL 模式, 任何 Linux 机器上都能直接跑起来
+# 没有设置 CMDB_DB_PROFILE 时, 配置了 CMDB_DB_HOST 就使用 mysql, 否则使用 sqlite
+DB_PROFILE = os.environ.get(
+    'CMDB_DB_PROFILE', 'mysql' if os.environ.get('CMDB_DB_HOST') else 'sqlite')
+
+# 持久连接的最长保持时间(秒), 避免每次汇报都重新建立 MySQL 连接; 0 表示每个请求结束后关闭
+CONN_MAX_AGE = int(os.environ.get('CMDB_DB_CONN_MAX_AGE', 600))
+# 每个请求开始时检查持久连接是否可用, 不可用的连接(数据库重启、wait_timeout 过期)直接关闭并重连
+CMDB_DB_HEALTH_CHECKS = os.environ.get('CMDB_DB_HEALTH_CHECKS', '1') == '1'
+
+if DB_PROFILE == 'sqlite':
+    # SQLite 连接建立时执行的 PRAGMA, 见 assets/db_connection.py
+    # WAL 让读写互不阻塞, synchronous=NORMAL 在 WAL 模式下不会损坏数据, 只是掉电时可能丢失最后几个事务
+    SQLITE_PRAGMAS = {
+        'journal_mode': os.environ.get('CMDB_SQLITE_JOURNAL_MODE', 'WAL'),
+        'synchronous': os.environ.get('CMDB_SQLITE_SYNCHRONOUS', 'NORMAL'),
+        'busy_timeout': int(os.environ.get('CMDB_SQLITE_BUSY_TIMEOUT', 30000)),
+        'cache_size': -64000,  # 64MB 页缓存
+        'temp_store': 'MEMORY',
     }
-}
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('CMDB_SQLITE_PATH',
+                                   os.path.join(BASE_DIR, 'db.sqlite3')),
+            'CONN_MAX_AGE': CONN_MAX_AGE,
+            'OPTIONS': {
+                # 等待写锁的秒数, 并发压测时避免 database is locked
+                'timeout': SQLITE_PRAGMAS['busy_timeout'] / 1000,
+            },
+        }
+    }
+    # 本地测试读写分离: 设置环境变量 CMDB_SQLITE_REPLICA=1, 再用一个 SQLite 数据库模拟从库
+    # 两个库都需要 migrate: python manage.py migrate && python manage.py migrate --database=replica
+    if os.environ.get('CMDB_SQLITE_REPLICA'):
+        DATABASES['replica'] = dict(
+            DATABASES['default'],
+            NAME=os.environ.get('CMDB_SQLITE_REPLICA_PATH',
+                                os.path.join(BASE_DIR, 'replica.sqlite3')),
+            TEST={'MIRROR': 'default'})
+elif DB_PROFILE == 'mysql':
+    # 连接参数没有默认值, 缺少时直接报错, 不会用一组猜测的账号去连接
+    _missing = [
+        name for name in ('CMDB_DB_NAME', 'CMDB_DB_USER', 'CMDB_DB_PASSWORD',
+                          'CMDB_DB_HOST') if name not in os.environ
+    ]
+    if _missing:
+        raise ImproperlyConfigured('mysql 配置方案缺少环境变量: %s' %
+                                   ', '.join(_missing))
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.mysql', # 配置为mysql数据库
+            'NAME': os.environ['CMDB_DB_NAME'], # 数据库名称, 数据库需要自己提前建好, django不会自动创建
+            'USER': os.environ['CMDB_DB_USER'], # 数据库用户名
+            'PASSWORD': os.environ['CMDB_DB_PASSWORD'], # 数据库密码
+            'HOST': os.environ['CMDB_DB_HOST'], # 数据库主机IP地址
+            'PORT': os.environ.get('CMDB_DB_PORT', '3306'), # 数据库端口
+            'CONN_MAX_AGE': CONN_MAX_AGE,
+            'OPTIONS': {
+                'charset': 'utf8mb4',
+                'connect_timeout': 5,
+                'init_command': "SET sql_mode='STRICT_TRANS_TABLES'",
+            },
+        }
+    }
+    # 从库只需要配置主机, 其余连接参数与主库相同
+    if os.environ.get('CMDB_DB_REPLICA_HOST'):
+        DATABASES['replica'] = dict(
+            DATABASES['default'],
+            HOST=os.environ['CMDB_DB_REPLICA_HOST'],
+            PORT=os.environ.get('CMDB_DB_REPLICA_PORT',
+                                DATABASES['default']['PORT']),
+            TEST={'MIRROR': 'default'})
+else:
+    raise ImproperlyConfigured('未知的 CMDB_DB_PROFILE: %s' % DB_PROFILE)
+
+# 读写分离: 写操作和写之后的读操作走 default, 其余读操作分散到从库
+# 从库别名需要同时出现在 DATABASES 中才会生效, 否则全部走 default
+DATABASE_ROUTERS = ['assets.db_router.PrimaryReplicaRouter']
+DATABASE_REPLICAS = ['replica']
+# 这些路径下的请求始终读写主库(后台管理读出来的数据马上要被编辑)
+DATABASE_PRIMARY_PATHS = ['/admin/', '/assets/report/']
+
+
+# Cache
+# https://docs.djangoproject.com/en/2.2/topics/cache/
+# 资产详情和统计、授权计数、厂商字典的版本号以及汇报签名的 nonce 都放在缓存中, 必须在所有工作进程之间共享,
+# 否则其他进程看不到版本号的变化, 会一直返回旧数据. CMDB_CACHE_PROFILE 选择配置方案:
+#   file       默认, 同一台机器上的全部进程共享, 目录为 CMDB_CACHE_LOCATION
+#   memcached  多台机器部署时使用, 需要 pip install python-memcached, CMDB_CACHE_LOCATION 为 host:port, 多个用逗号分隔
+#   locmem     只在单个进程内有效, 只能用于单进程的开发服务器, manage.py check --deploy 会报错
+# 文件缓存的 add/incr 是先检查再写入, 不是原子操作; 版本号只整体替换, 不受影响, 授权计数可能在并发时少算一次,
+# 到 ASSET_CACHE_TIMEOUT 后从数据库重新统计. 需要精确计数时使用 memcached
+CACHE_PROFILE = os.environ.get('CMDB_CACHE_PROFILE', 'file')
+if CACHE_PROFILE == 'file':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.environ.get('CMDB_CACHE_LOCATION',
+                                       os.path.join(BASE_DIR, 'cache')),
+            'OPTIONS': {
+                # 文件缓存每次写入都会统计目录中的文件数, 条目不宜太多
+                'MAX_ENTRIES': 20000,
+            },
+        }
+    }
+elif CACHE_PROFILE == 'memcached':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache',
+            'LOCATION': os.environ.get('CMDB_CACHE_LOCATION',
+                                       '127.0.0.1:11211').split(','),
+        }
+    }
+elif CACHE_PROFILE == 'locmem':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'djangocmdb',
+            'OPTIONS': {
+                'MAX_ENTRIES': 100000,
+            },
+        }
+    }
+else:
+    raise ImproperlyConfigured('未知的 CMDB_CACHE_PROFILE: %s' % CACHE_PROFILE)
+
+# 资产缓存的过期时间(秒), 数据变化时通过版本号立即失效, 这里只是兜底
+ASSET_CACHE_TIMEOUT = 3600
+
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
 
@@ -108,7 +238,7 @@ AUTH_PASSWORD_VALIDATORS = [
 
 LANGUAGE_CODE = 'zh-hans'
 
-TIME_ZONE = 'Asia/shanghai'
+TIME_ZONE = 'Asia/Shanghai'
 
 USE_I18N = True
 
@@ -121,3 +251,50 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/2.2/howto/static-files/
 
 STATIC_URL = '/static/'
+
+
+# 事件日志保留天数和归档目录, 参见 python manage.py archive_eventlog
+EVENTLOG_RETENTION_DAYS = 90
+EVENTLOG_ARCHIVE_DIR = os.path.join(BASE_DIR, 'archive', 'eventlog')
+
+# 汇报接口的准入控制, 超限的请求在解析数据之前直接返回 429, 参见 assets/throttle.py
+# 多进程部署时 backend 改为 'cache', 并配合共享的缓存
+REPORT_ADMISSION = {
+    'ip_burst': 60,
+    'ip_rate': 1.0,
+    'sn_burst': 3,
+    'sn_rate': 1.0 / 300,
+    'max_concurrency': 16,
+    'backend': 'local',
+    # 部署在反向代理之后时, 来源IP从代理写入的 X-Forwarded-For 中读取, 只信任这里列出的代理地址
+    'ip_header': 'HTTP_X_FORWARDED_FOR',
+    'trusted_proxies': [
+        ip.strip()
+        for ip in os.environ.get('CMDB_TRUSTED_PROXIES', '').split(',')
+        if ip.strip()
+    ],
+}
+
+# 服务器下发给客户端的汇报间隔(秒), 参见 assets/report_schedule.py
+REPORT_INTERVAL = {
+    'base': 3600,
+    'min': 600,
+    'max': 86400,
+    'target_rate': 20.0,
+}
+
+# 客户端汇报的 HMAC 签名认证, 参见 assets/agent_auth.py
+# keys 为 {密钥ID: 密钥}, 轮换时先增加新密钥, 客户端全部切换后再删除旧密钥
+# 密钥只能通过 CMDB_REPORT_KEYS 环境变量配置, 格式: id1:secret1,id2:secret2
+# 没有配置密钥时所有汇报都会被拒绝, 不提供默认密钥
+REPORT_AUTH = {
+    'required': True,
+    'max_skew': 300,
+    'keys': dict(
+        item.split(':', 1)
+        for item in os.environ.get('CMDB_REPORT_KEYS', '').split(',')
+        if ':' in item),
+}
+
+# 资产最近汇报时间(Asset.last_seen)的写库周期(秒), 参见 assets/heartbeat.py 和 python manage.py stale_assets
+HEARTBEAT_FLUSH_INTERVAL = 60
@@ -1,7 +1,10 @@
-from django.contrib import admin
+from django.contrib import admin, messages
+from django.db import IntegrityError
 
 # Register your models here.
+from assets import asset_handler
 from assets import models
+from assets.paginator import EstimatedCountPaginator
 
 
 class NewAssetAdmin(admin.ModelAdmin):
@@ -10,28 +13,133 @@ class NewAssetAdmin(admin.ModelAdmin):
     ]
     list_filter = ['asset_type', 'manufacturer', 'c_time']
     search_fields = ['sn']
+    actions = ['approve_selected_new_assets']
 
+    def get_queryset(self, request):
+        # 后台页面都不展示压缩的汇报数据，避免每行都读出并解压
+        return super().get_queryset(request).defer('compressed_data')
 
-class AssetAdmin(admin.ModelAdmin):
+    def approve_selected_new_assets(self, request, queryset):
+        """ 批准选中的资产上线，每个资产在单独的事务中处理，一个失败不影响其他资产 """
+        approved, failed = [], []
+        # 上线需要完整的汇报数据，一条查询连同压缩数据一起读出
+        for zone in queryset.defer(None):
+            try:
+                asset = asset_handler.ApproveAsset(request, zone).approve()
+            except IntegrityError:
+                asset = None
+            (approved if asset is not None else failed).append(zone.sn)
+        if approved:
+            self.message_user(request, '%d 个资产已上线' % len(approved))
+        if failed:
+            self.message_user(request,
+                              '以下资产没有上线(名称或SN重复、类型不支持): %s' %
+                              ', '.join(failed),
+                              level=messages.WARNING)
+
+    approve_selected_new_assets.short_description = '批准选中的资产上线'
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """ 数据量很大的表共用的后台配置
+    使用估算行数的分页器，并且不再额外统计全表总数；
+    外键字段使用 raw_id 或 autocomplete 部件，避免把整张资产表渲染成下拉框。
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+
+class AssetAdmin(LargeTableAdmin):
     list_display = [
-        'asset_type', 'name', 'status', 'approved_by', 'c_time', 'm_time'
+        'asset_type', 'name', 'status', 'approved_by', 'last_seen', 'c_time',
+        'm_time'
     ]
+    # 列表页一次性 join 出批准人，不再逐行查询
+    list_select_related = ['approved_by']
+    # 过滤和搜索都只使用有索引的字段
+    list_filter = ['asset_type', 'status', 'idc', 'business_unit']
+    search_fields = ['=sn', '^name']
+    raw_id_fields = ['admin', 'approved_by', 'contract']
+
+
+class ServerAdmin(LargeTableAdmin):
+    list_display = ['asset', 'sub_asset_type', 'model', 'hosted_on']
+    list_select_related = ['asset', 'hosted_on__asset']
+    list_filter = ['sub_asset_type', 'created_by']
+    search_fields = ['=asset__sn', '^asset__name']
+    raw_id_fields = ['asset', 'hosted_on']
+
+
+class BusinessUnitAdmin(admin.ModelAdmin):
+    list_display = ['name', 'parent_unit', 'depth', 'path']
+    list_select_related = ['parent_unit']
+    search_fields = ['^name']
+    ordering = ['path']
+
+
+class ManufacturerAliasInline(admin.TabularInline):
+    model = models.ManufacturerAlias
+    extra = 1
+
+
+class ManufacturerAdmin(admin.ModelAdmin):
+    list_display = ['name', 'telephone', 'memo']
+    search_fields = ['^name']
+    inlines = [ManufacturerAliasInline]
+
+
+class ManufacturerAliasAdmin(admin.ModelAdmin):
+    list_display = ['name', 'key', 'manufacturer']
+    list_select_related = ['manufacturer']
+    search_fields = ['^name', '^key']
+
+
+class EventLogAdmin(LargeTableAdmin):
+    list_display = ['name', 'event_type', 'asset', 'component', 'date']
+    list_select_related = ['asset']
+    list_filter = ['event_type', 'date']
+    raw_id_fields = ['asset', 'user']
+
+
+class ComponentAdmin(LargeTableAdmin):
+    """ 内存、硬盘、网卡和CPU等组件的公共后台配置 """
+    list_select_related = ['asset']
+    search_fields = ['=asset__sn', '^asset__name']
+    autocomplete_fields = ['asset']
+
+
+class CPUAdmin(ComponentAdmin):
+    list_display = ['asset', 'cpu_model', 'cpu_count', 'cpu_core_count']
+
+
+class RAMAdmin(ComponentAdmin):
+    list_display = ['asset', 'slot', 'model', 'capacity']
+
+
+class DiskAdmin(ComponentAdmin):
+    list_display = ['asset', 'slot', 'sn', 'model', 'capacity', 'interface_type']
+    list_filter = ['interface_type']
+
+
+class NICAdmin(ComponentAdmin):
+    list_display = ['asset', 'name', 'model', 'mac', 'id_address']
 
 
 admin.site.register(models.Asset, AssetAdmin)
-admin.site.register(models.Server)
+admin.site.register(models.Server, ServerAdmin)
 admin.site.register(models.StorageDevice)
 admin.site.register(models.SecurityDevice)
-admin.site.register(models.BusinessUnit)
+admin.site.register(models.BusinessUnit, BusinessUnitAdmin)
 admin.site.register(models.Contract)
-admin.site.register(models.CPU)
-admin.site.register(models.Disk)
-admin.site.register(models.EventLog)
+admin.site.register(models.CPU, CPUAdmin)
+admin.site.register(models.Disk, DiskAdmin)
+admin.site.register(models.EventLog, EventLogAdmin)
 admin.site.register(models.IDC)
-admin.site.register(models.Manufacturer)
+admin.site.register(models.Manufacturer, ManufacturerAdmin)
+admin.site.register(models.ManufacturerAlias, ManufacturerAliasAdmin)
 admin.site.register(models.NetworkDevice)
-admin.site.register(models.NIC)
-admin.site.register(models.RAM)
+admin.site.register(models.NIC, NICAdmin)
+admin.site.register(models.RAM, RAMAdmin)
 admin.site.register(models.Software)
 admin.site.register(models.Tag)
 admin.site.register(models.NewAssetApprovalZone, NewAssetAdmin)
@@ -0,0 +1,117 @@
+import hashlib
+import hmac
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.http import HttpResponse
+
+DEFAULTS = {
+    'required': True,
+    # 允许的客户端与服务器时间偏差(秒)，超出的请求直接拒绝，因此 nonce 只需要保存两倍的时间
+    'max_skew': 300,
+    # {key_id: secret}，轮换密钥时新旧密钥同时配置，客户端全部切换后再删除旧密钥
+    'keys': {},
+    # 保存已使用 nonce 的缓存，多进程部署时需要共享的缓存才能跨进程防重放
+    'cache_alias': 'default',
+}
+
+
+def get_config():
+    config = dict(DEFAULTS)
+    config.update(getattr(settings, 'REPORT_AUTH', {}))
+    return config
+
+
+class KeyRing(object):
+    """ 内存中的密钥环，进程内只从配置加载一次，之后验证签名不再读取配置、数据库或 session """
+
+    def __init__(self, config=None):
+        self.config = config or get_config()
+        self.keys = {
+            key_id: secret.encode() if isinstance(secret, str) else secret
+            for key_id, secret in self.config['keys'].items()
+        }
+        self.nonces = caches[self.config['cache_alias']]
+
+    def verify(self, request):
+        """ 验证请求签名，成功返回 None，失败返回错误说明
+        只使用请求头和原始请求体计算 HMAC，不解析请求体。
+        """
+        # 没有配置任何密钥时拒绝所有请求，不能因为漏配密钥而放行
+        if not self.keys:
+            return '服务器没有配置密钥'
+        meta = request.META
+        key_id = meta.get('HTTP_X_CMDB_KEY_ID', '')
+        timestamp = meta.get('HTTP_X_CMDB_TIMESTAMP', '')
+        nonce = meta.get('HTTP_X_CMDB_NONCE', '')
+        signature = meta.get('HTTP_X_CMDB_SIGNATURE', '')
+        if not (key_id and timestamp and nonce and signature):
+            return '缺少签名'
+        secret = self.keys.get(key_id)
+        if secret is None:
+            return '未知的密钥'
+        try:
+            skew = abs(time.time() - float(timestamp))
+        except ValueError:
+            return '时间戳格式错误'
+        if skew > self.config['max_skew']:
+            return '时间戳已过期'
+        expected = sign(secret, request.method, request.path, timestamp,
+                        nonce, meta.get('HTTP_X_CMDB_SN', ''), request.body)
+        if not hmac.compare_digest(expected, signature):
+            return '签名错误'
+        # 签名正确之后才记录 nonce，避免伪造的请求占满缓存；超出时间窗口的请求已经被拒绝，nonce 不必保存更久
+        if not self.nonces.add('cmdb:nonce:%s:%s' % (key_id, nonce), 1,
+                               self.config['max_skew'] * 2):
+            return '重复的请求'
+        return None
+
+
+_state = {}
+
+
+def get_key_ring():
+    if 'key_ring' not in _state:
+        _state['key_ring'] = KeyRing()
+    return _state['key_ring']
+
+
+@receiver(setting_changed)
+def reload_key_ring(setting, **kwargs):
+    if setting == 'REPORT_AUTH':
+        _state.clear()
+
+
+def string_to_sign(method, path, timestamp, nonce, sn, body):
+    """ 参与签名的内容，客户端 Client/core/auth.py 中必须使用完全相同的拼接方式
+    sn 是请求头 X-CMDB-SN 的值，准入控制按它限流，因此也要参与签名
+    """
+    return '\n'.join([
+        method.upper(), path, timestamp, nonce, sn,
+        hashlib.sha256(body).hexdigest()
+    ]).encode()
+
+
+def sign(secret, method, path, timestamp, nonce, sn, body):
+    return hmac.new(secret,
+                    string_to_sign(method, path, timestamp, nonce, sn, body),
+                    hashlib.sha256).hexdigest()
+
+
+def signature_required(view):
+    """ 视图装饰器：没有签名或签名错误的请求直接返回 401 """
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        key_ring = get_key_ring()
+        if request.method == 'POST' and key_ring.config['required']:
+            error = key_ring.verify(request)
+            if error:
+                return HttpResponse('认证失败: %s' % error, status=401)
+        return view(request, *args, **kwargs)
+
+    return wrapper
@@ -3,3 +3,9 @@ from django.apps import AppConfig
 
 class AssetsConfig(AppConfig):
     name = 'assets'
+
+    def ready(self):
+        # 注册信号处理函数和系统检查
+        from . import checks  # noqa: F401
+        from . import db_connection  # noqa: F401
+        from . import signals  # noqa: F401
@@ -0,0 +1,141 @@
+import random
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count
+from django.forms.models import model_to_dict
+from . import db_router
+from . import models
+
+# 缓存键中都带有版本号，数据写入时只需要把版本号加一，旧的缓存自然失效，无需逐个删除
+ASSET_VERSION_KEY = 'cmdb:asset:ver:%s'
+LIST_VERSION_KEY = 'cmdb:asset:list:ver'
+ASSET_DETAIL_KEY = 'cmdb:asset:detail:%s:%s'
+ASSET_SUMMARY_KEY = 'cmdb:asset:summary:%s'
+
+COMPONENT_FIELDS = {
+    'cpu': ('cpu_model', 'cpu_count', 'cpu_core_count', 'cpu_thread_count',
+            'cpu_frequency'),
+    'ram': ('slot', 'sn', 'model', 'manufacturer', 'capacity', 'frequency'),
+    'disk': ('slot', 'sn', 'model', 'manufacturer', 'capacity',
+             'interface_type', 'disk_protocol'),
+    'nic': ('name', 'model', 'mac', 'id_address', 'net_mask', 'bonding',
+            'manufacturer'),
+}
+
+
+def get_timeout():
+    return getattr(settings, 'ASSET_CACHE_TIMEOUT', 3600)
+
+
+def _new_version():
+    """ 新的版本号: 当前时间（毫秒）加上随机数，每次都是没有用过的值，
+    即使版本号本身被缓存淘汰后重建，也不会与旧的数据键重复
+    """
+    return '%d.%08x' % (time.time() * 1000, random.getrandbits(32))
+
+
+def get_version(key):
+    version = cache.get(key)
+    if version is None:
+        version = _new_version()
+        # add 不会覆盖其他进程刚写入的版本号；文件缓存的 add 不是原子操作，两个进程同时初始化时以后写入的为准，
+        # 先写入的版本号下缓存的数据不会再被读到，不影响正确性
+        if not cache.add(key, version, None):
+            version = cache.get(key, version)
+    return version
+
+
+def bump_version(key):
+    """ 换成一个新的版本号
+    不使用 incr: 文件缓存的 incr 是先读后写，并发的两次自增可能只生效一次，读到中间版本号的请求
+    会把写入之前的数据缓存在最终的版本号下。每次写入一个没有用过的值，set 在各种缓存后端上都是整体替换，
+    最后写入的版本号下不会有它之前的数据。
+    """
+    cache.set(key, _new_version(), None)
+
+
+def get_asset_version(asset_id):
+    return get_version(ASSET_VERSION_KEY % asset_id)
+
+
+def bump_asset_versions(asset_ids):
+    """ 让资产的缓存失效：每个资产只是一次版本号自增，同时让列表和统计缓存失效
+    在事务中调用时，等事务提交之后再自增，避免其他请求在提交前读到旧数据并写入新版本的缓存。
+    """
+    asset_ids = [asset_id for asset_id in set(asset_ids) if asset_id]
+
+    def bump():
+        for asset_id in asset_ids:
+            bump_version(ASSET_VERSION_KEY % asset_id)
+        bump_version(LIST_VERSION_KEY)
+
+    transaction.on_commit(bump)
+
+
+def get_asset_detail(asset_id):
+    """ 资产详情，包括服务器信息和全部组件，缓存未命中时用固定条数的查询构造
+    缓存未命中时从主库读取: 写入之后版本号立即自增，这时从库可能还没有同步，
+    从从库读到的旧数据会以新版本号缓存下来，直到超时都不会更新。
+    """
+    key = ASSET_DETAIL_KEY % (asset_id, get_asset_version(asset_id))
+    detail = cache.get(key)
+    if detail is None:
+        detail = build_asset_detail(asset_id)
+        if detail is not None:
+            cache.set(key, detail, get_timeout())
+    return detail
+
+
+def build_asset_detail(asset_id, using=db_router.PRIMARY):
+    assets = models.Asset.objects.using(using).select_related(
+        'server', 'manufacturer', 'idc', 'business_unit')
+    asset = assets.filter(pk=asset_id).first()
+    if asset is None:
+        return None
+    detail = model_to_dict(asset, exclude=['tags'])
+    detail['manufacturer'] = str(asset.manufacturer or '')
+    detail['idc'] = str(asset.idc or '')
+    detail['business_unit'] = str(asset.business_unit or '')
+    server = getattr(asset, 'server', None)
+    detail['server'] = model_to_dict(server) if server else None
+    detail['cpu'] = list(
+        models.CPU.objects.using(using).filter(asset_id=asset_id).values(
+            *COMPONENT_FIELDS['cpu']))
+    detail['ram'] = list(
+        models.RAM.objects.using(using).filter(asset_id=asset_id).values(
+            *COMPONENT_FIELDS['ram']))
+    detail['disk'] = list(
+        models.Disk.objects.using(using).filter(asset_id=asset_id).values(
+            *COMPONENT_FIELDS['disk']))
+    detail['nic'] = list(
+        models.NIC.objects.using(using).filter(asset_id=asset_id).values(
+            *COMPONENT_FIELDS['nic']))
+    return detail
+
+
+def get_asset_summary():
+    """ 按资产类型和状态统计的资产数量，任何资产写入都会让它失效，和资产详情一样从主库重建 """
+    key = ASSET_SUMMARY_KEY % get_version(LIST_VERSION_KEY)
+    summary = cache.get(key)
+    if summary is None:
+        summary = build_asset_summary()
+        cache.set(key, summary, get_timeout())
+    return summary
+
+
+def build_asset_summary(using=db_router.PRIMARY):
+    rows = models.Asset.objects.using(using).order_by().values(
+        'asset_type', 'status').annotate(count=Count('id'))
+    summary = {'total': 0, 'by_type': {}, 'by_status': {}}
+    for row in rows:
+        summary['total'] += row['count']
+        by_type = summary['by_type']
+        by_type[row['asset_type']] = by_type.get(row['asset_type'],
+                                                 0) + row['count']
+        by_status = summary['by_status']
+        by_status[row['status']] = by_status.get(row['status'],
+                                                 0) + row['count']
+    return summary
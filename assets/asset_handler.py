@@ -1,5 +1,14 @@
+import hashlib
 import json
+from decimal import Decimal
+
+from django.db import transaction
+from . import asset_cache
+from . import event_log
 from . import models
+from . import report_schema
+from . import signals
+from . import vendors
 
 
 class NewAsset(object):
@@ -9,19 +18,347 @@ class NewAsset(object):
 
     def add_to_new_assets_zone(self):
         defaults = {
-            'data': json.dumps(self.data),
+            'data': '',
+            'compressed_data': self.data,
             'asset_type': self.data.get('asset_type'),
-            'manufacturer': self.data.get('manufacturer'),
-            'model': self.data.get('model'),
+            # 厂商按别名字典换成标准名称，型号合并多余的空白，审批时可以直接对应到厂商表
+            'manufacturer': vendors.resolver.canonical(
+                self.data.get('manufacturer')),
+            'model': vendors.clean_model(self.data.get('model')),
             'ram_size': self.data.get('ram_size'),
             'cpu_model': self.data.get('cpu_model'),
             'cpu_count': self.data.get('cpu_count'),
             'cpu_core_count': self.data.get('cpu_core_count'),
             'os_distribution': self.data.get('os_distribution'),
-            'os_release': self.data.get('os_release'),
+            # 版本 1 的汇报格式允许更长的系统版本，截断到字段长度
+            'os_release': _fit(models.NewAssetApprovalZone, 'os_release',
+                               self.data.get('os_release')),
             'os_type': self.data.get('os_type'),
         }
         models.NewAssetApprovalZone.objects.update_or_create(
             sn=self.data['sn'], defaults=defaults)
 
         return '资产已经加入或更新到待审批区!'
+
+
+def _fit(model, field, value):
+    """ 字符串截断到数据库字段的长度 """
+    if isinstance(value, str):
+        return value[:model._meta.get_field(field).max_length]
+    return value
+
+
+def _normalize(value):
+    """ 把数据库中的值和汇报数据中的值统一成字符串再计算摘要，避免 100 和 100.0、0 和 '0' 被当成变化 """
+    if isinstance(value, (list, tuple)):
+        value = value[0] if value else None
+    if value is None or value == '':
+        return ''
+    if isinstance(value, bool):
+        return str(value)
+    if isinstance(value, (int, float, Decimal)):
+        return '%.15g' % float(value)
+    return str(value).strip()
+
+
+class ComponentSpec(object):
+    """ 一类组件的比对规则
+    model: 组件模型；report_key: 汇报数据中的列表键；
+    key_fields: 自然键字段；fields: {模型字段: 汇报数据字段}，只比对汇报数据中有的字段
+    """
+
+    def __init__(self, name, model, report_key, key_fields, fields):
+        self.name = name
+        self.model = model
+        self.report_key = report_key
+        self.key_fields = key_fields
+        self.fields = fields
+
+    def report_items(self, data, warnings=None):
+        """ 汇报数据中的组件，返回 {自然键: {模型字段: 规范化后的值}}
+        自然键全部为空的组件无法与数据库中的记录对应（例如没有SN的虚拟机硬盘），忽略并记录到 warnings 中
+        """
+        if self.report_key is None:
+            # CPU 的数据直接放在汇报数据的顶层
+            items = [data] if data.get('cpu_model') else []
+        else:
+            items = data.get(self.report_key) or []
+        result = {}
+        for index, item in enumerate(items):
+            values = {
+                field: _normalize(item.get(report_field))
+                for field, report_field in self.fields.items()
+            }
+            if self.key_fields and not any(values[field]
+                                           for field in self.key_fields):
+                if warnings is not None:
+                    warnings.append(
+                        report_schema.error(
+                            report_schema.IGNORED,
+                            '%s[%d].%s' % (self.report_key, index,
+                                           self.fields[self.key_fields[0]]),
+                            '缺少%s，已忽略' % '、'.join(self.key_fields)))
+                continue
+            result[self.natural_key(values)] = values
+        return result
+
+    def stored_items(self, asset_id):
+        """ 数据库中的组件，返回 {自然键: (id, {模型字段: 规范化后的值})} """
+        result = {}
+        for row in self.model.objects.filter(asset_id=asset_id).values(
+                'id', *self.fields):
+            values = {field: _normalize(row[field]) for field in self.fields}
+            result[self.natural_key(values)] = (row['id'], values)
+        return result
+
+    def natural_key(self, values):
+        return '/'.join(values[field] for field in self.key_fields)
+
+    @staticmethod
+    def digest(values):
+        raw = '\x1f'.join('%s=%s' % item for item in sorted(values.items()))
+        return hashlib.sha1(raw.encode()).hexdigest()
+
+
+COMPONENT_SPECS = (
+    ComponentSpec('CPU', models.CPU, None, (), {
+        'cpu_model': 'cpu_model',
+        'cpu_count': 'cpu_count',
+        'cpu_core_count': 'cpu_core_count',
+    }),
+    ComponentSpec('RAM', models.RAM, 'RAM', ('slot', ), {
+        'slot': 'slot',
+        'sn': 'sn',
+        'model': 'model',
+        'manufacturer': 'manufacturer',
+        'capacity': 'capacity',
+    }),
+    ComponentSpec('Disk', models.Disk, 'physical_disk_driver', ('sn', ), {
+        'sn': 'sn',
+        'slot': 'slot',
+        'model': 'model',
+        'manufacturer': 'manufacturer',
+        'capacity': 'capacity',
+        'interface_type': 'interface_type',
+    }),
+    ComponentSpec('NIC', models.NIC, 'nic', ('model', 'mac'), {
+        'name': 'name',
+        'model': 'model',
+        'mac': 'mac',
+        'id_address': 'ip_address',
+        'net_mask': 'net_mask',
+    }),
+)
+
+
+# 服务器的操作系统字段，变化时更新 Server 并增量调整授权统计
+OS_FIELDS = ('os_type', 'os_distribution', 'os_release')
+
+
+class UpdateAsset(object):
+    """ 已上线资产的数据更新
+    先对汇报数据中的每个组件按自然键计算内容摘要，再把所有摘要和操作系统字段合成整机摘要，与 Asset.component_hash 比较：
+    硬件没有变化时到此为止，不查询任何组件表；有变化时才读出已有组件逐个比对，
+    把新增、移除、修改的组件批量写回，并批量写入 "新增配件" 和 "硬件变更" 事件。
+    """
+
+    def __init__(self, request, asset_obj, data):
+        self.request = request
+        self.asset_obj = asset_obj
+        self.data = data
+        # 被忽略的组件，和校验错误的格式相同，随汇报结果返回给客户端
+        self.warnings = []
+
+    def update(self):
+        self.sync_manufacturer()
+        incoming = {
+            spec.name: spec.report_items(self.data, self.warnings)
+            for spec in COMPONENT_SPECS
+        }
+        # 只比对汇报数据中有的操作系统字段
+        os_values = {
+            field: _normalize(self.data.get(field))
+            for field in OS_FIELDS if self.data.get(field) is not None
+        }
+        incoming['OS'] = {'': os_values} if os_values else {}
+        component_hash = self.component_hash(incoming)
+        if component_hash == self.asset_obj.component_hash:
+            return '资产数据已经更新!'
+
+        user = getattr(self.request, 'user', None)
+        if user is not None and not user.is_authenticated:
+            user = None
+        with transaction.atomic(), signals.component_sync():
+            with event_log.EventLogWriter() as writer:
+                for spec in COMPONENT_SPECS:
+                    self.sync_component(spec, incoming[spec.name], writer,
+                                        user)
+                self.sync_os(os_values, writer, user)
+            models.Asset.objects.filter(pk=self.asset_obj.pk).update(
+                component_hash=component_hash)
+            # 批量写入不会触发信号，手动让缓存失效
+            asset_cache.bump_asset_versions([self.asset_obj.pk])
+        self.asset_obj.component_hash = component_hash
+        return '资产数据已经更新!'
+
+    @staticmethod
+    def component_hash(incoming):
+        parts = []
+        for name in sorted(incoming):
+            for key in sorted(incoming[name]):
+                parts.append('%s:%s:%s' % (name, key,
+                                           ComponentSpec.digest(
+                                               incoming[name][key])))
+        return hashlib.sha1('\n'.join(parts).encode()).hexdigest()
+
+    def sync_component(self, spec, incoming, writer, user):
+        stored = spec.stored_items(self.asset_obj.pk)
+        added = [key for key in incoming if key not in stored]
+        removed = [key for key in stored if key not in incoming]
+        modified = [
+            key for key in incoming if key in stored and
+            spec.digest(incoming[key]) != spec.digest(stored[key][1])
+        ]
+
+        if removed:
+            spec.model.objects.filter(
+                id__in=[stored[key][0] for key in removed]).delete()
+        if added:
+            spec.model.objects.bulk_create([
+                self.build_component(spec, incoming[key]) for key in added
+            ])
+        if modified:
+            objs = []
+            for key in modified:
+                obj = self.build_component(spec, incoming[key])
+                obj.id = stored[key][0]
+                objs.append(obj)
+            spec.model.objects.bulk_update(objs, list(spec.fields))
+
+        for key in added:
+            writer.add('新增配件',
+                       asset=self.asset_obj,
+                       event_type=2,
+                       component='%s %s' % (spec.name, key),
+                       detail=json.dumps(incoming[key], ensure_ascii=False),
+                       user=user)
+        for key in removed:
+            writer.add('硬件变更',
+                       asset=self.asset_obj,
+                       event_type=1,
+                       component='%s %s' % (spec.name, key),
+                       detail='移除: %s' %
+                       json.dumps(stored[key][1], ensure_ascii=False),
+                       user=user)
+        for key in modified:
+            old, new = stored[key][1], incoming[key]
+            changes = [
+                '%s: %s -> %s' % (field, old[field], new[field])
+                for field in spec.fields if old[field] != new[field]
+            ]
+            writer.add('硬件变更',
+                       asset=self.asset_obj,
+                       event_type=1,
+                       component='%s %s' % (spec.name, key),
+                       detail='; '.join(changes),
+                       user=user)
+
+    def sync_manufacturer(self):
+        """ 汇报的厂商按别名字典对应到厂商表，只查进程内的字典，厂商变化时才写库；无法识别的厂商保持不变 """
+        manufacturer_id = vendors.resolver.resolve(self.data.get('manufacturer'))
+        if manufacturer_id is None or \
+                manufacturer_id == self.asset_obj.manufacturer_id:
+            return
+        models.Asset.objects.filter(pk=self.asset_obj.pk).update(
+            manufacturer_id=manufacturer_id)
+        asset_cache.bump_asset_versions([self.asset_obj.pk])
+        self.asset_obj.manufacturer_id = manufacturer_id
+
+    def sync_os(self, values, writer, user):
+        """ 操作系统变化时通过 save 写回，触发信号调整授权统计 """
+        if not values:
+            return
+        server = models.Server.objects.filter(asset_id=self.asset_obj.pk).first()
+        if server is None:
+            return
+        changes = []
+        for field, value in values.items():
+            old = _normalize(getattr(server, field))
+            if old != value:
+                max_length = models.Server._meta.get_field(field).max_length
+                setattr(server, field, value[:max_length] or None)
+                changes.append('%s: %s -> %s' % (field, old, value))
+        if not changes:
+            return
+        server.save(update_fields=[field for field in values])
+        writer.add('系统变更',
+                   asset=self.asset_obj,
+                   event_type=0,
+                   component='OS',
+                   detail='; '.join(changes),
+                   user=user)
+
+    def build_component(self, spec, values):
+        obj = spec.model(asset_id=self.asset_obj.pk)
+        for field in spec.fields:
+            model_field = spec.model._meta.get_field(field)
+            value = values[field]
+            if value == '':
+                value = model_field.get_default() if not model_field.null \
+                    else None
+            setattr(obj, field, value)
+        if spec.model is models.CPU and obj.cpu_frequency is None:
+            obj.cpu_frequency = 0
+        return obj
+
+
+# 审批时为各类资产创建的设备记录
+DEVICE_MODELS = {
+    'server': models.Server,
+    'networkdevice': models.NetworkDevice,
+    'storagedevice': models.StorageDevice,
+    'securitydevice': models.SecurityDevice,
+}
+
+
+class ApproveAsset(object):
+    """ 待审批区中的资产上线
+    创建 Asset 和对应类型的设备记录，组件交给 UpdateAsset 按汇报数据写入：新资产的组件全部是新增，
+    每类组件一条批量 INSERT，查询条数不随组件数量增长。最后删除待审批区中的记录。
+    """
+
+    def __init__(self, request, zone):
+        self.request = request
+        self.zone = zone
+
+    def approve(self):
+        """ 返回上线的资产；不支持的资产类型返回 None """
+        zone = self.zone
+        device_model = DEVICE_MODELS.get(zone.asset_type)
+        if device_model is None:
+            return None
+        user = getattr(self.request, 'user', None)
+        if user is not None and not user.is_authenticated:
+            user = None
+        with transaction.atomic():
+            asset = models.Asset.objects.create(asset_type=zone.asset_type,
+                                                name=zone.sn,
+                                                sn=zone.sn,
+                                                approved_by=user)
+            device = device_model(asset=asset,
+                                  model=_fit(device_model, 'model', zone.model))
+            if device_model is models.Server:
+                # 操作系统在这里写入，UpdateAsset 比对时不会再记一条系统变更
+                for field in OS_FIELDS:
+                    setattr(device, field,
+                            _fit(device_model, field, getattr(zone, field)))
+            device.save()
+            updater = UpdateAsset(self.request, asset, zone.report_data)
+            updater.update()
+            models.EventLog.objects.create(name='资产上线',
+                                           asset=asset,
+                                           event_type=4,
+                                           datail='从待审批区批准上线',
+                                           user=user)
+            zone.delete()
+        return asset
@@ -0,0 +1,149 @@
+"""
+资产快照的离线分析
+快照由 python manage.py snapshot_inventory 生成，是一个 NumPy .npz 文件，每个资产一行，按列保存:
+    数值列: cpu_count、cpu_cores、ram_gb 等，直接是数组；
+    字符串列: 字典编码，<列名> 是 int32 编码数组，<列名>__dict 是编码对应的字符串，编码 0 固定表示空值。
+本模块只读取快照文件，所有统计都是向量化的数组运算，不访问数据库。需要安装 numpy: pip install numpy
+"""
+from django.utils.dateparse import parse_datetime
+
+try:
+    import numpy as np
+except ImportError:  # numpy 是可选依赖，只有容量分析需要
+    np = None
+
+FORMAT_VERSION = 1
+
+# 字典编码的字符串列
+STRING_COLUMNS = ('sn', 'asset_type', 'idc', 'business_unit', 'manufacturer',
+                  'model', 'cpu_model')
+# 数值列及其类型
+NUMERIC_COLUMNS = (
+    ('asset_id', 'int64'),
+    ('status', 'int8'),
+    ('cpu_count', 'int32'),
+    ('cpu_cores', 'int32'),
+    ('ram_gb', 'int64'),
+    ('ram_modules', 'int32'),
+    ('disk_gb', 'float64'),
+    ('disk_count', 'int32'),
+    ('nic_count', 'int32'),
+)
+
+
+def require_numpy():
+    if np is None:
+        raise ImportError('容量分析需要 numpy, 请先执行 pip install numpy')
+
+
+def encode(values):
+    """ 字典编码，返回 (编码数组, 字典)；空值和空字符串编码为 0 """
+    require_numpy()
+    labels = {'': 0}
+    codes = np.empty(len(values), dtype='int32')
+    for index, value in enumerate(values):
+        codes[index] = labels.setdefault(value or '', len(labels))
+    dictionary = np.array(sorted(labels, key=labels.get), dtype='U')
+    return codes, dictionary
+
+
+class Snapshot(object):
+    """ 一个快照文件，列按需从 .npz 中读取 """
+
+    def __init__(self, path):
+        require_numpy()
+        self.path = path
+        self.data = np.load(path, allow_pickle=False)
+        if int(self.data['format_version']) != FORMAT_VERSION:
+            raise ValueError('不支持的快照格式: %s' % path)
+        self.taken_at = parse_datetime(str(self.data['taken_at']))
+        self.size = len(self.data['asset_id'])
+        self._columns = {}
+
+    def column(self, name):
+        if name not in self._columns:
+            self._columns[name] = self.data[name]
+        return self._columns[name]
+
+    def labels(self, name):
+        return self.column(name + '__dict')
+
+    def mask(self, where=None):
+        """ 过滤条件 {列名: 值或值的列表}，字符串列按字典中的文本匹配 """
+        mask = np.ones(self.size, dtype=bool)
+        for name, wanted in (where or {}).items():
+            if not isinstance(wanted, (list, tuple, set)):
+                wanted = [wanted]
+            if name in STRING_COLUMNS:
+                labels = self.labels(name)
+                wanted = np.flatnonzero(np.isin(labels, [str(value)
+                                                         for value in wanted]))
+            mask &= np.isin(self.column(name), list(wanted))
+        return mask
+
+    def group_sum(self, by, values=('ram_gb', 'cpu_cores', 'disk_gb'),
+                  where=None):
+        """ 按字符串列分组求和，返回 {分组: {'assets': 数量, 列名: 合计}} """
+        mask = self.mask(where)
+        codes = self.column(by)[mask]
+        labels = self.labels(by)
+        size = len(labels)
+        counts = np.bincount(codes, minlength=size)
+        sums = {
+            name: np.bincount(codes,
+                              weights=self.column(name)[mask],
+                              minlength=size)
+            for name in values
+        }
+        result = {}
+        for code in np.flatnonzero(counts):
+            row = {'assets': int(counts[code])}
+            for name in values:
+                row[name] = float(sums[name][code])
+            result[str(labels[code])] = row
+        return result
+
+    def group_percentile(self, by, value, percents=(50, 90, 99), where=None):
+        """ 按字符串列分组计算百分位数（线性插值，与 numpy.percentile 的默认方式相同）
+        先按 (分组, 值) 排序，每组是排序结果中连续的一段，所有分组的百分位位置一次算出。
+        """
+        mask = self.mask(where)
+        codes = self.column(by)[mask]
+        values = self.column(value)[mask].astype('float64')
+        if not len(codes):
+            return {}
+        order = np.lexsort((values, codes))
+        codes, values = codes[order], values[order]
+        starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+        counts = np.diff(np.r_[starts, len(codes)])
+        labels = self.labels(by)
+        result = {str(labels[code]): {} for code in codes[starts]}
+        for percent in percents:
+            position = starts + (counts - 1) * (percent / 100.0)
+            lower = np.floor(position).astype('int64')
+            upper = np.minimum(lower + 1, starts + counts - 1)
+            fraction = position - lower
+            found = values[lower] + (values[upper] - values[lower]) * fraction
+            for code, number in zip(codes[starts], found):
+                result[str(labels[code])][percent] = float(number)
+        return result
+
+
+def load(paths):
+    """ 读取多个快照，按快照时间排序 """
+    return sorted((Snapshot(path) for path in paths),
+                  key=lambda snapshot: snapshot.taken_at)
+
+
+def trend(snapshots, by, value, where=None):
+    """ 各分组的某一列合计在多个快照之间的变化
+    返回 (快照时间列表, {分组: [每个快照的合计]})，某个快照中不存在的分组记为 0。
+    """
+    require_numpy()
+    times = [snapshot.taken_at for snapshot in snapshots]
+    series = {}
+    for index, snapshot in enumerate(snapshots):
+        for label, row in snapshot.group_sum(by, (value, ), where).items():
+            series.setdefault(label, np.zeros(len(snapshots)))[index] = row[
+                value]
+    return times, {label: values.tolist() for label, values in series.items()}
@@ -0,0 +1,18 @@
+from django.conf import settings
+from django.core.checks import Error, Tags, register
+
+LOCMEM_BACKEND = 'django.core.cache.backends.locmem.LocMemCache'
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    """ 缓存版本号和签名 nonce 必须在所有工作进程之间共享，本地内存缓存只能用于单进程的开发服务器 """
+    errors = []
+    for alias, config in settings.CACHES.items():
+        if config.get('BACKEND') == LOCMEM_BACKEND:
+            errors.append(
+                Error('缓存 %s 使用本地内存缓存，多进程部署时其他进程看不到版本号的变化，会返回旧数据' %
+                      alias,
+                      hint='设置 CMDB_CACHE_PROFILE=file 或 memcached',
+                      id='assets.E001'))
+    return errors
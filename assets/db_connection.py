@@ -0,0 +1,31 @@
+from django.conf import settings
+from django.core.signals import request_started
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+
+@receiver(connection_created)
+def apply_sqlite_pragmas(sender, connection, **kwargs):
+    """ SQLite 连接建立时执行 settings.SQLITE_PRAGMAS 中的配置，例如 WAL 和 synchronous """
+    pragmas = getattr(settings, 'SQLITE_PRAGMAS', None)
+    if connection.vendor != 'sqlite' or not pragmas:
+        return
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            cursor.execute('PRAGMA %s = %s' % (name, value))
+
+
+@receiver(request_started)
+def check_persistent_connections(sender, **kwargs):
+    """ 持久连接的健康检查
+    Django 只会在连接超过 CONN_MAX_AGE 或出错之后才关闭它，数据库重启或者 MySQL 的 wait_timeout 到期后，
+    请求会拿到一个已经断开的连接。这里在请求开始时对已经打开的持久连接 ping 一次，失效的直接关闭，第一次查询时自动重连。
+    """
+    if not getattr(settings, 'CMDB_DB_HEALTH_CHECKS', False):
+        return
+    for conn in connections.all():
+        if conn.connection is None or conn.in_atomic_block:
+            continue
+        if not conn.is_usable():
+            conn.close()
@@ -0,0 +1,91 @@
+import random
+import threading
+from functools import wraps
+
+from django.conf import settings
+
+PRIMARY = 'default'
+
+_state = threading.local()
+
+
+def pin_to_primary():
+    """ 当前请求（线程）之后的读操作都走主库 """
+    _state.pinned = True
+
+
+def unpin():
+    _state.pinned = False
+
+
+def is_pinned():
+    return getattr(_state, 'pinned', False)
+
+
+def get_replicas():
+    """ 配置中实际存在的从库别名，没有配置从库时返回空列表 """
+    replicas = getattr(settings, 'DATABASE_REPLICAS', ['replica'])
+    return [alias for alias in replicas if alias in settings.DATABASES]
+
+
+class PrimaryReplicaRouter(object):
+    """ 读写分离路由
+    所有写操作都走主库 default；读操作默认分散到 DATABASE_REPLICAS 中配置的从库。
+    一旦当前请求发生过写操作，或者被显式固定到主库（入库、审批、后台管理等），之后的读操作也走主库，
+    避免因为主从延迟读不到刚写入的数据。没有配置从库时所有操作都走主库。
+    """
+
+    def db_for_read(self, model, **hints):
+        if is_pinned():
+            return PRIMARY
+        replicas = get_replicas()
+        if not replicas:
+            return PRIMARY
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        pin_to_primary()
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # 主库和从库中是同一份数据
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # 真实的从库通过复制获得表结构；本地两个 SQLite 模拟时需要分别 migrate
+        return True
+
+
+class PrimaryPinningMiddleware(object):
+    """ 每个请求开始时重置主库固定状态
+    非安全方法（POST、PUT、DELETE 等）的请求和 DATABASE_PRIMARY_PATHS 中的路径从一开始就固定到主库。
+    """
+
+    safe_methods = ('GET', 'HEAD', 'OPTIONS')
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.primary_paths = tuple(
+            getattr(settings, 'DATABASE_PRIMARY_PATHS', ['/admin/']))
+
+    def __call__(self, request):
+        if request.method not in self.safe_methods or request.path.startswith(
+                self.primary_paths):
+            pin_to_primary()
+        else:
+            unpin()
+        try:
+            return self.get_response(request)
+        finally:
+            unpin()
+
+
+def use_primary(func):
+    """ 视图装饰器：整个视图都读写主库，用于入库和审批这类读后即写的流程 """
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        pin_to_primary()
+        return func(*args, **kwargs)
+
+    return wrapper
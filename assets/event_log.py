@@ -0,0 +1,171 @@
+import functools
+import gzip
+import json
+import os
+
+from django.conf import settings
+from django.db import transaction
+from . import models
+
+# 归档文件中保存的字段，与 EventLog 表的列一一对应
+ARCHIVE_FIELDS = ('id', 'name', 'asset_id', 'event_type', 'component',
+                  'datail', 'date', 'user_id', 'memo')
+
+
+class EventLogWriter(object):
+    """ 事件日志批量写入器
+    入库、审批等流程产生的事件先缓存在内存里，凑够一批再用 bulk_create 在一个事务里写入，
+    避免每个事件单独 INSERT 和单独提交。可以作为上下文管理器使用，正常退出时自动写入剩余事件：
+
+        with EventLogWriter() as writer:
+            writer.add('硬件变更', asset=asset_obj, event_type=1, detail='...')
+    """
+
+    def __init__(self, batch_size=500, using=None):
+        self.batch_size = batch_size
+        self.using = using
+        self.pending = []
+
+    def add(self, name, asset=None, event_type=0, component=None, detail='',
+            user=None, memo=None):
+        self.pending.append(
+            models.EventLog(name=name,
+                            asset=asset,
+                            event_type=event_type,
+                            component=component,
+                            datail=detail,
+                            user=user,
+                            memo=memo))
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def extend(self, events):
+        """ 直接追加已经构造好的 EventLog 对象 """
+        for event in events:
+            self.pending.append(event)
+            if len(self.pending) >= self.batch_size:
+                self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return 0
+        events, self.pending = self.pending, []
+        with transaction.atomic(using=self.using):
+            models.EventLog.objects.using(self.using).bulk_create(
+                events, batch_size=self.batch_size)
+        return len(events)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        # 出现异常时丢弃缓存，由调用方的事务决定是否回滚
+        if exc_type is None:
+            self.flush()
+        else:
+            self.pending = []
+
+
+def bulk_log(events, batch_size=500, using=None):
+    """ 一次性写入一组 EventLog 对象，返回写入条数 """
+    writer = EventLogWriter(batch_size=batch_size, using=using)
+    writer.extend(events)
+    return writer.flush()
+
+
+def get_archive_dir():
+    return getattr(settings, 'EVENTLOG_ARCHIVE_DIR',
+                   os.path.join(settings.BASE_DIR, 'archive', 'eventlog'))
+
+
+def archive_path(archive_dir, date, first_id):
+    """ 每一批中每个月份写一个文件，文件名带上月份和这批的第一个事件 id，内容是 gzip 压缩的 NDJSON，每行一个事件 """
+    return os.path.join(
+        archive_dir,
+        'eventlog-%s-%012d.ndjson.gz' % (date.strftime('%Y-%m'), first_id))
+
+
+def write_archive(path, rows):
+    """ 写入并落盘，之后才能删除数据库中的事件 """
+    with open(path, 'wb') as raw:
+        with gzip.GzipFile(fileobj=raw, mode='wb') as f:
+            for row in rows:
+                f.write(
+                    json.dumps(row, ensure_ascii=False,
+                               default=str).encode('utf-8'))
+                f.write(b'\n')
+        raw.flush()
+        os.fsync(raw.fileno())
+
+
+def publish(paths):
+    """ 删除提交之后把临时文件改名为归档文件 """
+    for path in paths:
+        os.replace(path + '.tmp', path)
+
+
+def recover_pending(archive_dir, using=None):
+    """ 处理上一次归档中断时留下的临时文件
+    其中的事件已经从数据库删除，说明删除已经提交，只差改名；否则删除没有提交，丢弃临时文件，这些事件会重新归档。
+    """
+    for filename in os.listdir(archive_dir):
+        if not filename.endswith('.ndjson.gz.tmp'):
+            continue
+        tmp = os.path.join(archive_dir, filename)
+        with gzip.open(tmp, 'rt', encoding='utf-8') as f:
+            ids = [json.loads(line)['id'] for line in f]
+        if models.EventLog.objects.using(using).filter(id__in=ids).exists():
+            os.remove(tmp)
+        else:
+            os.replace(tmp, tmp[:-len('.tmp')])
+
+
+def archive_events(before, chunk_size=5000, archive_dir=None, using=None):
+    """ 把 before 之前的事件分批移动到归档文件中
+    每批先按 id 顺序读出，写入临时文件并落盘，再按 id 删除，删除提交之后才把临时文件改名为归档文件；
+    任何一步中断都不会丢失事件，也不会让同一个事件出现在两个归档文件中。
+    每批只占用一个很短的事务，不会长时间锁住热表。返回归档的事件总数。
+    """
+    archive_dir = archive_dir or get_archive_dir()
+    os.makedirs(archive_dir, exist_ok=True)
+    recover_pending(archive_dir, using)
+    queryset = models.EventLog.objects.using(using).filter(date__lt=before)
+    total = 0
+    while True:
+        rows = list(
+            queryset.order_by('id').values(*ARCHIVE_FIELDS)[:chunk_size])
+        if not rows:
+            break
+        by_file = {}
+        for row in rows:
+            by_file.setdefault(archive_path(archive_dir, row['date'],
+                                            rows[0]['id']), []).append(row)
+        for path, file_rows in by_file.items():
+            write_archive(path + '.tmp', file_rows)
+        with transaction.atomic(using=using):
+            models.EventLog.objects.using(using).filter(
+                id__in=[row['id'] for row in rows]).delete()
+            transaction.on_commit(functools.partial(publish, list(by_file)),
+                                  using=using)
+        total += len(rows)
+    return total
+
+
+def iter_archived_events(asset_id=None, archive_dir=None):
+    """ 从归档文件中按资产读回事件，asset_id 为 None 时返回全部 """
+    archive_dir = archive_dir or get_archive_dir()
+    if not os.path.isdir(archive_dir):
+        return
+    # 先做字符串匹配，只有命中的行才解析 JSON
+    needle = None if asset_id is None else '"asset_id": %d,' % asset_id
+    for filename in sorted(os.listdir(archive_dir)):
+        if not filename.endswith('.ndjson.gz'):
+            continue
+        with gzip.open(os.path.join(archive_dir, filename), 'rt',
+                       encoding='utf-8') as f:
+            for line in f:
+                if needle is not None and needle not in line:
+                    continue
+                event = json.loads(line)
+                if asset_id is None or event['asset_id'] == asset_id:
+                    yield event
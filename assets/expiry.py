@@ -0,0 +1,181 @@
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+from . import models
+
+# 重建日历时默认覆盖的月数；接口最多只能查询到最近一次重建时实际覆盖的月份
+DEFAULT_HORIZON = 24
+
+# 下线的资产不再关心保修
+INACTIVE_STATUS = (1, )
+
+
+def month_start(day):
+    return day.replace(day=1)
+
+
+def add_months(day, months):
+    month = day.month - 1 + months
+    return day.replace(year=day.year + month // 12, month=month % 12 + 1,
+                       day=1)
+
+
+def window(months, today=None):
+    """ 从本月第一天开始的 months 个自然月，返回 [开始, 结束) """
+    start = month_start(today or timezone.localdate())
+    return start, add_months(start, months)
+
+
+def expiring_assets(start, end):
+    return models.Asset.objects.filter(
+        expire_day__gte=start,
+        expire_day__lt=end).exclude(status__in=INACTIVE_STATUS)
+
+
+def expiring_contracts(start, end):
+    return models.Contract.objects.filter(end_day__gte=start, end_day__lt=end)
+
+
+def build_buckets(months=DEFAULT_HORIZON, today=None):
+    """ 用三条聚合查询计算到期日历，返回未保存的 ExpiryBucket 列表
+    资产按到期月份、机房、业务线 GROUP BY；合同先取出窗口内到期的合同，再按合同、机房、业务线统计关联资产数。
+    """
+    start, end = window(months, today)
+    now = timezone.now()
+    buckets = [
+        models.ExpiryBucket(kind='asset',
+                            month=row['month'],
+                            idc_id=row['idc_id'],
+                            business_unit_id=row['business_unit_id'],
+                            count=row['count'],
+                            asset_count=row['count'],
+                            refreshed_at=now,
+                            horizon_end=end)
+        for row in expiring_assets(start, end).order_by().annotate(
+            month=TruncMonth('expire_day')).values(
+                'month', 'idc_id', 'business_unit_id').annotate(
+                    count=Count('id'))
+    ]
+
+    contracts = {
+        row['id']: row
+        for row in expiring_contracts(start, end).values(
+            'id', 'end_day', 'license_num')
+    }
+    # 每个合同归入关联资产最多的 (机房, 业务线)，各级汇总时每个合同只计一次
+    placement = {}
+    for row in models.Asset.objects.filter(
+            contract_id__in=list(contracts)).exclude(
+                status__in=INACTIVE_STATUS).order_by().values(
+                    'contract_id', 'idc_id', 'business_unit_id').annotate(
+                        count=Count('id')):
+        place = placement.setdefault(row['contract_id'], [None, None, 0, 0])
+        place[3] += row['count']
+        if row['count'] > place[2]:
+            place[:3] = row['idc_id'], row['business_unit_id'], row['count']
+    # {(月份, 机房, 业务线): [合同数, 资产数, license数]}
+    grouped = {}
+    for contract_id, contract in contracts.items():
+        idc_id, business_unit_id, _, asset_count = placement.get(
+            contract_id, (None, None, 0, 0))
+        bucket = grouped.setdefault(
+            (month_start(contract['end_day']), idc_id, business_unit_id),
+            [0, 0, 0])
+        bucket[0] += 1
+        bucket[1] += asset_count
+        bucket[2] += contract['license_num'] or 0
+    buckets.extend(
+        models.ExpiryBucket(kind='contract',
+                            month=month,
+                            idc_id=idc_id,
+                            business_unit_id=business_unit_id,
+                            count=count,
+                            asset_count=asset_count,
+                            license_num=license_num,
+                            refreshed_at=now,
+                            horizon_end=end)
+        for (month, idc_id, business_unit_id), (count, asset_count,
+                                                license_num) in grouped.items())
+    return buckets
+
+
+def refresh_buckets(months=DEFAULT_HORIZON, today=None):
+    """ 在一个事务中整体替换日历表，读取方不会看到一半的数据 """
+    buckets = build_buckets(months, today)
+    with transaction.atomic():
+        models.ExpiryBucket.objects.all().delete()
+        models.ExpiryBucket.objects.bulk_create(buckets, batch_size=1000)
+    return len(buckets)
+
+
+GROUP_FIELDS = {
+    'month': (),
+    'idc': ('idc__name', ),
+    'business_unit': ('business_unit__name', ),
+    'all': ('idc__name', 'business_unit__name'),
+}
+
+
+def calendar(months=6, group='month', today=None):
+    """ 未来 months 个月的到期日历，只读预计算的日历表
+    group: month 只按月份汇总；idc、business_unit 再按机房或业务线细分；all 同时细分。
+    """
+    start, end = window(months, today)
+    fields = ('kind', 'month') + GROUP_FIELDS[group]
+    rows = models.ExpiryBucket.objects.filter(
+        month__gte=start, month__lt=end).order_by(*fields).values(
+            *fields).annotate(count=Sum('count'),
+                              asset_count=Sum('asset_count'),
+                              license_num=Sum('license_num'))
+    result = []
+    for row in rows:
+        row['month'] = row['month'].strftime('%Y-%m')
+        row['idc'] = row.pop('idc__name', None)
+        row['business_unit'] = row.pop('business_unit__name', None)
+        result.append(row)
+    return result
+
+
+def coverage(today=None):
+    """ 最近一次重建的时间，以及从本月开始日历表覆盖的月数
+    日历表为空时无法知道重建的范围，按 DEFAULT_HORIZON 处理。
+    """
+    bucket = models.ExpiryBucket.objects.order_by('-refreshed_at').only(
+        'refreshed_at', 'horizon_end').first()
+    if bucket is None or bucket.horizon_end is None:
+        return (bucket.refreshed_at if bucket else None), DEFAULT_HORIZON
+    start = month_start(today or timezone.localdate())
+    end = bucket.horizon_end
+    months = (end.year - start.year) * 12 + end.month - start.month
+    return bucket.refreshed_at, months
+
+
+def upcoming(months, today=None):
+    """ 逐条列出即将到期的资产和合同，用于导出，资产和合同分别按到期日期排序 """
+    start, end = window(months, today)
+    for asset in expiring_assets(start, end).order_by(
+            'expire_day').values('expire_day', 'sn', 'name', 'idc__name',
+                                 'business_unit__name', 'contract__sn'):
+        yield {
+            'kind': 'asset',
+            'day': asset['expire_day'],
+            'sn': asset['sn'],
+            'name': asset['name'],
+            'idc': asset['idc__name'] or '',
+            'business_unit': asset['business_unit__name'] or '',
+            'contract': asset['contract__sn'] or '',
+            'license_num': '',
+        }
+    for contract in expiring_contracts(start, end).order_by('end_day').values(
+            'end_day', 'sn', 'name', 'license_num'):
+        yield {
+            'kind': 'contract',
+            'day': contract['end_day'],
+            'sn': contract['sn'],
+            'name': contract['name'],
+            'idc': '',
+            'business_unit': '',
+            'contract': contract['sn'],
+            'license_num': contract['license_num'] or '',
+        }
@@ -0,0 +1,51 @@
+import json
+import zlib
+
+from django.db import models
+
+
+class CompressedJSONField(models.BinaryField):
+    """ zlib 压缩后以二进制存储的 JSON 字段
+    赋值和读取都是 dict，写库时序列化并压缩，读库时解压并反序列化；
+    网卡和硬盘列表很长的汇报数据，压缩后通常只有原来的十分之一左右。
+    """
+
+    description = 'zlib 压缩的 JSON 数据'
+
+    def __init__(self, *args, level=6, **kwargs):
+        self.level = level
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        if self.level != 6:
+            kwargs['level'] = self.level
+        return name, path, args, kwargs
+
+    @staticmethod
+    def decompress(value):
+        return json.loads(zlib.decompress(bytes(value)).decode())
+
+    def compress(self, value):
+        raw = json.dumps(value, ensure_ascii=False, separators=(',', ':'))
+        return zlib.compress(raw.encode(), self.level)
+
+    def from_db_value(self, value, expression, connection):
+        if value is None:
+            return None
+        return self.decompress(value)
+
+    def to_python(self, value):
+        if isinstance(value, (bytes, bytearray, memoryview)):
+            return self.decompress(value)
+        if isinstance(value, str):
+            return json.loads(value)
+        return value
+
+    def get_prep_value(self, value):
+        if value is None or isinstance(value, (bytes, bytearray, memoryview)):
+            return value
+        return self.compress(value)
+
+    def value_to_string(self, obj):
+        return json.dumps(self.value_from_object(obj), ensure_ascii=False)
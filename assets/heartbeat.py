@@ -0,0 +1,105 @@
+import atexit
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import DatabaseError, connection
+from django.utils import timezone
+from . import models
+
+logger = logging.getLogger(__name__)
+
+
+def get_flush_interval():
+    return getattr(settings, 'HEARTBEAT_FLUSH_INTERVAL', 60)
+
+
+class HeartbeatBuffer(object):
+    """ 资产最近汇报时间的进程内缓冲
+    每次汇报只在内存中记录 {资产id: 汇报时间}，距离上次写库超过 flush_interval 秒时，
+    由当时的请求把缓冲中的全部记录用一条 UPDATE ... CASE 语句写入 Asset.last_seen。
+    没有后续汇报时由后台定时器在一个周期后写库，进程正常退出时也会写一次，
+    因此任何一条心跳最多延迟一个周期落库；只有进程被强制杀掉时才会丢失一个周期的记录。
+    同一个资产在一个周期内多次汇报只写一次。
+    """
+
+    def __init__(self, flush_interval=None, batch_size=1000):
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.pending = {}
+        self.last_flush = time.time()
+        self.lock = threading.Lock()
+        self.timer = None
+
+    def get_interval(self):
+        if self.flush_interval is None:
+            return get_flush_interval()
+        return self.flush_interval
+
+    def schedule(self, interval):
+        """ 启动定时写库，调用时必须持有 self.lock """
+        if self.timer is None:
+            self.timer = threading.Timer(interval, self.run_timer)
+            self.timer.daemon = True
+            self.timer.start()
+
+    def beat(self, asset_id, seen=None):
+        seen = seen or timezone.now()
+        with self.lock:
+            self.pending[asset_id] = seen
+            interval = self.get_interval()
+            due = time.time() - self.last_flush >= interval
+            if not due:
+                self.schedule(interval)
+        if due:
+            self.flush()
+
+    def flush_scheduled(self):
+        """ 定时器到期时写库，写库失败放回缓冲的记录在下一个周期重试 """
+        with self.lock:
+            self.timer = None
+        count = self.flush()
+        with self.lock:
+            if self.pending:
+                self.schedule(self.get_interval())
+        return count
+
+    def run_timer(self):
+        try:
+            self.flush_scheduled()
+        finally:
+            # 定时器线程使用自己的数据库连接，用完立即关闭
+            connection.close()
+
+    def take(self):
+        with self.lock:
+            pending, self.pending = self.pending, {}
+            self.last_flush = time.time()
+        return pending
+
+    def flush(self):
+        """ 把缓冲的汇报时间写入数据库，返回写入的资产数 """
+        pending = self.take()
+        if not pending:
+            return 0
+        objs = [
+            models.Asset(id=asset_id, last_seen=seen)
+            for asset_id, seen in pending.items()
+        ]
+        try:
+            # 只更新 last_seen，不触发信号也不修改 m_time，资产缓存不受影响
+            models.Asset.objects.bulk_update(objs, ['last_seen'],
+                                             batch_size=self.batch_size)
+        except DatabaseError:
+            logger.exception('写入最近汇报时间失败，%d 条记录放回缓冲', len(pending))
+            with self.lock:
+                for asset_id, seen in pending.items():
+                    if self.pending.get(asset_id, seen) <= seen:
+                        self.pending[asset_id] = seen
+            return 0
+        return len(pending)
+
+
+buffer = HeartbeatBuffer()
+atexit.register(buffer.flush)
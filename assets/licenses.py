@@ -0,0 +1,94 @@
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count
+from . import asset_cache
+from . import models
+
+# 每个版本键的安装数量单独缓存，服务器的系统版本变化时只对两个计数各加减一
+VERSION_KEY = 'cmdb:license:ver'
+COUNT_KEY = 'cmdb:license:count:%s:%s'
+
+
+def _count_key(version, os_key):
+    # 版本键中只有字母、数字和空格，替换掉空格后可以直接作为缓存键
+    return COUNT_KEY % (version, os_key.replace(' ', '_'))
+
+
+def install_counts(os_keys):
+    """ 每个版本键的服务器数量，返回 {版本键: 数量}
+    先批量读缓存，未命中的版本键用一条 GROUP BY 查询补齐并写回缓存，之后由 adjust 增量维护。
+    """
+    os_keys = [key for key in set(os_keys) if key]
+    version = asset_cache.get_version(VERSION_KEY)
+    cache_keys = {_count_key(version, key): key for key in os_keys}
+    cached = cache.get_many(list(cache_keys))
+    counts = {cache_keys[cache_key]: value for cache_key, value in cached.items()}
+    missing = [key for key in os_keys if key not in counts]
+    if missing:
+        loaded = dict.fromkeys(missing, 0)
+        loaded.update(
+            models.Server.objects.filter(os_key__in=missing).order_by().values(
+                'os_key').annotate(count=Count('id')).values_list(
+                    'os_key', 'count'))
+        # 统计和写回之间可能有服务器的修改已经提交，而 adjust 因为计数还没有缓存什么也没做，
+        # 写回的计数就少了这次修改。所以用 add 不覆盖别的进程刚写入的计数，并设置过期时间，
+        # 即使计数偏差也会在过期后从数据库重新统计
+        for key, count in loaded.items():
+            cache.add(_count_key(version, key), count,
+                      asset_cache.get_timeout())
+        counts.update(loaded)
+    return counts
+
+
+def adjust(old_key, new_key):
+    """ 一台服务器的系统版本从 old_key 变为 new_key（新增时 old_key 为空，删除时 new_key 为空）
+    事务提交后只调整已经缓存的两个计数；没有缓存的计数下次读取时会从数据库重新统计。
+    """
+    if old_key == new_key:
+        return
+
+    def apply():
+        version = asset_cache.get_version(VERSION_KEY)
+        for key, delta in ((old_key, -1), (new_key, 1)):
+            if not key:
+                continue
+            try:
+                cache.incr(_count_key(version, key), delta)
+            except ValueError:
+                pass
+
+    transaction.on_commit(apply)
+
+
+def invalidate():
+    """ 批量导入、批量修改服务器之后调用，让全部计数失效 """
+    transaction.on_commit(lambda: asset_cache.bump_version(VERSION_KEY))
+
+
+def utilisation():
+    """ 授权使用情况，超额部署的软件排在最前面
+    软件表很小，整表读出；服务器只按版本键做一次聚合（通常直接命中缓存），不扫描服务器表。
+    匹配只比较规范化之后的整个版本键是否相等，不做前缀或版本范围匹配:
+    登记为 'CentOS 7' 的授权不会统计系统版本为 'CentOS 7.6' 的服务器，每个需要统计的版本都要单独登记。
+    """
+    software = list(
+        models.Software.objects.order_by('version').values(
+            'id', 'version', 'sub_asset_type', 'license_num'))
+    for item in software:
+        item['key'] = models.license_key(item['version'])
+    counts = install_counts(item['key'] for item in software)
+    sub_types = dict(models.Software.sub_asset_type_choice)
+    rows = []
+    for item in software:
+        installed = counts.get(item['key'], 0)
+        rows.append({
+            'id': item['id'],
+            'version': item['version'],
+            'sub_asset_type': sub_types.get(item['sub_asset_type']),
+            'license_num': item['license_num'],
+            'installed': installed,
+            'available': item['license_num'] - installed,
+            'over_deployed': installed > item['license_num'],
+        })
+    rows.sort(key=lambda row: (not row['over_deployed'], row['version']))
+    return rows
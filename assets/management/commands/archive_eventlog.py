@@ -0,0 +1,53 @@
+import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from assets import event_log
+from assets import models
+
+
+class Command(BaseCommand):
+    """ 事件日志的保留与归档
+    python manage.py archive_eventlog --days 90          把 90 天前的事件移入归档文件
+    python manage.py archive_eventlog --asset <SN>       查询某个资产已归档的事件
+    """
+    help = '把过期的事件日志分批归档为压缩的 NDJSON 文件，或按资产查询归档'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days',
+                            type=int,
+                            default=getattr(settings,
+                                            'EVENTLOG_RETENTION_DAYS', 90),
+                            help='热表中保留的天数')
+        parser.add_argument('--chunk-size', type=int, default=5000,
+                            help='每批归档的事件数')
+        parser.add_argument('--archive-dir', default=None, help='归档目录')
+        parser.add_argument('--asset', default=None,
+                            help='只查询该资产SN的归档事件，不做归档')
+
+    def handle(self, *args, **options):
+        archive_dir = options['archive_dir']
+        if options['asset']:
+            asset = models.Asset.objects.filter(sn=options['asset']).only(
+                'id').first()
+            if asset is None:
+                raise CommandError('资产不存在: %s' % options['asset'])
+            count = 0
+            for event in event_log.iter_archived_events(
+                    asset.id, archive_dir=archive_dir):
+                self.stdout.write('%s\t%s\t%s\t%s' % (
+                    event['date'], event['name'], event['component'] or '',
+                    event['datail']))
+                count += 1
+            self.stdout.write('共 %d 条归档事件' % count)
+            return
+
+        if options['days'] < 0:
+            raise CommandError('--days 不能为负数')
+        before = timezone.now() - datetime.timedelta(days=options['days'])
+        total = event_log.archive_events(before,
+                                         chunk_size=options['chunk_size'],
+                                         archive_dir=archive_dir)
+        self.stdout.write('已归档 %d 条 %s 之前的事件' %
+                          (total, before.strftime('%Y-%m-%d %H:%M:%S')))
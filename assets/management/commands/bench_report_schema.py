@@ -0,0 +1,48 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand
+from assets.report_schema import validator
+from .bench_report_storage import build_report
+
+
+class Command(BaseCommand):
+    """ 汇报数据校验的开销
+    python manage.py bench_report_schema --rows 2000 --nics 32 --disks 24
+    与解析同一份数据的 json.loads 对比: 校验逐个检查字段并解析IP地址，耗时与 json.loads 在同一数量级
+    （16 网卡、12 硬盘、16 内存的汇报约为 json.loads 的 80%~100%，每份几十微秒），与一次汇报的数据库操作相比可以忽略；
+    比例明显超过 json.loads 时说明校验中出现了慢路径。
+    """
+    help = '测试汇报数据格式校验的耗时'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1000)
+        parser.add_argument('--nics', type=int, default=16)
+        parser.add_argument('--disks', type=int, default=12)
+        parser.add_argument('--rams', type=int, default=16)
+
+    def handle(self, *args, **options):
+        rows = options['rows']
+        texts = [
+            json.dumps(
+                build_report('BENCH-%08d' % i, options['nics'],
+                             options['disks'], options['rams']))
+            for i in range(rows)
+        ]
+
+        started = time.perf_counter()
+        reports = [json.loads(text) for text in texts]
+        decode = time.perf_counter() - started
+
+        started = time.perf_counter()
+        invalid = sum(1 for report in reports if validator.validate(report))
+        validate = time.perf_counter() - started
+
+        self.stdout.write('每份汇报: %d 网卡, %d 硬盘, %d 内存, 共 %d 份' %
+                          (options['nics'], options['disks'], options['rams'],
+                           rows))
+        self.stdout.write('json.loads: %8.1f us/份' % (decode / rows * 1e6))
+        self.stdout.write('格式校验:   %8.1f us/份' % (validate / rows * 1e6))
+        self.stdout.write('校验/解析: %.1f%%' % (validate * 100.0 / decode))
+        if invalid:
+            self.stderr.write('%d 份测试数据没有通过校验' % invalid)
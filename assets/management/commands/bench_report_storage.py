@@ -0,0 +1,151 @@
+import json
+import random
+import time
+import zlib
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from assets import models
+from assets.fields import CompressedJSONField
+
+
+def build_report(sn, nic_count, disk_count, ram_count):
+    """ 生成一份与客户端汇报格式相同的测试数据 """
+    return {
+        'sn': sn,
+        'asset_type': 'server',
+        'manufacturer': 'Dell Inc.',
+        'model': 'PowerEdge R740',
+        'os_type': 'Linux',
+        'os_distribution': 'CentOS',
+        'os_release': 'CentOS Linux release 7.6.1810 (Core)',
+        'cpu_model': 'Intel(R) Xeon(R) Gold 6130 CPU @ 2.10GHz',
+        'cpu_count': 2,
+        'cpu_core_count': 32,
+        'ram_size': 16 * ram_count,
+        'RAM': [{
+            'slot': 'DIMM_A%d' % i,
+            'capacity': 16,
+            'model': 'DDR4 2666',
+            'manufacturer': 'Samsung',
+            'sn': '%08X' % random.getrandbits(32),
+        } for i in range(ram_count)],
+        'physical_disk_driver': [{
+            'slot': i,
+            'sn': 'WD-%012X' % random.getrandbits(48),
+            'model': 'ST4000NM0035-1V4107',
+            'manufacturer': 'Seagate',
+            'capacity': 3726,
+            'interface_type': 'SAS',
+        } for i in range(disk_count)],
+        'nic': [{
+            'name': 'eth%d' % i,
+            'model': 'Intel Corporation Ethernet Controller X710',
+            'mac': '00:1b:21:%02x:%02x:%02x' %
+            (random.getrandbits(8), random.getrandbits(8), i % 256),
+            'ip_address': ['10.%d.%d.%d' % (i % 256, random.getrandbits(8),
+                                             random.getrandbits(8))],
+            'net_mask': ['255.255.255.0'],
+        } for i in range(nic_count)],
+    }
+
+
+class Command(BaseCommand):
+    """ 汇报数据两种存储方式的对比: 明文 JSON 文本与 zlib 压缩的二进制
+    python manage.py bench_report_storage --rows 2000 --nics 32 --disks 24
+    先在内存中比较编解码耗时和数据大小，再在一个最终回滚的事务中比较写库和读库的耗时。
+    """
+    help = '对比待审批区汇报数据明文存储和压缩存储的大小与读写开销'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1000)
+        parser.add_argument('--nics', type=int, default=16)
+        parser.add_argument('--disks', type=int, default=12)
+        parser.add_argument('--rams', type=int, default=16)
+        parser.add_argument('--no-db', action='store_true',
+                            help='只做内存中的编解码测试')
+
+    def handle(self, *args, **options):
+        rows = options['rows']
+        reports = [
+            build_report('BENCH-%08d' % i, options['nics'], options['disks'],
+                         options['rams']) for i in range(rows)
+        ]
+        field = CompressedJSONField()
+
+        started = time.perf_counter()
+        texts = [json.dumps(report) for report in reports]
+        text_encode = time.perf_counter() - started
+        started = time.perf_counter()
+        for text in texts:
+            json.loads(text)
+        text_decode = time.perf_counter() - started
+
+        started = time.perf_counter()
+        blobs = [field.get_prep_value(report) for report in reports]
+        zlib_encode = time.perf_counter() - started
+        started = time.perf_counter()
+        for blob in blobs:
+            field.to_python(blob)
+        zlib_decode = time.perf_counter() - started
+
+        text_size = sum(len(text.encode()) for text in texts)
+        zlib_size = sum(len(blob) for blob in blobs)
+        self.stdout.write('每份汇报: %d 网卡, %d 硬盘, %d 内存, 共 %d 份' %
+                          (options['nics'], options['disks'], options['rams'],
+                           rows))
+        self.stdout.write('%-10s %12s %14s %14s' %
+                          ('存储方式', '平均字节', '编码(us/份)', '解码(us/份)'))
+        self.stdout.write('%-10s %12d %14.1f %14.1f' %
+                          ('text', text_size / rows, text_encode / rows * 1e6,
+                           text_decode / rows * 1e6))
+        self.stdout.write('%-10s %12d %14.1f %14.1f' %
+                          ('zlib', zlib_size / rows, zlib_encode / rows * 1e6,
+                           zlib_decode / rows * 1e6))
+        self.stdout.write('压缩率: %.1f%%' % (zlib_size * 100.0 / text_size))
+        if not options['no_db']:
+            self.bench_db(reports, texts)
+
+    def bench_db(self, reports, texts):
+        """ 写入和读回都在同一个事务中完成，结束时回滚，不会留下测试数据 """
+        model = models.NewAssetApprovalZone
+        rows = len(reports)
+        results = {}
+        try:
+            with transaction.atomic():
+                started = time.perf_counter()
+                model.objects.bulk_create([
+                    model(sn=report['sn'], data=text)
+                    for report, text in zip(reports, texts)
+                ])
+                text_write = time.perf_counter() - started
+                started = time.perf_counter()
+                for obj in model.objects.filter(
+                        sn__startswith='BENCH-').only('data'):
+                    json.loads(obj.data)
+                results['text'] = (text_write, time.perf_counter() - started)
+                model.objects.filter(sn__startswith='BENCH-').delete()
+
+                started = time.perf_counter()
+                model.objects.bulk_create([
+                    model(sn=report['sn'], compressed_data=report)
+                    for report in reports
+                ])
+                zlib_write = time.perf_counter() - started
+                started = time.perf_counter()
+                for obj in model.objects.filter(
+                        sn__startswith='BENCH-').only('compressed_data'):
+                    obj.report_data
+                results['zlib'] = (zlib_write, time.perf_counter() - started)
+                raise _Rollback()
+        except _Rollback:
+            pass
+        self.stdout.write('%-10s %14s %14s' %
+                          ('数据库', '写入(us/份)', '读取(us/份)'))
+        for name, (write, read) in results.items():
+            self.stdout.write('%-10s %14.1f %14.1f' %
+                              (name, write / rows * 1e6, read / rows * 1e6))
+
+
+class _Rollback(Exception):
+    pass
@@ -0,0 +1,164 @@
+import asyncio
+import json
+import time
+import uuid
+from urllib.parse import urlencode, urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+from assets import agent_auth
+from .bench_report_storage import build_report
+
+
+def percentile(values, percent):
+    if not values:
+        return 0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * percent / 100.0))]
+
+
+class Command(BaseCommand):
+    """ 慢速客户端压测，对比 WSGI 和 ASGI 部署能同时承受的连接数
+    先启动被测服务，例如:
+        gunicorn DjangoCMDB.wsgi:application -w 4 -b 127.0.0.1:8001
+        uvicorn DjangoCMDB.asgi:application --workers 4 --port 8002
+    再分别运行:
+        python manage.py bench_slow_clients --url http://127.0.0.1:8001 --clients 200
+        python manage.py bench_slow_clients --url http://127.0.0.1:8002 --clients 200
+    --clients 个客户端同时向汇报接口上传数据，每份数据在 --upload-seconds 秒内分段慢慢发完，
+    模拟远程机房的慢速链路；同时每隔一段时间请求一次 --probe-path，统计探测请求的延迟和超时。
+    WSGI 的同步 worker 在读取请求体期间被占满，探测请求排队；ASGI 在事件循环中读取请求体，探测请求不受影响。
+    被测服务的 REPORT_ADMISSION 需要放宽单个 IP 的限流，否则大部分慢速客户端会直接收到 429。
+    """
+    help = '模拟大量慢速上传的客户端，测试服务的并发连接承受能力'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', required=True,
+                            help='被测服务地址, 例如 http://127.0.0.1:8000')
+        parser.add_argument('--clients', type=int, default=100)
+        parser.add_argument('--upload-seconds', type=float, default=10.0)
+        parser.add_argument('--chunks', type=int, default=20,
+                            help='每份数据分成多少段发送')
+        parser.add_argument('--probe-path', default='/assets/summary/')
+        parser.add_argument('--probe-interval', type=float, default=0.2)
+        parser.add_argument('--timeout', type=float, default=30.0)
+        parser.add_argument('--key-id', help='签名使用的密钥ID, 默认取 REPORT_AUTH 中的第一个')
+
+    def handle(self, *args, **options):
+        url = urlsplit(options['url'])
+        if not url.hostname:
+            raise CommandError('无效的地址: %s' % options['url'])
+        self.host = url.hostname
+        self.port = url.port or 80
+        key_ring = agent_auth.get_key_ring()
+        key_id = options['key_id'] or next(iter(key_ring.keys), None)
+        if key_id not in key_ring.keys:
+            raise CommandError('REPORT_AUTH 中没有密钥: %s' % key_id)
+        self.key_id, self.secret = key_id, key_ring.keys[key_id]
+        self.options = options
+
+        loop = asyncio.new_event_loop()
+        try:
+            uploads, probes = loop.run_until_complete(self.run())
+        finally:
+            loop.close()
+        self.summary('慢速上传', uploads)
+        self.summary('探测请求', probes)
+
+    def summary(self, name, results):
+        latencies = [latency for status, latency in results if status]
+        statuses = {}
+        for status, latency in results:
+            statuses[status or '超时/失败'] = statuses.get(status or '超时/失败',
+                                                       0) + 1
+        self.stdout.write(
+            '%s: 共 %d 个, 状态 %s, 延迟 p50 %.3fs p95 %.3fs 最大 %.3fs' %
+            (name, len(results), statuses, percentile(latencies, 50),
+             percentile(latencies, 95), max(latencies or [0])))
+
+    async def run(self):
+        options = self.options
+        uploads = [
+            asyncio.ensure_future(self.slow_upload())
+            for _ in range(options['clients'])
+        ]
+        probes = []
+        started = time.time()
+        # 慢速客户端全部连上之后开始探测，直到上传全部结束
+        await asyncio.sleep(min(1.0, options['upload_seconds'] / 4))
+        while not all(upload.done() for upload in uploads):
+            probes.append(asyncio.ensure_future(self.probe()))
+            await asyncio.sleep(options['probe_interval'])
+            if time.time() - started > options['upload_seconds'] + options[
+                    'timeout']:
+                break
+        return (await asyncio.gather(*uploads),
+                await asyncio.gather(*probes))
+
+    def signed_request(self):
+        path = '/assets/report/'
+        report = build_report('SLOW-%s' % uuid.uuid4().hex[:12], 4, 4, 4)
+        body = urlencode({'asset_data': json.dumps(report)}).encode()
+        timestamp = str(int(time.time()))
+        nonce = uuid.uuid4().hex
+        headers = [
+            'POST %s HTTP/1.1' % path,
+            'Host: %s:%s' % (self.host, self.port),
+            'Content-Type: application/x-www-form-urlencoded',
+            'Content-Length: %d' % len(body),
+            'Connection: close',
+            'X-CMDB-SN: %s' % report['sn'],
+            'X-CMDB-Key-Id: %s' % self.key_id,
+            'X-CMDB-Timestamp: %s' % timestamp,
+            'X-CMDB-Nonce: %s' % nonce,
+            'X-CMDB-Signature: %s' % agent_auth.sign(
+                self.secret, 'POST', path, timestamp, nonce, report['sn'],
+                body),
+        ]
+        return ('\r\n'.join(headers) + '\r\n\r\n').encode(), body
+
+    async def slow_upload(self):
+        """ 请求头立即发出，请求体分段在 upload_seconds 秒内发完 """
+        options = self.options
+        head, body = self.signed_request()
+        started = time.time()
+        try:
+            reader, writer = await asyncio.wait_for(
+                asyncio.open_connection(self.host, self.port),
+                options['timeout'])
+            writer.write(head)
+            size = max(1, len(body) // options['chunks'] + 1)
+            delay = options['upload_seconds'] / options['chunks']
+            for offset in range(0, len(body), size):
+                writer.write(body[offset:offset + size])
+                await writer.drain()
+                await asyncio.sleep(delay)
+            status = await asyncio.wait_for(self.read_status(reader),
+                                            options['timeout'])
+            writer.close()
+        except (OSError, asyncio.TimeoutError):
+            return None, time.time() - started
+        return status, time.time() - started
+
+    async def probe(self):
+        started = time.time()
+        try:
+            reader, writer = await asyncio.wait_for(
+                asyncio.open_connection(self.host, self.port),
+                self.options['timeout'])
+            writer.write(
+                ('GET %s HTTP/1.1\r\nHost: %s:%s\r\nConnection: close\r\n\r\n'
+                 % (self.options['probe_path'], self.host,
+                    self.port)).encode())
+            status = await asyncio.wait_for(self.read_status(reader),
+                                            self.options['timeout'])
+            writer.close()
+        except (OSError, asyncio.TimeoutError):
+            return None, time.time() - started
+        return status, time.time() - started
+
+    @staticmethod
+    async def read_status(reader):
+        line = await reader.readline()
+        await reader.read()
+        parts = line.split()
+        return int(parts[1]) if len(parts) > 1 else None
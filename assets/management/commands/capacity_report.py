@@ -0,0 +1,72 @@
+from django.core.management.base import BaseCommand, CommandError
+from assets import capacity
+
+# 可以计算分位数和变化趋势的数值列，资产 id 和状态码没有统计意义
+VALUE_COLUMNS = tuple(name for name, _ in capacity.NUMERIC_COLUMNS
+                      if name not in ('asset_id', 'status'))
+
+
+class Command(BaseCommand):
+    """ 基于列式快照的容量统计，只读快照文件，不访问数据库
+    python manage.py capacity_report inventory-20240101.npz --by idc
+    python manage.py capacity_report inventory-*.npz --by business_unit --trend ram_gb
+    python manage.py capacity_report inventory-20240101.npz --by model --percentile cpu_cores
+    """
+    help = '按机房、业务线、型号或厂商统计快照中的内存、CPU核心和硬盘容量'
+
+    def add_arguments(self, parser):
+        parser.add_argument('snapshots', nargs='+', help='快照文件')
+        parser.add_argument('--by', default='idc',
+                            choices=capacity.STRING_COLUMNS)
+        parser.add_argument('--asset-type', default=None,
+                            help='只统计某一类资产, 例如 server')
+        parser.add_argument('--percentile', default=None,
+                            choices=VALUE_COLUMNS,
+                            help='计算该列在各分组中的 P50/P90/P99')
+        parser.add_argument('--trend', default=None, choices=VALUE_COLUMNS,
+                            help='输出该列合计在各快照之间的变化')
+
+    def handle(self, *args, **options):
+        # call_command 传入的关键字参数不经过 argparse 的 choices 检查
+        for option in ('percentile', 'trend'):
+            if options[option] and options[option] not in VALUE_COLUMNS:
+                raise CommandError('--%s 只能是以下列之一: %s' %
+                                   (option, ', '.join(VALUE_COLUMNS)))
+        try:
+            snapshots = capacity.load(options['snapshots'])
+        except (ImportError, ValueError, OSError, KeyError) as e:
+            raise CommandError(str(e))
+        by = options['by']
+        where = {'asset_type': options['asset_type']
+                 } if options['asset_type'] else None
+
+        if options['trend']:
+            times, series = capacity.trend(snapshots, by, options['trend'],
+                                           where)
+            self.stdout.write('%-32s %s' % (by, ' '.join(
+                '%14s' % time.strftime('%Y-%m-%d') for time in times)))
+            for label in sorted(series):
+                self.stdout.write('%-32s %s' % (label or '-', ' '.join(
+                    '%14.1f' % value for value in series[label])))
+            return
+
+        snapshot = snapshots[-1]
+        if options['percentile']:
+            result = snapshot.group_percentile(by, options['percentile'],
+                                               where=where)
+            self.stdout.write('%-32s %10s %10s %10s' % (by, 'P50', 'P90',
+                                                        'P99'))
+            for label in sorted(result):
+                row = result[label]
+                self.stdout.write('%-32s %10.1f %10.1f %10.1f' %
+                                  (label or '-', row[50], row[90], row[99]))
+            return
+
+        result = snapshot.group_sum(by, where=where)
+        self.stdout.write('%-32s %8s %12s %10s %14s' %
+                          (by, '资产数', '内存(GB)', 'CPU核心', '硬盘(GB)'))
+        for label in sorted(result):
+            row = result[label]
+            self.stdout.write('%-32s %8d %12.0f %10.0f %14.1f' %
+                              (label or '-', row['assets'], row['ram_gb'],
+                               row['cpu_cores'], row['disk_gb']))
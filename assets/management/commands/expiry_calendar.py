@@ -0,0 +1,63 @@
+import csv
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from assets import expiry
+
+EXPORT_FIELDS = ('kind', 'day', 'sn', 'name', 'idc', 'business_unit',
+                 'contract', 'license_num')
+
+
+class Command(BaseCommand):
+    """ 过保和合同到期日历
+    python manage.py expiry_calendar --refresh                  重建预计算的日历表
+    python manage.py expiry_calendar --export expiry.csv --months 3   导出未来 3 个月内到期的资产和合同
+    适合放在 crontab 中每天运行一次，例如:
+    0 2 * * * cd /path/to/DjangoCMDB && python manage.py expiry_calendar --refresh --export /data/expiry/%Y%m%d.csv
+    导出路径中可以使用 strftime 格式，按运行日期生成文件名。
+    """
+    help = '重建到期日历表，并导出即将到期的资产和合同'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--refresh', action='store_true',
+                            help='重建预计算的日历表')
+        parser.add_argument('--horizon', type=int,
+                            default=expiry.DEFAULT_HORIZON,
+                            help='日历表覆盖的月数')
+        parser.add_argument('--export', default=None,
+                            help='导出 CSV 的路径, - 表示标准输出')
+        parser.add_argument('--months', type=int, default=3,
+                            help='导出未来多少个月内到期的记录')
+
+    def handle(self, *args, **options):
+        if not options['refresh'] and not options['export']:
+            raise CommandError('至少指定 --refresh 或 --export 之一')
+        if options['refresh']:
+            if options['horizon'] < 1:
+                raise CommandError('--horizon 必须大于 0')
+            count = expiry.refresh_buckets(options['horizon'])
+            self.stderr.write('日历表已重建: 未来 %d 个月, %d 个分组' %
+                              (options['horizon'], count))
+        if options['export']:
+            self.export(options['export'], options['months'])
+
+    def export(self, path, months):
+        if path == '-':
+            count = self.write_rows(sys.stdout, months)
+        else:
+            path = timezone.localtime().strftime(path)
+            with open(path, 'w', newline='', encoding='utf-8') as f:
+                count = self.write_rows(f, months)
+        self.stderr.write('已导出 %d 条未来 %d 个月内到期的记录到 %s' %
+                          (count, months, path))
+
+    @staticmethod
+    def write_rows(f, months):
+        writer = csv.DictWriter(f, fieldnames=EXPORT_FIELDS)
+        writer.writeheader()
+        count = 0
+        for row in expiry.upcoming(months):
+            writer.writerow(row)
+            count += 1
+        return count
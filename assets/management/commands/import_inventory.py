@@ -0,0 +1,408 @@
+import csv
+import json
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils.dateparse import parse_date
+from assets import asset_cache
+from assets import licenses
+from assets import models
+from assets import vendors
+
+ASSET_FIELDS = ('asset_type', 'status', 'manage_ip', 'price', 'memo')
+ASSET_DATE_FIELDS = ('purchase_day', 'expire_day')
+SERVER_FIELDS = ('sub_asset_type', 'model', 'raid_type', 'os_type',
+                 'os_distribution', 'os_release')
+RAM_FIELDS = ('sn', 'model', 'manufacturer', 'slot', 'capacity', 'frequency')
+DISK_FIELDS = ('sn', 'slot', 'model', 'manufacturer', 'capacity',
+               'interface_type', 'disk_protocol')
+NIC_FIELDS = ('name', 'model', 'mac', 'bonding', 'manufacturer')
+
+
+class LookupMap(object):
+    """ 名称到 id 的内存映射
+    启动时一次性把整张表加载到字典中，导入过程中外键只查字典；遇到不存在的名称时，整批一起创建后再补充到字典里。
+    """
+
+    def __init__(self, model, field='name'):
+        self.model = model
+        self.field = field
+        self.ids = dict(model.objects.values_list(field, 'pk'))
+
+    def ensure(self, values):
+        """ values 为 {名称: 创建时的其他字段} """
+        missing = {
+            name: extra
+            for name, extra in values.items() if name and name not in self.ids
+        }
+        if not missing:
+            return
+        self.create(missing)
+        self.ids.update(
+            self.model.objects.filter(**{
+                self.field + '__in': list(missing)
+            }).values_list(self.field, 'pk'))
+
+    def create(self, missing):
+        self.model.objects.bulk_create([
+            self.model(**dict(extra, **{self.field: name}))
+            for name, extra in missing.items()
+        ],
+                                       ignore_conflicts=True)
+
+    def get(self, name):
+        return self.ids.get(name) if name else None
+
+
+class ManufacturerLookupMap(LookupMap):
+    """ 厂商先按别名字典识别，'Dell Inc.' 和 'DELL' 对应到同一个厂商，只有无法识别的厂商才新建，每个规范化键只建一个 """
+
+    def __init__(self):
+        super().__init__(models.Manufacturer)
+        # 本次导入新建的厂商 {规范化键: id}，厂商字典要等事务提交后才会重新加载
+        self.keys = {}
+
+    def ensure(self, values):
+        missing = {}
+        for name, extra in values.items():
+            key = models.vendor_key(name)
+            if key and key not in self.keys and \
+                    vendors.resolver.resolve(name) is None:
+                missing.setdefault(key, (name, extra))
+        if not missing:
+            return
+        super().ensure({name: extra for name, extra in missing.values()})
+        for key, (name, _) in missing.items():
+            self.keys[key] = self.ids.get(name)
+        # bulk_create 不触发信号，手动让厂商字典失效
+        vendors.invalidate()
+
+    def get(self, name):
+        if not name:
+            return None
+        return vendors.resolver.resolve(name) or self.keys.get(
+            models.vendor_key(name))
+
+
+class BusinessUnitLookupMap(LookupMap):
+    """ 业务线需要逐条 save，才能维护层级路径；新业务线的数量很少，不影响速度 """
+
+    def create(self, missing):
+        for name in missing:
+            models.BusinessUnit.objects.get_or_create(name=name)
+
+
+def clean(value):
+    """ CSV 中的空字符串视为没有值 """
+    if isinstance(value, str):
+        value = value.strip()
+        return value or None
+    return value
+
+
+def first(value):
+    """ 客户端汇报的 IP 和掩码可能是列表，只取第一个 """
+    if isinstance(value, (list, tuple)):
+        return clean(value[0]) if value else None
+    return clean(value)
+
+
+class Command(BaseCommand):
+    """ 批量导入资产清单
+    python manage.py import_inventory assets.csv
+    python manage.py import_inventory assets.ndjson --chunk-size 2000
+
+    每行一个资产。CSV 的列就是资产字段名，标签用分号分隔；NDJSON 每行一个 JSON 对象，
+    除了资产字段之外，还可以像客户端汇报数据一样携带 RAM、physical_disk_driver、nic 列表和 cpu_* 字段。
+    厂商、机房、标签、业务线用名称表示，合同用合同号(contract)表示，宿主机用 SN (hosted_on)表示。
+
+    数据按块写入，每块一个事务；每提交一块就把已处理的行数写入检查点文件，
+    中途失败后再次执行同样的命令，会从检查点之后继续，已经存在的SN也会被跳过。
+    资产名称同样唯一，与已有资产重名的行改用SN作为名称。
+    """
+    help = '从 CSV 或 NDJSON 文件批量导入资产、组件和关联数据'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV 或 NDJSON 文件')
+        parser.add_argument('--format', choices=['csv', 'ndjson'],
+                            default=None, help='默认根据扩展名判断')
+        parser.add_argument('--chunk-size', type=int, default=1000,
+                            help='每个事务写入的资产数')
+        parser.add_argument('--checkpoint', default=None,
+                            help='检查点文件，默认为 <path>.checkpoint')
+        parser.add_argument('--restart', action='store_true',
+                            help='忽略检查点，从头开始导入')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        if not os.path.exists(path):
+            raise CommandError('文件不存在: %s' % path)
+        fmt = options['format'] or ('csv' if path.endswith('.csv') else
+                                    'ndjson')
+        checkpoint = options['checkpoint'] or path + '.checkpoint'
+        skip = 0 if options['restart'] else self.read_checkpoint(checkpoint)
+        if skip:
+            self.stdout.write('从检查点继续，跳过前 %d 行' % skip)
+
+        self.manufacturers = ManufacturerLookupMap()
+        self.idcs = LookupMap(models.IDC)
+        self.tags = LookupMap(models.Tag)
+        self.business_units = BusinessUnitLookupMap(models.BusinessUnit)
+        self.contracts = LookupMap(models.Contract, field='sn')
+        self.stats = {
+            'created': 0,
+            'skipped': 0,
+            'invalid': 0,
+            'renamed': 0,
+            'duplicate_names': 0,
+            'unresolved_hosts': 0
+        }
+
+        started = time.time()
+        processed = skip
+        chunk = []
+        with open(path, encoding='utf-8', newline='') as f:
+            for index, row in enumerate(self.read_rows(f, fmt)):
+                if index < skip:
+                    continue
+                chunk.append(row)
+                if len(chunk) >= options['chunk_size']:
+                    processed += self.flush(chunk)
+                    self.write_checkpoint(checkpoint, processed)
+                    self.report_progress(processed - skip, started)
+                    chunk = []
+        if chunk:
+            processed += self.flush(chunk)
+            self.write_checkpoint(checkpoint, processed)
+        self.report_progress(processed - skip, started)
+        # 批量写入不会触发信号，这里统一让资产列表和统计缓存失效
+        asset_cache.bump_asset_versions([])
+        if os.path.exists(checkpoint):
+            os.remove(checkpoint)
+        self.stdout.write(
+            '导入完成: 新增 %(created)d, 已存在跳过 %(skipped)d, 缺少SN %(invalid)d, '
+            '名称重复改用SN %(renamed)d, 名称重复跳过 %(duplicate_names)d, '
+            '未找到宿主机 %(unresolved_hosts)d' % self.stats)
+
+    @staticmethod
+    def read_rows(f, fmt):
+        if fmt == 'csv':
+            for row in csv.DictReader(f):
+                row = {key: clean(value) for key, value in row.items()}
+                if row.get('tags'):
+                    row['tags'] = [t for t in row['tags'].split(';') if t]
+                yield row
+        else:
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
+
+    @staticmethod
+    def read_checkpoint(checkpoint):
+        if not os.path.exists(checkpoint):
+            return 0
+        with open(checkpoint) as f:
+            return int(f.read().strip() or 0)
+
+    @staticmethod
+    def write_checkpoint(checkpoint, processed):
+        tmp = checkpoint + '.tmp'
+        with open(tmp, 'w') as f:
+            f.write(str(processed))
+        os.replace(tmp, checkpoint)
+
+    def report_progress(self, rows, started):
+        elapsed = max(time.time() - started, 1e-6)
+        self.stdout.write('已处理 %d 行, 新增 %d, 用时 %.1fs, %.0f 行/秒' %
+                          (rows, self.stats['created'], elapsed,
+                           rows / elapsed))
+
+    def resolve_lookups(self, rows):
+        """ 收集这一块中所有用到的名称，缺失的一次性创建 """
+        manufacturers, idcs, tags, units, contracts = {}, {}, {}, {}, {}
+        for row in rows:
+            manufacturers[clean(row.get('manufacturer'))] = {}
+            idcs[clean(row.get('idc'))] = {}
+            units[clean(row.get('business_unit'))] = {}
+            for tag in row.get('tags') or []:
+                tags[clean(tag)] = {}
+            contract = clean(row.get('contract'))
+            if contract:
+                contracts[contract] = {
+                    'name': clean(row.get('contract_name')) or contract,
+                    'price': clean(row.get('contract_price')) or 0,
+                    'start_day': parse_date(row.get('contract_start_day')
+                                            or '') or None,
+                    'end_day': parse_date(row.get('contract_end_day') or '')
+                    or None,
+                    'license_num': clean(row.get('contract_license_num')),
+                }
+        self.manufacturers.ensure(manufacturers)
+        self.idcs.ensure(idcs)
+        self.tags.ensure(tags)
+        self.business_units.ensure(units)
+        self.contracts.ensure(contracts)
+
+    def build_asset(self, row):
+        asset = models.Asset(
+            name=row['name'],
+            sn=row['sn'],
+            manufacturer_id=self.manufacturers.get(
+                clean(row.get('manufacturer'))),
+            idc_id=self.idcs.get(clean(row.get('idc'))),
+            business_unit_id=self.business_units.get(
+                clean(row.get('business_unit'))),
+            contract_id=self.contracts.get(clean(row.get('contract'))))
+        for field in ASSET_FIELDS:
+            value = clean(row.get(field))
+            if value is not None:
+                setattr(asset, field, value)
+        for field in ASSET_DATE_FIELDS:
+            value = clean(row.get(field))
+            if value:
+                setattr(asset, field, parse_date(value))
+        return asset
+
+    def flush(self, rows):
+        """ 在一个事务中写入一块数据，返回处理的行数 """
+        total = len(rows)
+        for row in rows:
+            # NDJSON 中的值没有经过 clean，SN 和名称两边的空白会导致重复检查失效
+            row['sn'] = clean(row.get('sn'))
+            row['name'] = clean(row.get('name'))
+            # 空的资产类型按服务器导入，Asset 和 Server 记录都按清理之后的值判断
+            row['asset_type'] = clean(row.get('asset_type')) or 'server'
+        rows = [row for row in rows if row['sn']]
+        self.stats['invalid'] += total - len(rows)
+        with transaction.atomic():
+            self.resolve_lookups(rows)
+            sns = [row['sn'] for row in rows]
+            existing = set(
+                models.Asset.objects.filter(sn__in=sns).values_list('sn',
+                                                                    flat=True))
+            new_rows = []
+            seen = set()
+            for row in rows:
+                if row['sn'] in existing or row['sn'] in seen:
+                    continue
+                seen.add(row['sn'])
+                new_rows.append(row)
+            self.stats['skipped'] += len(rows) - len(new_rows)
+            new_rows = self.dedupe_names(new_rows)
+            if not new_rows:
+                return total
+
+            models.Asset.objects.bulk_create(
+                [self.build_asset(row) for row in new_rows])
+            # MySQL 的 bulk_create 不返回主键，按SN一次取回
+            asset_ids = dict(
+                models.Asset.objects.filter(
+                    sn__in=[row['sn'] for row in new_rows]).values_list(
+                        'sn', 'id'))
+            self.create_related(new_rows, asset_ids)
+            self.stats['created'] += len(new_rows)
+        return total
+
+    def dedupe_names(self, rows):
+        """ 资产名称也是唯一的: 与已有资产或者前面的行重名时改用SN作为名称，SN 也被占用时跳过这一行 """
+        candidates = [row['name'] for row in rows if row['name']]
+        candidates.extend(row['sn'] for row in rows)
+        names = set(
+            models.Asset.objects.filter(name__in=candidates).values_list(
+                'name', flat=True))
+        kept = []
+        for row in rows:
+            name = row['name'] or row['sn']
+            if name in names and name != row['sn']:
+                name = row['sn']
+                self.stats['renamed'] += 1
+            if name in names:
+                self.stats['duplicate_names'] += 1
+                continue
+            names.add(name)
+            row['name'] = name
+            kept.append(row)
+        return kept
+
+    def create_related(self, rows, asset_ids):
+        servers, cpus, rams, disks, nics, tags = [], [], [], [], [], []
+        guests = {}
+        for row in rows:
+            asset_id = asset_ids[row['sn']]
+            if row['asset_type'] == 'server':
+                server = models.Server(asset_id=asset_id, created_by='manual')
+                for field in SERVER_FIELDS:
+                    value = clean(row.get(field))
+                    if value is not None:
+                        setattr(server, field, value)
+                # bulk_create 不调用 save，手动计算系统版本键
+                server.os_key = server.compute_os_key()
+                host_sn = clean(row.get('hosted_on'))
+                if host_sn:
+                    guests.setdefault(host_sn, []).append(asset_id)
+                servers.append(server)
+            if clean(row.get('cpu_model')):
+                cpus.append(
+                    models.CPU(asset_id=asset_id,
+                               cpu_model=clean(row['cpu_model']),
+                               cpu_count=clean(row.get('cpu_count')) or 1,
+                               cpu_core_count=clean(row.get('cpu_core_count'))
+                               or 1,
+                               cpu_thread_count=clean(
+                                   row.get('cpu_thread_count')) or 1,
+                               cpu_frequency=clean(row.get('cpu_frequency'))
+                               or 0))
+            for item in row.get('RAM') or []:
+                rams.append(
+                    models.RAM(asset_id=asset_id,
+                               **{f: clean(item.get(f))
+                                  for f in RAM_FIELDS}))
+            for item in row.get('physical_disk_driver') or []:
+                disks.append(
+                    models.Disk(asset_id=asset_id,
+                                **{
+                                    f: clean(item.get(f))
+                                    for f in DISK_FIELDS if clean(item.get(f))
+                                    is not None
+                                }))
+            for item in row.get('nic') or []:
+                nic = models.NIC(asset_id=asset_id,
+                                 **{f: clean(item.get(f))
+                                    for f in NIC_FIELDS})
+                nic.id_address = first(item.get('ip_address'))
+                nic.net_mask = first(item.get('net_mask'))
+                nics.append(nic)
+            for tag in row.get('tags') or []:
+                tags.append(
+                    models.Asset.tags.through(asset_id=asset_id,
+                                              tag_id=self.tags.get(
+                                                  clean(tag))))
+
+        models.Server.objects.bulk_create(servers)
+        if servers:
+            licenses.invalidate()
+        self.link_guests(guests)
+        models.CPU.objects.bulk_create(cpus)
+        models.RAM.objects.bulk_create(rams)
+        models.Disk.objects.bulk_create(disks)
+        models.NIC.objects.bulk_create(nics)
+        models.Asset.tags.through.objects.bulk_create(tags,
+                                                      ignore_conflicts=True)
+
+    def link_guests(self, guests):
+        """ 宿主机可能就在同一块数据中，所以在服务器写入之后再关联，每台宿主机一条 UPDATE """
+        if not guests:
+            return
+        hosts = dict(
+            models.Server.objects.filter(
+                asset__sn__in=list(guests)).values_list('asset__sn', 'id'))
+        for host_sn, guest_asset_ids in guests.items():
+            if host_sn not in hosts:
+                self.stats['unresolved_hosts'] += len(guest_asset_ids)
+                continue
+            models.Server.objects.filter(
+                asset_id__in=guest_asset_ids).update(
+                    hosted_on_id=hosts[host_sn])
@@ -0,0 +1,89 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from assets import asset_cache
+from assets import models
+from assets import vendors
+
+
+class Command(BaseCommand):
+    """ 按厂商别名字典整理已有数据
+    python manage.py normalize_vendors                       # 只统计需要修改的数量
+    python manage.py normalize_vendors --apply
+    python manage.py normalize_vendors --apply --delete-duplicates
+
+    1. 规范化键相同或者登记为别名的重复厂商（例如 'Dell Inc.' 和 'DELL'），资产和别名改为指向标准厂商，
+       每个重复厂商一条 UPDATE；--delete-duplicates 同时删除重复的厂商记录。
+    2. 待审批区中的厂商换成标准名称，型号合并多余的空白；服务器型号同样处理。
+       按不同的取值逐个修改，每个取值一条 UPDATE，不逐行处理。
+    厂商为空的资产在下一次汇报时由汇报流程补上。
+    """
+    help = '按厂商别名字典合并重复厂商，并规范待审批区和服务器中的厂商与型号'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--apply', action='store_true',
+                            help='实际修改数据, 默认只统计')
+        parser.add_argument('--delete-duplicates', action='store_true',
+                            help='合并之后删除重复的厂商记录')
+
+    def handle(self, *args, **options):
+        apply = options['apply']
+        vendors.resolver.reload()
+        with transaction.atomic():
+            self.merge_duplicates(apply, options['delete_duplicates'])
+            self.normalize_values(models.NewAssetApprovalZone, 'manufacturer',
+                                  vendors.resolver.canonical, apply)
+            self.normalize_values(models.NewAssetApprovalZone, 'model',
+                                  vendors.clean_model, apply)
+            self.normalize_values(models.Server, 'model', vendors.clean_model,
+                                  apply)
+        if not apply:
+            self.stdout.write('以上为统计结果, 加上 --apply 实际修改')
+
+    def merge_duplicates(self, apply, delete):
+        duplicates = {}
+        for manufacturer_id, name in models.Manufacturer.objects.values_list(
+                'id', 'name'):
+            target = vendors.resolver.resolve(name)
+            if target is not None and target != manufacturer_id:
+                duplicates[manufacturer_id] = (name, target)
+        for manufacturer_id, (name, target) in sorted(duplicates.items()):
+            assets = models.Asset.objects.filter(
+                manufacturer_id=manufacturer_id)
+            asset_ids = list(assets.values_list('id', flat=True))
+            self.stdout.write(
+                '重复厂商 %s -> %s: %d 个资产' %
+                (name, vendors.resolver.canonical(name), len(asset_ids)))
+            if not apply:
+                continue
+            assets.update(manufacturer_id=target)
+            models.ManufacturerAlias.objects.filter(
+                manufacturer_id=manufacturer_id).update(manufacturer_id=target)
+            # 批量修改不会触发信号，手动让资产缓存失效
+            asset_cache.bump_asset_versions(asset_ids)
+        if apply and delete and duplicates:
+            models.Manufacturer.objects.filter(
+                id__in=list(duplicates)).delete()
+            self.stdout.write('已删除 %d 个重复厂商' % len(duplicates))
+        if apply and duplicates:
+            vendors.invalidate()
+
+    def normalize_values(self, model, field, normalize, apply):
+        """ 取出字段的全部不同取值，规范化之后有变化的取值各用一条 UPDATE 修改 """
+        rows = 0
+        values = model.objects.exclude(**{
+            field + '__isnull': True
+        }).order_by().values_list(field, flat=True).distinct()
+        max_length = model._meta.get_field(field).max_length
+        for value in list(values):
+            normalized = normalize(value)
+            if normalized:
+                normalized = normalized[:max_length]
+            if normalized == value:
+                continue
+            queryset = model.objects.filter(**{field: value})
+            if apply:
+                rows += queryset.update(**{field: normalized})
+            else:
+                rows += queryset.count()
+        self.stdout.write('%s.%s: %d 条需要规范化' %
+                          (model._meta.object_name, field, rows))
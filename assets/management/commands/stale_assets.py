@@ -0,0 +1,55 @@
+import datetime
+from itertools import groupby
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+from django.utils import timezone
+from assets import models
+
+
+class Command(BaseCommand):
+    """ 长时间没有汇报的在线资产，按机房分组
+    python manage.py stale_assets --days 3            每个机房的数量和资产列表
+    python manage.py stale_assets --days 3 --summary  只输出每个机房的数量
+    只执行一次查询: 在 (status, last_seen) 索引上做范围扫描，按机房排序后分组。
+    last_seen 由各个 web 进程的心跳缓冲写入，最多比实际汇报晚 HEARTBEAT_FLUSH_INTERVAL 秒。
+    """
+    help = '列出超过指定天数没有汇报的在线资产，按机房分组'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=float, default=3)
+        parser.add_argument('--status', type=int, default=0,
+                            help='资产状态, 默认只检查在线(0)资产')
+        parser.add_argument('--never', action='store_true',
+                            help='同时列出从未汇报过的资产')
+        parser.add_argument('--summary', action='store_true',
+                            help='只输出每个机房的数量')
+
+    def handle(self, *args, **options):
+        if options['days'] <= 0:
+            raise CommandError('--days 必须大于 0')
+        before = timezone.now() - datetime.timedelta(days=options['days'])
+        condition = Q(last_seen__lt=before)
+        if options['never']:
+            condition |= Q(last_seen__isnull=True)
+        rows = models.Asset.objects.filter(
+            condition, status=options['status']).order_by(
+                'idc__name', 'last_seen').values_list('idc__name', 'sn',
+                                                      'name', 'last_seen')
+
+        total = 0
+        for idc, assets in groupby(rows, key=lambda row: row[0]):
+            assets = list(assets)
+            total += len(assets)
+            self.stdout.write('%s: %d' % (idc or '未分配机房', len(assets)))
+            if options['summary']:
+                continue
+            for _, sn, name, last_seen in assets:
+                self.stdout.write('    %s\t%s\t%s' % (
+                    sn, name,
+                    timezone.localtime(last_seen).strftime('%Y-%m-%d %H:%M:%S')
+                    if last_seen else '从未汇报'))
+        self.stdout.write('共 %d 个资产超过 %s 天没有汇报 (截止 %s)' %
+                          (total, options['days'],
+                           timezone.localtime(before).strftime(
+                               '%Y-%m-%d %H:%M:%S')))
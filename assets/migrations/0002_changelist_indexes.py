@@ -0,0 +1,25 @@
+# Generated by Django 2.2.28 on 2026-10-19 18:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('assets', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='asset',
+            index=models.Index(fields=['asset_type', 'status'], name='assets_asse_asset_t_be4ea2_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='asset',
+            index=models.Index(fields=['status'], name='assets_asse_status_347ce9_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='asset',
+            index=models.Index(fields=['c_time'], name='assets_asse_c_time_832cc5_idx'),
+        ),
+    ]
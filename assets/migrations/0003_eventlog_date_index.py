@@ -0,0 +1,17 @@
+# Generated by Django 2.2.28 on 2026-10-19 18:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('assets', '0002_changelist_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='eventlog',
+            index=models.Index(fields=['date'], name='assets_even_date_4c1a01_idx'),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 2.2.28 on 2026-10-19 18:14
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('assets', '0003_eventlog_date_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReportBlob',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('digest', models.CharField(max_length=64, unique=True, verbose_name='内容摘要')),
+                ('data', models.BinaryField(verbose_name='压缩数据')),
+                ('size', models.PositiveIntegerField(default=0, verbose_name='原始大小(字节)')),
+                ('c_time', models.DateTimeField(auto_now_add=True, verbose_name='首次出现时间')),
+            ],
+            options={
+                'verbose_name': '汇报数据版本',
+                'verbose_name_plural': '汇报数据版本',
+            },
+        ),
+        migrations.CreateModel(
+            name='ReportVersion',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sn', models.CharField(max_length=128, verbose_name='资产SN号')),
+                ('reported_at', models.DateTimeField(verbose_name='汇报时间')),
+                ('blob', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='assets.ReportBlob', verbose_name='数据版本')),
+            ],
+            options={
+                'verbose_name': '汇报数据时间线',
+                'verbose_name_plural': '汇报数据时间线',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='reportversion',
+            index=models.Index(fields=['sn', 'reported_at'], name='assets_repo_sn_b0a078_idx'),
+        ),
+    ]
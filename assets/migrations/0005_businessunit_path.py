@@ -0,0 +1,55 @@
+# Generated by Django 2.2.28 on 2026-10-19 18:16
+
+from django.db import migrations, models
+
+
+def fill_names_and_paths(apps, schema_editor):
+    """ 旧数据没有名称的业务线按 id 补一个名称，再从根节点向下计算全部路径，与 BusinessUnit.rebuild_paths 相同 """
+    BusinessUnit = apps.get_model('assets', 'BusinessUnit')
+    using = schema_editor.connection.alias
+    units = BusinessUnit.objects.using(using)
+    for pk in units.filter(name__isnull=True).values_list('pk', flat=True):
+        units.filter(pk=pk).update(name='业务线%d' % pk)
+
+    children = {}
+    for pk, parent in units.values_list('pk', 'parent_unit_id'):
+        children.setdefault(parent, []).append(pk)
+    rows = []
+    stack = [(pk, '/', 0) for pk in children.get(None, [])]
+    while stack:
+        pk, parent_path, depth = stack.pop()
+        path = '%s%d/' % (parent_path, pk)
+        rows.append(BusinessUnit(pk=pk, path=path, depth=depth))
+        stack.extend((child, path, depth + 1) for child in children.get(pk, []))
+    units.bulk_update(rows, ['path', 'depth'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('assets', '0004_report_history'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='businessunit',
+            name='name',
+            field=models.CharField(max_length=64, null=True, verbose_name='业务线名称'),
+        ),
+        migrations.AddField(
+            model_name='businessunit',
+            name='depth',
+            field=models.PositiveSmallIntegerField(default=0, editable=False, verbose_name='层级深度'),
+        ),
+        migrations.AddField(
+            model_name='businessunit',
+            name='path',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=255, verbose_name='层级路径'),
+        ),
+        migrations.RunPython(fill_names_and_paths, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='businessunit',
+            name='name',
+            field=models.CharField(max_length=64, unique=True, verbose_name='业务线名称'),
+        ),
+    ]
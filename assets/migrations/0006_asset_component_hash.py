@@ -0,0 +1,18 @@
+# Generated by Django 2.2.28 on 2026-10-19 18:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('assets', '0005_businessunit_path'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='asset',
+            name='component_hash',
+            field=models.CharField(blank=True, default='', editable=False, max_length=40, verbose_name='组件摘要'),
+        ),
+    ]
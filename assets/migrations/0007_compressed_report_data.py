@@ -0,0 +1,24 @@
+# Generated by Django 2.2.28 on 2026-10-19 18:23
+
+import assets.fields
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('assets', '0006_asset_component_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='newassetapprovalzone',
+            name='compressed_data',
+            field=assets.fields.CompressedJSONField(blank=True, null=True, verbose_name='资产数据(压缩)'),
+        ),
+        migrations.AlterField(
+            model_name='newassetapprovalzone',
+            name='data',
+            field=models.TextField(blank=True, default='', verbose_name='资产数据'),
+        ),
+    ]
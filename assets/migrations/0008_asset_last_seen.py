@@ -0,0 +1,22 @@
+# Generated by Django 2.2.28 on 2026-10-19 18:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('assets', '0007_compressed_report_data'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='asset',
+            name='last_seen',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='最近汇报'),
+        ),
+        migrations.AddIndex(
+            model_name='asset',
+            index=models.Index(fields=['status', 'last_seen'], name='assets_asse_status_d7c8d4_idx'),
+        ),
+    ]
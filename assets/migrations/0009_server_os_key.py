@@ -0,0 +1,50 @@
+# Generated by Django 2.2.28 on 2026-10-19 18:36
+
+import re
+
+from django.db import migrations, models
+
+
+_NON_ALNUM = re.compile(r'[^0-9a-z]+')
+
+
+def license_key(*parts):
+    """ 与 assets.models.license_key 相同，迁移中不引用会变化的模型代码 """
+    text = ' '.join(part for part in parts if part)
+    return _NON_ALNUM.sub(' ', text.lower()).strip()[:128]
+
+
+def fill_os_keys(apps, schema_editor):
+    """ 为已有的服务器计算 os_key，按 id 分块读取，每块一次 bulk_update """
+    Server = apps.get_model('assets', 'Server')
+    servers = Server.objects.using(schema_editor.connection.alias)
+    last_id = 0
+    while True:
+        rows = list(
+            servers.filter(id__gt=last_id).order_by('id').values_list(
+                'id', 'os_release', 'os_distribution', 'os_type')[:1000])
+        if not rows:
+            break
+        last_id = rows[-1][0]
+        servers.bulk_update([
+            Server(id=pk,
+                   os_key=license_key(release) if release else license_key(
+                       distribution, os_type))
+            for pk, release, distribution, os_type in rows
+        ], ['os_key'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('assets', '0008_asset_last_seen'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='server',
+            name='os_key',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=128, verbose_name='系统版本键'),
+        ),
+        migrations.RunPython(fill_os_keys, migrations.RunPython.noop),
+    ]
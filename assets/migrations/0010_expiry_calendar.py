@@ -0,0 +1,52 @@
+# Generated by Django 2.2.28 on 2026-10-19 18:38
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('assets', '0009_server_os_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExpiryBucket',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('asset', '资产过保'), ('contract', '合同到期')], max_length=16, verbose_name='类型')),
+                ('month', models.DateField(verbose_name='月份')),
+                ('count', models.PositiveIntegerField(default=0, verbose_name='到期数量')),
+                ('asset_count', models.PositiveIntegerField(default=0, verbose_name='涉及资产数')),
+                ('license_num', models.PositiveIntegerField(default=0, verbose_name='license数量')),
+                ('refreshed_at', models.DateTimeField(verbose_name='统计时间')),
+            ],
+            options={
+                'verbose_name': '到期日历',
+                'verbose_name_plural': '到期日历',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='asset',
+            index=models.Index(fields=['expire_day'], name='assets_asse_expire__ed6d81_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='contract',
+            index=models.Index(fields=['end_day'], name='assets_cont_end_day_5c6ab9_idx'),
+        ),
+        migrations.AddField(
+            model_name='expirybucket',
+            name='business_unit',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='assets.BusinessUnit', verbose_name='所属业务线'),
+        ),
+        migrations.AddField(
+            model_name='expirybucket',
+            name='idc',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='assets.IDC', verbose_name='所在机房'),
+        ),
+        migrations.AddIndex(
+            model_name='expirybucket',
+            index=models.Index(fields=['month', 'kind'], name='assets_expi_month_965e75_idx'),
+        ),
+    ]
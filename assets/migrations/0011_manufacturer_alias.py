@@ -0,0 +1,27 @@
+# Generated by Django 2.2.28 on 2026-10-19 18:47
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('assets', '0010_expiry_calendar'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ManufacturerAlias',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=128, verbose_name='别名')),
+                ('key', models.CharField(editable=False, max_length=128, unique=True, verbose_name='规范化键')),
+                ('manufacturer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='aliases', to='assets.Manufacturer', verbose_name='厂商')),
+            ],
+            options={
+                'verbose_name': '厂商别名',
+                'verbose_name_plural': '厂商别名',
+            },
+        ),
+    ]
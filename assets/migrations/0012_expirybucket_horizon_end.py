@@ -0,0 +1,18 @@
+# Generated by Django 2.2.28 on 2026-10-19 19:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('assets', '0011_manufacturer_alias'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='expirybucket',
+            name='horizon_end',
+            field=models.DateField(blank=True, null=True, verbose_name='覆盖截止月份'),
+        ),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 2.2.28 on 2026-10-19 20:10
+
+import json
+
+from django.db import migrations
+
+# 每批转存的记录数，每批一次 bulk_update
+CHUNK_SIZE = 500
+
+
+def compress_report_data(apps, schema_editor):
+    """ 把明文 JSON 的汇报数据转存到压缩字段并清空 data，按 id 分块处理 """
+    Zone = apps.get_model('assets', 'NewAssetApprovalZone')
+    zones = Zone.objects.using(schema_editor.connection.alias).filter(
+        compressed_data__isnull=True).exclude(data='').order_by('id')
+    last_id = 0
+    while True:
+        rows = list(
+            zones.filter(id__gt=last_id).values_list('id',
+                                                     'data')[:CHUNK_SIZE])
+        if not rows:
+            break
+        last_id = rows[-1][0]
+        Zone.objects.using(schema_editor.connection.alias).bulk_update([
+            Zone(id=pk, data='', compressed_data=json.loads(data))
+            for pk, data in rows
+        ], ['data', 'compressed_data'])
+
+
+def decompress_report_data(apps, schema_editor):
+    """ 回滚: 把压缩字段中的汇报数据写回明文 data，按 id 分块处理 """
+    Zone = apps.get_model('assets', 'NewAssetApprovalZone')
+    zones = Zone.objects.using(schema_editor.connection.alias).filter(
+        compressed_data__isnull=False).order_by('id')
+    last_id = 0
+    while True:
+        rows = list(
+            zones.filter(id__gt=last_id).values_list(
+                'id', 'compressed_data')[:CHUNK_SIZE])
+        if not rows:
+            break
+        last_id = rows[-1][0]
+        Zone.objects.using(schema_editor.connection.alias).bulk_update([
+            Zone(id=pk,
+                 data=json.dumps(data, ensure_ascii=False),
+                 compressed_data=None) for pk, data in rows
+        ], ['data', 'compressed_data'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('assets', '0012_expirybucket_horizon_end'),
+    ]
+
+    operations = [
+        migrations.RunPython(compress_report_data, decompress_report_data),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 2.2.28 on 2026-10-19 20:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('assets', '0013_compress_report_data'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='disk',
+            index=models.Index(fields=['interface_type'], name='assets_disk_interfa_b57e1f_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='eventlog',
+            index=models.Index(fields=['event_type', 'date'], name='assets_even_event_t_d5c9e0_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='server',
+            index=models.Index(fields=['sub_asset_type'], name='assets_serv_sub_ass_e6a308_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='server',
+            index=models.Index(fields=['created_by'], name='assets_serv_created_abb84b_idx'),
+        ),
+    ]
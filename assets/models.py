@@ -1,9 +1,45 @@
+import json
+import re
+
 from django.db import models
+from django.db.models import Count, F, Value
+from django.db.models.functions import Concat, Substr
+from .fields import CompressedJSONField
 
 # Create your models here.
 from django.contrib.auth.models import User
 """ 导入 django.contrib.auto.models 内置的 User 表，作为我们 CMDB 项目的用户表，用于保存管理员和批准人员的信息；"""
 
+_NON_ALNUM = re.compile(r'[^0-9a-z]+')
+
+
+def license_key(*parts):
+    """ 软件版本的规范化键: 小写，非字母数字的字符合并为一个空格
+    例如 'CentOS Linux release 7.6.1810 (Core)' -> 'centos linux release 7 6 1810 core'，
+    服务器的操作系统版本与 Software.version 按这个键精确匹配，键不相等的版本不会互相计数。
+    """
+    text = ' '.join(part for part in parts if part)
+    return _NON_ALNUM.sub(' ', text.lower()).strip()[:128]
+
+
+_NON_WORD = re.compile(r'[\W_]+')
+# 厂商名称末尾的公司类型后缀，比较时去掉
+VENDOR_SUFFIXES = ('inc', 'incorporated', 'corp', 'corporation', 'co', 'ltd',
+                   'limited', 'llc', 'company', 'gmbh', 'ag', 'sa', 'plc')
+
+
+def vendor_key(name):
+    """ 厂商名称的规范化键: 小写，标点和空白合并为一个空格，去掉末尾的公司类型后缀
+    例如 'Dell Inc.'、'DELL'、'Dell Inc' 都得到 'dell'；中文名称原样保留。
+    name 来自客户端汇报，不是字符串时按字符串处理。
+    """
+    if name is None:
+        name = ''
+    words = _NON_WORD.sub(' ', str(name).lower()).split()
+    while len(words) > 1 and words[-1] in VENDOR_SUFFIXES:
+        words.pop()
+    return ' '.join(words)[:128]
+
 
 class Asset(models.Model):
     """ 所有资产的共有数据表
@@ -85,6 +121,17 @@ class Asset(models.Model):
                                     on_delete=models.SET_NULL)
 
     memo = models.TextField(null=True, blank=True, verbose_name='备注')
+    # 最近一次汇报中全部组件的内容摘要，硬件没有变化时汇报只需要比较这一个值
+    component_hash = models.CharField(max_length=40,
+                                      blank=True,
+                                      default='',
+                                      editable=False,
+                                      verbose_name='组件摘要')
+    # 最近一次汇报的时间，由 heartbeat 模块定期批量写入，不随每次汇报单独更新
+    last_seen = models.DateTimeField(null=True,
+                                     blank=True,
+                                     editable=False,
+                                     verbose_name='最近汇报')
     c_time = models.DateTimeField(auto_now_add=True, verbose_name='批准日期')
     m_time = models.DateTimeField(auto_now=True, verbose_name='更新日期')
 
@@ -96,6 +143,16 @@ class Asset(models.Model):
         verbose_name = '资产总表'  # 设置模型对象的直观、人类可读的名称
         verbose_name_plural = verbose_name
         ordering = ['-c_time']  # 指定该模型生成的所有对象的排序方式
+        # 后台列表页的过滤和排序字段，资产量很大时必须有索引
+        indexes = [
+            models.Index(fields=['asset_type', 'status']),
+            models.Index(fields=['status']),
+            models.Index(fields=['c_time']),
+            # 按状态和最近汇报时间查找长时间未汇报的资产
+            models.Index(fields=['status', 'last_seen']),
+            # 过保日历按日期范围扫描
+            models.Index(fields=['expire_day']),
+        ]
 
 
 class Server(models.Model):
@@ -155,15 +212,48 @@ class Server(models.Model):
                                   null=True,
                                   blank=True,
                                   verbose_name='操作系统版本')
+    # 操作系统版本的规范化键，用于按 Software.version 统计授权使用量，保存时自动计算
+    os_key = models.CharField(max_length=128,
+                              blank=True,
+                              default='',
+                              db_index=True,
+                              editable=False,
+                              verbose_name='系统版本键')
 
     def __str__(self):
         return '%s--%s--%s <sn:%s>' % (self.asset.name,
-                                       self.get_sub_asset_type_dispaly(),
+                                       self.get_sub_asset_type_display(),
                                        self.model, self.asset.sn)
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # 记录读出时的版本键，保存时据此增量调整授权统计
+        if 'os_key' in field_names:
+            instance._loaded_os_key = instance.os_key
+        return instance
+
+    def compute_os_key(self):
+        """ 优先使用具体版本，没有时使用发行商和系统类型 """
+        if self.os_release:
+            return license_key(self.os_release)
+        return license_key(self.os_distribution, self.os_type)
+
+    def save(self, *args, **kwargs):
+        self.os_key = self.compute_os_key()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'os_key' not in update_fields:
+            kwargs['update_fields'] = list(update_fields) + ['os_key']
+        super().save(*args, **kwargs)
+
     class Meta:
         verbose_name = '服务器'
         verbose_name_plural = verbose_name
+        # 后台列表页的过滤字段
+        indexes = [
+            models.Index(fields=['sub_asset_type']),
+            models.Index(fields=['created_by']),
+        ]
 
 
 class SecurityDevice(models.Model):
@@ -284,7 +374,11 @@ class Software(models.Model):
                                verbose_name='软件/系统版本')
 
     def __str__(self):
-        return '%s--%s' % (self.get_sub_asset_type_dispaly(), self.version())
+        return '%s--%s' % (self.get_sub_asset_type_display(), self.version)
+
+    @property
+    def version_key(self):
+        return license_key(self.version)
 
     class Meta:
         verbose_name = '软件/系统'
@@ -307,7 +401,7 @@ class CPU(models.Model):
                                         verbose_name='CPU主频(GHZ)')
 
     def __str__(self):
-        return '%s: %s' % (self.asset.name, self.cpu.model)
+        return '%s: %s' % (self.asset.name, self.cpu_model)
 
     class Meta:
         verbose_name = 'CPU'
@@ -329,7 +423,7 @@ class RAM(models.Model):
 
     def __str__(self):
         return '%s: %s :%s :%s :%s' % (self.asset.name, self.model, self.slot,
-                                       self.capacity, self.ram_frequency)
+                                       self.capacity, self.frequency)
 
     class Meta:
         verbose_name = '内存'
@@ -373,13 +467,15 @@ class Disk(models.Model):
                                      default='SATA')
 
     def __str__(self):
-        return '%s: %s: %s: %sGB: %s ' % (self.asset.name, self.model,
-                                          self.slot, self.capacity)
+        return '%s: %s: %s: %sGB ' % (self.asset.name, self.model,
+                                      self.slot, self.capacity)
 
     class Meta:
         verbose_name = '硬盘'
         verbose_name_plural = verbose_name
         unique_together = ('asset', 'sn')
+        # 后台列表页的过滤字段
+        indexes = [models.Index(fields=['interface_type'])]
 
 
 class NIC(models.Model):
@@ -400,7 +496,7 @@ class NIC(models.Model):
                                     null=True)
 
     def __str__(self):
-        return '%s: %s: %s: %s ' % (self.asset.name, self.model, self.mac)
+        return '%s: %s: %s ' % (self.asset.name, self.model, self.mac)
 
     class Meta:
         verbose_name = '网卡'
@@ -446,9 +542,43 @@ class Manufacturer(models.Model):
         verbose_name_plural = verbose_name
 
 
+class ManufacturerAlias(models.Model):
+    """ 厂商别名
+    客户端汇报的厂商是自由文本，同一个厂商有多种写法；规范化键相同的写法自动归到同一个厂商，
+    规范化之后仍然不同的写法（例如 HP 和 Hewlett-Packard）在这里登记。key 保存时自动计算。
+    """
+    name = models.CharField(max_length=128, verbose_name='别名')
+    key = models.CharField(max_length=128,
+                           unique=True,
+                           editable=False,
+                           verbose_name='规范化键')
+    manufacturer = models.ForeignKey('Manufacturer',
+                                     related_name='aliases',
+                                     verbose_name='厂商',
+                                     on_delete=models.CASCADE)
+
+    def __str__(self):
+        return '%s -> %s' % (self.name, self.manufacturer)
+
+    def save(self, *args, **kwargs):
+        self.key = vendor_key(self.name)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'key' not in update_fields:
+            kwargs['update_fields'] = list(update_fields) + ['key']
+        super().save(*args, **kwargs)
+
+    class Meta:
+        verbose_name = '厂商别名'
+        verbose_name_plural = verbose_name
+
+
 class BusinessUnit(models.Model):
     """ 业务线
-    业务线可以有子业务线，因此使用一个外键关联自身模型 """
+    业务线可以有子业务线，因此使用一个外键关联自身模型；
+    path 是物化路径，形如 /1/5/12/，由根节点到本节点的 id 依次组成，保存、移动和删除时自动维护，
+    这样 "某条业务线及其全部下级" 只需要一条 path LIKE '/1/5/%' 的查询，不用逐层递归。
+    """
+    name = models.CharField(max_length=64, unique=True, verbose_name='业务线名称')
     parent_unit = models.ForeignKey('self',
                                     blank=True,
                                     null=True,
@@ -462,10 +592,106 @@ class BusinessUnit(models.Model):
                             blank=True,
                             null=True,
                             verbose_name='备注')
+    path = models.CharField(max_length=255,
+                            blank=True,
+                            default='',
+                            db_index=True,
+                            editable=False,
+                            verbose_name='层级路径')
+    depth = models.PositiveSmallIntegerField(default=0,
+                                             editable=False,
+                                             verbose_name='层级深度')
 
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        """ 保存时重新计算自己的路径，如果是移动操作，再用一条 UPDATE 改写整棵子树的路径 """
+        parent_path = '/'
+        if self.parent_unit_id:
+            parent_path = BusinessUnit.objects.filter(
+                pk=self.parent_unit_id).values_list('path', flat=True).get()
+        if self.pk is None:
+            # 新建时还没有 id，插入之后再补写路径
+            super().save(*args, **kwargs)
+            self.path = '%s%d/' % (parent_path, self.pk)
+            self.depth = self.path.count('/') - 2
+            BusinessUnit.objects.filter(pk=self.pk).update(path=self.path,
+                                                           depth=self.depth)
+            return
+
+        old_path = BusinessUnit.objects.filter(pk=self.pk).values_list(
+            'path', flat=True).first() or ''
+        if old_path and parent_path.startswith(old_path):
+            raise ValueError('不能把业务线移动到它自己或它的下级业务线下面')
+        self.path = '%s%d/' % (parent_path, self.pk)
+        self.depth = self.path.count('/') - 2
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = set(kwargs['update_fields']) | {
+                'path', 'depth'
+            }
+        super().save(*args, **kwargs)
+
+        if old_path and old_path != self.path:
+            old_depth = old_path.count('/') - 2
+            BusinessUnit.objects.filter(path__startswith=old_path).exclude(
+                pk=self.pk).update(
+                    path=Concat(Value(self.path),
+                                Substr('path', len(old_path) + 1)),
+                    depth=F('depth') + (self.depth - old_depth))
+
+    def get_descendants(self, include_self=True):
+        """ 本业务线的全部下级业务线，一条查询 """
+        queryset = BusinessUnit.objects.filter(path__startswith=self.path)
+        if not include_self:
+            queryset = queryset.exclude(pk=self.pk)
+        return queryset
+
+    def get_ancestors(self):
+        """ 从根节点到上一级的全部业务线 """
+        ids = [int(i) for i in self.path.strip('/').split('/')[:-1] if i]
+        return BusinessUnit.objects.filter(pk__in=ids).order_by('depth')
+
+    def get_assets(self):
+        """ 本业务线及其全部下级业务线中的资产，一条 JOIN 查询 """
+        return Asset.objects.filter(business_unit__path__startswith=self.path)
+
+    def asset_rollup(self):
+        """ 子树中每条业务线的资产数量（包含下级业务线中的资产）
+        用一条分组查询取出子树中各业务线直接拥有的资产数，再按路径前缀在内存中向上累加。
+        返回 {业务线id: 资产数}
+        """
+        units = list(
+            BusinessUnit.objects.filter(path__startswith=self.path).annotate(
+                asset_count=Count('asset')).values_list('pk', 'path',
+                                                        'asset_count'))
+        totals = {pk: 0 for pk, _, _ in units}
+        for _, path, count in units:
+            for ancestor in path.strip('/').split('/'):
+                ancestor = int(ancestor)
+                if ancestor in totals:
+                    totals[ancestor] += count
+        return totals
+
+    @classmethod
+    def rebuild_paths(cls):
+        """ 重新计算全部业务线的路径，用于导入旧数据之后的修复
+        一条查询取出全部父子关系，在内存中从根节点向下计算，再用 bulk_update 批量写回。
+        """
+        children = {}
+        for pk, parent in cls.objects.values_list('pk', 'parent_unit_id'):
+            children.setdefault(parent, []).append(pk)
+        units = []
+        stack = [(pk, '/', 0) for pk in children.get(None, [])]
+        while stack:
+            pk, parent_path, depth = stack.pop()
+            path = '%s%d/' % (parent_path, pk)
+            units.append(cls(pk=pk, path=path, depth=depth))
+            stack.extend((child, path, depth + 1)
+                         for child in children.get(pk, []))
+        cls.objects.bulk_update(units, ['path', 'depth'], batch_size=1000)
+        return len(units)
+
     class Meta:
         verbose_name = '业务线'
         verbose_name_plural = verbose_name
@@ -495,6 +721,7 @@ class Contract(models.Model):
     class Meta:
         verbose_name = '合同'
         verbose_name_plural = verbose_name
+        indexes = [models.Index(fields=['end_day'])]
 
 
 class Tag(models.Model):
@@ -547,6 +774,12 @@ class EventLog(models.Model):
     class Meta:
         verbose_name = '事件记录'
         verbose_name_plural = verbose_name
+        indexes = [
+            # 归档时按时间范围扫描
+            models.Index(fields=['date']),
+            # 后台列表页按事件类型过滤，再按时间排序
+            models.Index(fields=['event_type', 'date']),
+        ]
 
 
 class NewAssetApprovalZone(models.Model):
@@ -595,7 +828,9 @@ class NewAssetApprovalZone(models.Model):
                                   blank=True,
                                   null=True)
 
-    data = models.TextField('资产数据')  # 此字段必填
+    # 旧版本以明文 JSON 保存的汇报数据，迁移 0013_compress_report_data 会把它转存到 compressed_data 并清空
+    data = models.TextField('资产数据', blank=True, default='')
+    compressed_data = CompressedJSONField('资产数据(压缩)', null=True, blank=True)
 
     c_time = models.DateTimeField(auto_now_add=True, verbose_name='汇报日期')
     m_time = models.DateTimeField(auto_now=True, verbose_name='批准日期')
@@ -604,7 +839,99 @@ class NewAssetApprovalZone(models.Model):
     def __str__(self):
         return self.sn
 
+    @property
+    def report_data(self):
+        """ 汇报数据(dict)，优先读取压缩字段，兼容尚未转存的旧数据 """
+        if self.compressed_data is not None:
+            return self.compressed_data
+        return json.loads(self.data) if self.data else {}
+
+    @report_data.setter
+    def report_data(self, value):
+        self.compressed_data = value
+        self.data = ''
+
     class Meta:
         verbose_name = '新上线待审批资产'
         verbose_name_plural = verbose_name
         ordering = ['-c_time']
+
+
+class ReportBlob(models.Model):
+    """ 资产汇报数据的历史版本
+    每一份内容不同的汇报数据只保存一次，以规范化 JSON 的 sha256 作为内容地址，数据使用 zlib 压缩后存放在二进制字段中；
+    同一台服务器反复汇报相同的数据，或者多台配置相同的服务器，都会指向同一条记录。
+    """
+    digest = models.CharField('内容摘要', max_length=64, unique=True)
+    data = models.BinaryField('压缩数据')
+    size = models.PositiveIntegerField('原始大小(字节)', default=0)
+    c_time = models.DateTimeField('首次出现时间', auto_now_add=True)
+
+    def __str__(self):
+        return self.digest
+
+    class Meta:
+        verbose_name = '汇报数据版本'
+        verbose_name_plural = verbose_name
+
+
+class ReportVersion(models.Model):
+    """ 资产汇报数据的时间线
+    只有当某个SN汇报的数据与它上一个版本不同时，才追加一条指向 ReportBlob 的记录，
+    因此 "某台服务器在某个时间点的状态" 就是该时间点之前最近的一条记录。
+    """
+    sn = models.CharField('资产SN号', max_length=128)
+    blob = models.ForeignKey('ReportBlob',
+                             verbose_name='数据版本',
+                             on_delete=models.PROTECT)
+    reported_at = models.DateTimeField('汇报时间')
+
+    def __str__(self):
+        return '%s@%s' % (self.sn, self.reported_at)
+
+    class Meta:
+        verbose_name = '汇报数据时间线'
+        verbose_name_plural = verbose_name
+        indexes = [models.Index(fields=['sn', 'reported_at'])]
+
+
+class ExpiryBucket(models.Model):
+    """ 过保和合同到期日历的预计算结果
+    按 (类型, 月份, 机房, 业务线) 汇总未来若干个月内到期的资产和合同，由 python manage.py expiry_calendar --refresh 定期重建，
+    到期日历接口只读这张小表，不扫描资产表。
+    资产按自身的机房和业务线归类；合同归入关联资产最多的机房和业务线，没有关联资产的合同机房和业务线为空，
+    这样按任何维度汇总时每个合同都只计一次。
+    """
+    kind_choice = (
+        ('asset', '资产过保'),
+        ('contract', '合同到期'),
+    )
+    kind = models.CharField('类型', max_length=16, choices=kind_choice)
+    month = models.DateField('月份')
+    idc = models.ForeignKey('IDC',
+                            null=True,
+                            blank=True,
+                            verbose_name='所在机房',
+                            on_delete=models.CASCADE)
+    business_unit = models.ForeignKey('BusinessUnit',
+                                      null=True,
+                                      blank=True,
+                                      verbose_name='所属业务线',
+                                      on_delete=models.CASCADE)
+    # 资产过保: 到期的资产数；合同到期: 到期的合同数
+    count = models.PositiveIntegerField('到期数量', default=0)
+    # 合同到期: 这些合同覆盖的资产数和 license 数量合计
+    asset_count = models.PositiveIntegerField('涉及资产数', default=0)
+    license_num = models.PositiveIntegerField('license数量', default=0)
+    refreshed_at = models.DateTimeField('统计时间')
+    # 重建时覆盖到的月份（不含），超出这个月份的查询没有数据，不能当作没有到期
+    horizon_end = models.DateField('覆盖截止月份', null=True, blank=True)
+
+    def __str__(self):
+        return '%s %s %s' % (self.get_kind_display(),
+                             self.month.strftime('%Y-%m'), self.count)
+
+    class Meta:
+        verbose_name = '到期日历'
+        verbose_name_plural = verbose_name
+        indexes = [models.Index(fields=['month', 'kind'])]
@@ -0,0 +1,46 @@
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+
+
+class EstimatedCountPaginator(Paginator):
+    """ 大表分页器
+    Django 默认的分页器每次翻页都会执行一次 SELECT COUNT(*)，在十万级以上的资产表中，这条语句需要全表扫描，非常慢；
+    当查询集没有任何过滤条件时，改为读取数据库统计信息中的估算行数，只有估算值较小时才执行精确计数；
+    带有过滤或搜索条件的查询集，依然使用精确计数，因为此时条件字段都是有索引的。
+    """
+
+    # 估算行数低于这个阈值时，直接精确计数，保证小表的页码准确
+    estimate_threshold = 10000
+
+    @cached_property
+    def count(self):
+        query = getattr(self.object_list, 'query', None)
+        if query is None or query.where:
+            return super().count
+        estimate = self.estimated_count()
+        if estimate is None or estimate < self.estimate_threshold:
+            return super().count
+        return estimate
+
+    def estimated_count(self):
+        """ 从数据库的统计信息中读取表的估算行数，不支持的数据库返回 None """
+        queryset = self.object_list
+        connection = connections[queryset.db]
+        table = queryset.model._meta.db_table
+        with connection.cursor() as cursor:
+            if connection.vendor == 'mysql':
+                cursor.execute(
+                    'SELECT TABLE_ROWS FROM information_schema.TABLES '
+                    'WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s',
+                    [table])
+            elif connection.vendor == 'postgresql':
+                cursor.execute(
+                    'SELECT reltuples::bigint FROM pg_class WHERE relname = %s',
+                    [table])
+            else:
+                return None
+            row = cursor.fetchone()
+        if not row or row[0] is None:
+            return None
+        return int(row[0])
@@ -0,0 +1,140 @@
+import hashlib
+import json
+import zlib
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from . import models
+
+# 汇报数据中组件列表的自然键，diff 时按自然键而不是按列表位置比较
+COMPONENT_KEYS = {
+    'RAM': 'slot',
+    'physical_disk_driver': 'sn',
+    'nic': 'mac',
+}
+
+
+def canonical_json(data):
+    """ 规范化的 JSON 文本：键排序、无多余空白，相同内容总是得到相同的字节串 """
+    return json.dumps(data, sort_keys=True, separators=(',', ':'),
+                      ensure_ascii=False)
+
+
+def decompress(blob_data):
+    return json.loads(zlib.decompress(bytes(blob_data)).decode())
+
+
+def record_report(sn, data, reported_at=None):
+    """ 记录一次汇报
+    与该SN的最新版本相同时只做一次摘要比较，不写库；内容不同时，复用或新建压缩数据块，并追加一条时间线记录。
+    返回本次汇报对应的 ReportVersion，数据未变化时返回 None。
+    """
+    reported_at = reported_at or timezone.now()
+    raw = canonical_json(data).encode()
+    digest = hashlib.sha256(raw).hexdigest()
+    latest = models.ReportVersion.objects.filter(sn=sn).order_by(
+        '-reported_at').values_list('blob__digest', flat=True).first()
+    if latest == digest:
+        return None
+
+    with transaction.atomic():
+        blob = models.ReportBlob.objects.filter(digest=digest).only(
+            'id').first()
+        if blob is None:
+            try:
+                with transaction.atomic():
+                    blob = models.ReportBlob.objects.create(
+                        digest=digest,
+                        data=zlib.compress(raw, 6),
+                        size=len(raw))
+            except IntegrityError:
+                # 并发汇报了相同的数据，另一个请求已经写入
+                blob = models.ReportBlob.objects.get(digest=digest)
+        return models.ReportVersion.objects.create(sn=sn,
+                                                   blob=blob,
+                                                   reported_at=reported_at)
+
+
+def timeline(sn):
+    """ 某个SN的全部版本指针，按时间先后排列 """
+    return models.ReportVersion.objects.filter(sn=sn).order_by(
+        'reported_at').select_related('blob')
+
+
+def version_at(sn, when):
+    """ 某个时间点生效的版本，即该时间点之前最近的一条时间线记录 """
+    return models.ReportVersion.objects.filter(
+        sn=sn, reported_at__lte=when).order_by('-reported_at').select_related(
+            'blob').first()
+
+
+def state_at(sn, when):
+    """ 某台资产在某个时间点的汇报数据，没有记录时返回 None """
+    version = version_at(sn, when)
+    if version is None:
+        return None
+    return decompress(version.blob.data)
+
+
+def diff_versions(old_version, new_version):
+    """ 比较两个版本的汇报数据，参数可以是 ReportVersion 或 ReportBlob """
+    old_blob = getattr(old_version, 'blob', old_version)
+    new_blob = getattr(new_version, 'blob', new_version)
+    if old_blob.digest == new_blob.digest:
+        return {'added': {}, 'removed': {}, 'changed': {}}
+    return diff_reports(decompress(old_blob.data), decompress(new_blob.data))
+
+
+def diff_reports(old, new):
+    """ 比较两份汇报数据
+    返回 {'added': {路径: 新值}, 'removed': {路径: 旧值}, 'changed': {路径: (旧值, 新值)}}，
+    组件列表中的条目用 "RAM[插槽]" 这样的路径表示。
+    """
+    changes = {'added': {}, 'removed': {}, 'changed': {}}
+    _diff_dict(old, new, '', changes)
+    return changes
+
+
+def _index_components(items, key):
+    indexed = {}
+    for position, item in enumerate(items):
+        if isinstance(item, dict) and item.get(key) is not None:
+            indexed[str(item[key])] = item
+        else:
+            indexed['#%d' % position] = item
+    return indexed
+
+
+def _diff_dict(old, new, prefix, changes):
+    for key in old.keys() | new.keys():
+        path = '%s.%s' % (prefix, key) if prefix else str(key)
+        if key not in new:
+            changes['removed'][path] = old[key]
+        elif key not in old:
+            changes['added'][path] = new[key]
+        elif old[key] != new[key]:
+            old_value, new_value = old[key], new[key]
+            if key in COMPONENT_KEYS and isinstance(
+                    old_value, list) and isinstance(new_value, list):
+                _diff_components(
+                    _index_components(old_value, COMPONENT_KEYS[key]),
+                    _index_components(new_value, COMPONENT_KEYS[key]), path,
+                    changes)
+            elif isinstance(old_value, dict) and isinstance(new_value, dict):
+                _diff_dict(old_value, new_value, path, changes)
+            else:
+                changes['changed'][path] = (old_value, new_value)
+
+
+def _diff_components(old, new, prefix, changes):
+    for key in old.keys() | new.keys():
+        path = '%s[%s]' % (prefix, key)
+        if key not in new:
+            changes['removed'][path] = old[key]
+        elif key not in old:
+            changes['added'][path] = new[key]
+        elif old[key] != new[key]:
+            if isinstance(old[key], dict) and isinstance(new[key], dict):
+                _diff_dict(old[key], new[key], path, changes)
+            else:
+                changes['changed'][path] = (old[key], new[key])
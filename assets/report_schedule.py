@@ -0,0 +1,96 @@
+import datetime
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.db.models import Count, Max, Q
+from django.utils import timezone
+from . import models
+
+DEFAULTS = {
+    # 正常情况下的汇报间隔(秒)
+    'base': 3600,
+    # 新加入、硬件频繁变化的服务器使用的最短间隔
+    'min': 600,
+    # 长期稳定的服务器最多退避到的间隔
+    'max': 86400,
+    # 统计硬件变化次数的时间窗口(秒)，窗口内变化达到 flapping_changes 次视为频繁变化
+    'window': 7 * 86400,
+    'flapping_changes': 3,
+    # 单个进程希望承受的汇报速率(次/秒)，超过时按比例拉长所有服务器的间隔
+    'target_rate': 20.0,
+    # 随机抖动比例，把同一时刻到期的服务器打散到前后一段时间内
+    'jitter': 0.2,
+}
+
+
+def get_config():
+    config = dict(DEFAULTS)
+    config.update(getattr(settings, 'REPORT_INTERVAL', {}))
+    return config
+
+
+class RateMeter(object):
+    """ 最近一分钟的汇报速率，按秒分槽计数，只占用固定大小的内存 """
+
+    def __init__(self, seconds=60):
+        self.seconds = seconds
+        self.slots = [0] * seconds
+        self.stamps = [0] * seconds
+        self.lock = threading.Lock()
+
+    def hit(self, now=None):
+        second = int(now or time.time())
+        index = second % self.seconds
+        with self.lock:
+            if self.stamps[index] != second:
+                self.stamps[index] = second
+                self.slots[index] = 0
+            self.slots[index] += 1
+
+    def rate(self, now=None):
+        second = int(now or time.time())
+        with self.lock:
+            total = sum(count
+                        for count, stamp in zip(self.slots, self.stamps)
+                        if second - stamp < self.seconds)
+        return total / float(self.seconds)
+
+
+meter = RateMeter()
+
+
+def load_factor(config=None):
+    """ 当前负载与目标负载的比值，低于 1 时不调整 """
+    config = config or get_config()
+    return max(1.0, meter.rate() / config['target_rate'])
+
+
+def next_interval(sn=None, online=True, changed=False, config=None):
+    """ 计算服务器下一次汇报的间隔(秒)
+    新资产(还在待审批区)和窗口内硬件频繁变化的服务器使用最短间隔；
+    本次汇报有变化的服务器使用基础间隔的一半；其余服务器距离上次变化越久，间隔越长，最多到 max；
+    最后乘以当前负载系数并加上随机抖动，让汇报均匀分布，而不是集中在 cron 的整点。
+    """
+    config = config or get_config()
+    if sn is None:
+        interval = config['base']
+    elif not online:
+        interval = config['min']
+    else:
+        since = timezone.now() - datetime.timedelta(seconds=config['window'])
+        history = models.ReportVersion.objects.filter(sn=sn).aggregate(
+            changes=Count('id', filter=Q(reported_at__gte=since)),
+            last_change=Max('reported_at'))
+        if history['changes'] >= config['flapping_changes']:
+            interval = config['min']
+        elif changed or history['last_change'] is None:
+            interval = config['base'] / 2.0
+        else:
+            stable_days = (timezone.now() -
+                           history['last_change']).total_seconds() / 86400
+            interval = config['base'] * (1 + stable_days)
+    interval *= load_factor(config)
+    interval *= random.uniform(1 - config['jitter'], 1 + config['jitter'])
+    return int(min(config['max'], max(config['min'], interval)))
@@ -0,0 +1,278 @@
+import ipaddress
+import json
+import math
+import re
+
+from . import models
+
+# 错误码，客户端根据 code 判断原因，message 只用于阅读
+INVALID_JSON = 'invalid_json'
+NOT_OBJECT = 'not_object'
+EMPTY = 'empty'
+UNSUPPORTED_VERSION = 'unsupported_version'
+REQUIRED = 'required'
+INVALID_TYPE = 'invalid_type'
+OUT_OF_RANGE = 'out_of_range'
+TOO_LONG = 'too_long'
+INVALID_CHOICE = 'invalid_choice'
+# 不是错误: 数据中被忽略的部分，放在返回结果的 warnings 中
+IGNORED = 'ignored'
+
+# 一次最多返回的错误数量，避免畸形数据生成巨大的响应
+MAX_ERRORS = 20
+
+# 常见的 IPv4 地址先用正则判断，比 ipaddress.ip_address 快得多；其余的格式交给 ipaddress 解析
+_IPV4 = re.compile(r'(?:(?:25[0-5]|2[0-4][0-9]|1[0-9][0-9]|[1-9]?[0-9])\.){3}'
+                   r'(?:25[0-5]|2[0-4][0-9]|1[0-9][0-9]|[1-9]?[0-9])')
+
+# 与数据库字段的取值范围一致，超出范围的数据在这里拒绝，而不是等到写库时报错
+SMALL_INT_MAX = 32767
+INT_MAX = 2147483647
+
+
+class Field(object):
+    """ 汇报数据中一个字段的规则
+    kind: text、int、number、ip 或 list；list 的每一项按 item_fields 检查。
+    没有 required 的字段可以不出现或者为 null。
+    numeric: text 字段是否也接受数字，只用于插槽这类有的客户端上报为数字的字段；
+    prefix: ip 字段是否也接受前缀长度，用于掩码（IPv6 的掩码上报为 64 这样的前缀长度）。
+    """
+
+    def __init__(self, kind, required=False, max_length=None, min_value=None,
+                 max_value=None, choices=None, item_fields=None,
+                 numeric=False, prefix=False):
+        self.kind = kind
+        self.required = required
+        self.max_length = max_length
+        self.min_value = min_value
+        self.max_value = max_value
+        self.choices = choices
+        self.item_fields = item_fields
+        self.numeric = numeric
+        self.prefix = prefix
+
+
+def model_choices(choices):
+    """ 模型字段 choices 中的取值，格式与数据库保持一致 """
+    return tuple(value for value, _ in choices)
+
+
+# 各版本的汇报数据格式，客户端通过 schema_version 声明，旧客户端没有这个字段时按版本 1 处理。
+# 修改已有版本会让线上客户端的数据被拒绝，格式变化时应增加新版本。
+SCHEMAS = {
+    1: {
+        'sn': Field('text', required=True, max_length=128),
+        'asset_type': Field('text', required=True, choices=(
+            'server', 'networkdevice', 'storagedevice', 'securitydevice',
+            'software')),
+        'manufacturer': Field('text', max_length=64),
+        'model': Field('text', max_length=128),
+        'wake_up_type': Field('int'),
+        'ram_size': Field('int', min_value=0, max_value=INT_MAX),
+        'cpu_model': Field('text', max_length=128),
+        'cpu_count': Field('int', min_value=0, max_value=SMALL_INT_MAX),
+        'cpu_core_count': Field('int', min_value=0, max_value=SMALL_INT_MAX),
+        'os_type': Field('text', max_length=64),
+        'os_distribution': Field('text', max_length=64),
+        'os_release': Field('text', max_length=256),
+        'RAM': Field('list', item_fields={
+            'slot': Field('text', required=True, max_length=64, numeric=True),
+            'sn': Field('text', max_length=128),
+            'model': Field('text', max_length=128),
+            'manufacturer': Field('text', max_length=64),
+            'capacity': Field('int', min_value=0, max_value=INT_MAX),
+        }),
+        # 虚拟机的硬盘可能没有SN，这样的硬盘不拒绝整份数据，入库时忽略并返回警告
+        'physical_disk_driver': Field('list', item_fields={
+            'sn': Field('text', max_length=128),
+            'slot': Field('text', max_length=64, numeric=True),
+            'model': Field('text', max_length=64),
+            'manufacturer': Field('text', max_length=64),
+            'capacity': Field('number', min_value=0),
+            'interface_type': Field('text', choices=model_choices(
+                models.Disk.disk_interface_type_choice)),
+        }),
+        'nic': Field('list', item_fields={
+            'name': Field('text', max_length=64),
+            'model': Field('text', required=True, max_length=64),
+            'mac': Field('text', required=True, max_length=64),
+            'ip_address': Field('ip'),
+            'net_mask': Field('ip', prefix=True),
+        }),
+    },
+}
+
+
+# 版本 2: os_release 的长度限制与数据库字段一致；版本 1 仍然接受 256 个字符，入库时截断
+SCHEMAS[2] = dict(SCHEMAS[1], os_release=Field('text', max_length=64))
+
+
+def error(code, field, message):
+    return {'code': code, 'field': field, 'message': message}
+
+
+def _compile_field(name, field):
+    """ 把一条字段规则编译成检查函数 check(value, prefix, errors)
+    所有分支在编译时确定，运行时每个字段只做几次类型判断和比较，字段路径只在出错时才拼接。
+    """
+    kind = field.kind
+    if kind == 'text':
+        max_length, choices = field.max_length, field.choices
+        numeric = field.numeric
+
+        def check(value, prefix, errors):
+            if type(value) is str:
+                pass
+            elif numeric and type(value) is int:
+                # 插槽这类字段有的客户端上报为数字，写库时会转成字符串
+                value = str(value)
+            else:
+                errors.append(error(INVALID_TYPE, prefix + name, '必须是字符串'))
+                return
+            if max_length is not None and len(value) > max_length:
+                errors.append(
+                    error(TOO_LONG, prefix + name, '长度不能超过 %d' % max_length))
+            elif choices is not None and value not in choices:
+                errors.append(
+                    error(INVALID_CHOICE, prefix + name,
+                          '必须是以下值之一: %s' % ', '.join(choices)))
+
+    elif kind in ('int', 'number'):
+        types = int if kind == 'int' else (int, float)
+        min_value, max_value = field.min_value, field.max_value
+
+        def check(value, prefix, errors):
+            if type(value) is int and (min_value is None or value >= min_value
+                                       ) and (max_value is None
+                                              or value <= max_value):
+                return
+            if isinstance(value, str) and kind == 'int' and value.isdecimal():
+                value = int(value)
+            if isinstance(value, bool) or not isinstance(value, types):
+                errors.append(
+                    error(INVALID_TYPE, prefix + name,
+                          '必须是整数' if kind == 'int' else '必须是数字'))
+            elif type(value) is float and not math.isfinite(value):
+                # json.loads 接受 NaN 和 Infinity，数据库不接受
+                errors.append(error(INVALID_TYPE, prefix + name, '必须是有限的数字'))
+            elif (min_value is not None and value < min_value) or (
+                    max_value is not None and value > max_value):
+                errors.append(
+                    error(OUT_OF_RANGE, prefix + name, '超出范围 [%s, %s]' %
+                          (min_value, max_value)))
+
+    elif kind == 'ip':
+        # 网卡可能有多个地址，客户端上报为字符串或字符串列表；没有地址时上报空字符串
+        max_prefix = 128 if field.prefix else -1
+        ipv4 = _IPV4.fullmatch
+
+        def valid(item):
+            if type(item) is not str:
+                return False
+            if not item or ipv4(item) or (item.isdecimal()
+                                          and int(item) <= max_prefix):
+                return True
+            try:
+                ipaddress.ip_address(item)
+            except ValueError:
+                return False
+            return True
+
+        def check(value, prefix, errors):
+            if isinstance(value, str):
+                if not valid(value):
+                    errors.append(
+                        error(INVALID_TYPE, prefix + name, '不是合法的IP地址'))
+                return
+            if not isinstance(value, list):
+                errors.append(
+                    error(INVALID_TYPE, prefix + name, '必须是字符串或字符串列表'))
+                return
+            for index, item in enumerate(value):
+                if not valid(item):
+                    errors.append(
+                        error(INVALID_TYPE, '%s%s[%d]' % (prefix, name, index),
+                              '不是合法的IP地址'))
+                    return
+
+    elif kind == 'list':
+        check_item = _compile_object(field.item_fields)
+
+        def check(value, prefix, errors):
+            if not isinstance(value, list):
+                errors.append(error(INVALID_TYPE, prefix + name, '必须是列表'))
+                return
+            for index, item in enumerate(value):
+                if not isinstance(item, dict):
+                    errors.append(
+                        error(INVALID_TYPE, '%s%s[%d]' % (prefix, name, index),
+                              '必须是字典'))
+                else:
+                    check_item(item, '%s%s[%d].' % (prefix, name, index),
+                               errors)
+                if len(errors) >= MAX_ERRORS:
+                    return
+
+    else:
+        raise ValueError('未知的字段类型: %s' % kind)
+    return check
+
+
+def _compile_object(fields):
+    checks = tuple((name, field.required, _compile_field(name, field))
+                   for name, field in fields.items())
+
+    def check_object(data, prefix, errors):
+        for name, required, check in checks:
+            value = data.get(name)
+            if value is None:
+                if required:
+                    errors.append(error(REQUIRED, prefix + name, '缺少必填字段'))
+            else:
+                check(value, prefix, errors)
+
+    return check_object
+
+
+class ReportValidator(object):
+    """ 汇报数据校验器
+    各版本的格式在创建时编译成检查函数，整个进程共用一个实例；
+    校验只依赖汇报数据本身，在任何数据库操作之前完成。没有定义在格式中的字段不做检查，原样保留。
+    """
+
+    def __init__(self, schemas=None):
+        self.versions = {
+            version: _compile_object(fields)
+            for version, fields in (schemas or SCHEMAS).items()
+        }
+
+    def validate(self, data):
+        """ 返回错误列表，空列表表示数据合法 """
+        if not isinstance(data, dict):
+            return [error(NOT_OBJECT, '', '数据必须为字典格式')]
+        if not data:
+            return [error(EMPTY, '', '没有数据')]
+        version = data.get('schema_version', 1)
+        # True == 1，布尔值不能当作版本号
+        check = self.versions.get(version) if type(version) is int else None
+        if check is None:
+            return [
+                error(UNSUPPORTED_VERSION, 'schema_version',
+                      '不支持的数据格式版本: %s' % version)
+            ]
+        errors = []
+        check(data, '', errors)
+        return errors[:MAX_ERRORS]
+
+    def parse(self, raw):
+        """ 解析并校验客户端提交的 asset_data，返回 (数据, 错误列表) """
+        if not raw:
+            return None, [error(REQUIRED, 'asset_data', '缺少 asset_data')]
+        try:
+            data = json.loads(raw)
+        except ValueError as e:
+            return None, [error(INVALID_JSON, 'asset_data', str(e))]
+        return data, self.validate(data)
+
+
+validator = ReportValidator()
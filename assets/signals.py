@@ -0,0 +1,119 @@
+import threading
+from contextlib import contextmanager
+
+from django.db.models import F, Value
+from django.db.models.functions import Concat, Substr
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from . import asset_cache
+from . import licenses
+from . import models
+from . import vendors
+
+_local = threading.local()
+
+
+@contextmanager
+def component_sync():
+    """ 汇报入库时组件由 UpdateAsset 批量写入，缓存失效和组件摘要也由它统一处理，
+    期间跳过逐行的组件信号，否则删除 n 个组件会多出 n 条 UPDATE。
+    """
+    _local.syncing = getattr(_local, 'syncing', 0) + 1
+    try:
+        yield
+    finally:
+        _local.syncing -= 1
+
+
+def _syncing():
+    return getattr(_local, 'syncing', 0) > 0
+
+
+@receiver(pre_delete, sender=models.BusinessUnit)
+def reroot_business_unit_children(sender, instance, using, **kwargs):
+    """ 删除业务线时，parent_unit 的 SET_NULL 会让直接下级变成根节点，
+    这里用一条 UPDATE 把整棵子树路径中被删除的前缀去掉，保持路径与外键一致。
+    路径从数据库重新读取，因为同一批删除中上级业务线可能已经改写过它。
+    """
+    path = sender.objects.using(using).filter(pk=instance.pk).values_list(
+        'path', flat=True).first()
+    if not path:
+        return
+    depth = path.count('/') - 1
+    sender.objects.using(using).filter(path__startswith=path).exclude(
+        pk=instance.pk).update(path=Concat(Value('/'),
+                                           Substr('path',
+                                                  len(path) + 1)),
+                               depth=F('depth') - depth)
+
+
+@receiver(post_save, sender=models.Asset)
+@receiver(post_delete, sender=models.Asset)
+def invalidate_asset_cache(sender, instance, **kwargs):
+    asset_cache.bump_asset_versions([instance.pk])
+
+
+@receiver(post_save, sender=models.Server)
+@receiver(post_save, sender=models.CPU)
+@receiver(post_save, sender=models.RAM)
+@receiver(post_save, sender=models.Disk)
+@receiver(post_save, sender=models.NIC)
+@receiver(post_delete, sender=models.Server)
+@receiver(post_delete, sender=models.CPU)
+@receiver(post_delete, sender=models.RAM)
+@receiver(post_delete, sender=models.Disk)
+@receiver(post_delete, sender=models.NIC)
+def invalidate_component_cache(sender, instance, **kwargs):
+    """ 服务器和组件的写入让所属资产的缓存失效，批量 update/bulk_create 不会触发信号，需要调用方自己调用 bump_asset_versions """
+    if _syncing():
+        return
+    asset_cache.bump_asset_versions([instance.asset_id])
+
+
+@receiver(post_save, sender=models.Server)
+@receiver(post_save, sender=models.CPU)
+@receiver(post_save, sender=models.RAM)
+@receiver(post_save, sender=models.Disk)
+@receiver(post_save, sender=models.NIC)
+@receiver(post_delete, sender=models.Server)
+@receiver(post_delete, sender=models.CPU)
+@receiver(post_delete, sender=models.RAM)
+@receiver(post_delete, sender=models.Disk)
+@receiver(post_delete, sender=models.NIC)
+def reset_component_hash(sender, instance, **kwargs):
+    """ 在后台手工修改组件或操作系统后清空整机组件摘要，下一次汇报会重新逐个比对 """
+    if _syncing():
+        return
+    models.Asset.objects.filter(pk=instance.asset_id).exclude(
+        component_hash='').update(component_hash='')
+
+
+@receiver(post_save, sender=models.Server)
+def count_server_license(sender, instance, created, **kwargs):
+    """ 服务器的系统版本变化时增量调整授权统计，批量写入服务器后需要调用 licenses.invalidate """
+    if created:
+        licenses.adjust(None, instance.os_key)
+    elif hasattr(instance, '_loaded_os_key'):
+        licenses.adjust(instance._loaded_os_key, instance.os_key)
+    else:
+        # 不是从数据库读出的实例，不知道原来的版本，只能让全部计数失效
+        licenses.invalidate()
+    instance._loaded_os_key = instance.os_key
+
+
+@receiver(post_delete, sender=models.Server)
+def uncount_server_license(sender, instance, **kwargs):
+    os_key = getattr(instance, '_loaded_os_key', None)
+    if os_key is None:
+        licenses.invalidate()
+    else:
+        licenses.adjust(os_key, None)
+
+
+@receiver(post_save, sender=models.Manufacturer)
+@receiver(post_save, sender=models.ManufacturerAlias)
+@receiver(post_delete, sender=models.Manufacturer)
+@receiver(post_delete, sender=models.ManufacturerAlias)
+def invalidate_vendors(sender, instance, **kwargs):
+    """ 厂商或别名变化后重新加载各进程的厂商字典，批量写入后需要调用 vendors.invalidate """
+    vendors.invalidate()
@@ -1,3 +1,1775 @@
-from django.test import TestCase
+import asyncio
+import datetime
+import importlib
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+import zlib
+from unittest import mock, skipUnless
+from urllib.parse import urlencode
+
+from django.apps import apps
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.management import CommandError, call_command
+from django.db import DatabaseError, NotSupportedError, connection
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase
+from django.test import override_settings
+from django.urls import reverse
+from django.utils import timezone
 
 # Create your tests here.
+from assets import admin as assets_admin
+from assets import agent_auth
+from assets import asset_cache
+from assets import asset_handler
+from assets import capacity
+from assets import checks
+from assets import db_router
+from assets import event_log
+from assets import expiry
+from assets import heartbeat
+from assets import licenses
+from assets import models
+from assets import report_history
+from assets import report_schedule
+from assets import report_schema
+from assets import topology
+from assets import throttle
+from assets import vendors
+from assets import views
+from assets.management.commands.bench_report_storage import build_report
+
+
+class BusinessUnitTreeTest(TestCase):
+    """ 业务线物化路径的维护与子树查询 """
+
+    depth = 60
+
+    def build_chain(self, prefix, depth, parent=None):
+        units = []
+        for i in range(depth):
+            parent = models.BusinessUnit.objects.create(
+                name='%s-%d' % (prefix, i), parent_unit=parent)
+            units.append(parent)
+        return units
+
+    def assertPathsConsistent(self):
+        """ 每条业务线的路径都等于上级路径加上自己的 id """
+        units = {u.pk: u for u in models.BusinessUnit.objects.all()}
+        for unit in units.values():
+            if unit.parent_unit_id:
+                parent_path = units[unit.parent_unit_id].path
+            else:
+                parent_path = '/'
+            self.assertEqual(unit.path, '%s%d/' % (parent_path, unit.pk))
+            self.assertEqual(unit.depth, unit.path.count('/') - 2)
+
+    def test_deep_chain_subtree_is_single_query(self):
+        chain = self.build_chain('line', self.depth)
+        for i, unit in enumerate(chain):
+            models.Asset.objects.create(name='host-%d' % i,
+                                        sn='sn-%d' % i,
+                                        business_unit=unit)
+        self.assertPathsConsistent()
+        self.assertEqual(chain[-1].depth, self.depth - 1)
+
+        middle = chain[self.depth // 2]
+        with self.assertNumQueries(1):
+            descendants = list(middle.get_descendants())
+        self.assertEqual(len(descendants), self.depth - self.depth // 2)
+        with self.assertNumQueries(1):
+            assets = list(middle.get_assets())
+        self.assertEqual(len(assets), self.depth - self.depth // 2)
+
+        with self.assertNumQueries(1):
+            rollup = chain[0].asset_rollup()
+        self.assertEqual(rollup[chain[0].pk], self.depth)
+        self.assertEqual(rollup[middle.pk], self.depth - self.depth // 2)
+        self.assertEqual(rollup[chain[-1].pk], 1)
+
+    def test_move_subtree(self):
+        chain = self.build_chain('line', self.depth)
+        other = self.build_chain('other', 3)
+        moved = chain[10]
+        moved.parent_unit = other[-1]
+        moved.save()
+        self.assertPathsConsistent()
+        self.assertEqual(other[0].get_descendants().count(),
+                         3 + self.depth - 10)
+        self.assertEqual(chain[0].get_descendants().count(), 10)
+        self.assertEqual(
+            models.BusinessUnit.objects.get(pk=chain[-1].pk).depth,
+            3 + self.depth - 10 - 1)
+
+    def test_move_under_own_descendant_is_rejected(self):
+        chain = self.build_chain('line', 5)
+        root = chain[0]
+        root.parent_unit = chain[3]
+        with self.assertRaises(ValueError):
+            root.save()
+
+    def test_delete_reroots_children(self):
+        chain = self.build_chain('line', self.depth)
+        chain[20].delete()
+        self.assertPathsConsistent()
+        new_root = models.BusinessUnit.objects.get(pk=chain[21].pk)
+        self.assertIsNone(new_root.parent_unit_id)
+        self.assertEqual(new_root.get_descendants().count(),
+                         self.depth - 21)
+
+    def test_bulk_delete_of_nested_units(self):
+        chain = self.build_chain('line', 10)
+        models.BusinessUnit.objects.filter(
+            pk__in=[chain[2].pk, chain[5].pk]).delete()
+        self.assertPathsConsistent()
+
+    def test_rebuild_paths(self):
+        chain = self.build_chain('line', self.depth)
+        models.BusinessUnit.objects.update(path='', depth=0)
+        models.BusinessUnit.rebuild_paths()
+        self.assertPathsConsistent()
+        self.assertEqual(chain[0].get_descendants().count(), self.depth)
+
+
+@mock.patch('assets.db_router.get_replicas', return_value=['replica'])
+class PrimaryReplicaRouterTest(SimpleTestCase):
+    """ 读写分离路由与请求内的主库粘滞 """
+
+    def setUp(self):
+        self.router = db_router.PrimaryReplicaRouter()
+        self.factory = RequestFactory()
+        db_router.unpin()
+
+    def tearDown(self):
+        db_router.unpin()
+
+    def test_reads_go_to_replica_until_a_write(self, get_replicas):
+        self.assertEqual(self.router.db_for_read(models.Asset), 'replica')
+        self.assertEqual(self.router.db_for_write(models.Asset), 'default')
+        self.assertEqual(self.router.db_for_read(models.Asset), 'default')
+
+    def test_middleware_scopes_pinning_to_one_request(self, get_replicas):
+        seen = []
+
+        def view(request):
+            seen.append(self.router.db_for_read(models.Asset))
+            self.router.db_for_write(models.Asset)
+            seen.append(self.router.db_for_read(models.Asset))
+
+        middleware = db_router.PrimaryPinningMiddleware(view)
+        middleware(self.factory.get('/assets/summary/'))
+        middleware(self.factory.get('/assets/summary/'))
+        self.assertEqual(seen, ['replica', 'default', 'replica', 'default'])
+        self.assertFalse(db_router.is_pinned())
+
+    def test_unsafe_methods_and_primary_paths_start_pinned(self, get_replicas):
+        seen = []
+        middleware = db_router.PrimaryPinningMiddleware(
+            lambda request: seen.append(self.router.db_for_read(models.Asset)))
+        middleware(self.factory.post('/assets/report/'))
+        middleware(self.factory.get('/admin/assets/asset/'))
+        middleware(self.factory.get('/assets/detail/1/'))
+        self.assertEqual(seen, ['default', 'default', 'replica'])
+
+    def test_without_replicas_everything_uses_primary(self, get_replicas):
+        get_replicas.return_value = []
+        self.assertEqual(self.router.db_for_read(models.Asset), 'default')
+
+
+def tearDownModule():
+    # 汇报接口留在进程缓冲中的心跳属于测试数据库，进程退出时不能再写库
+    heartbeat.buffer.take()
+
+
+def make_business_units(depth, fanout):
+    """ 业务线树: 每个节点 fanout 个下级，共 depth 层，返回全部业务线 """
+    level = [models.BusinessUnit.objects.create(name='bu-0')]
+    units = list(level)
+    for i in range(1, depth):
+        level = [
+            models.BusinessUnit.objects.create(name='bu-%d-%d-%d' %
+                                               (i, parent.pk, j),
+                                               parent_unit=parent)
+            for parent in level for j in range(fanout)
+        ]
+        units.extend(level)
+    return units
+
+
+def make_server(sn, components=4, idc=None, business_unit=None, host=None):
+    """ 一台服务器，带 CPU 和各 components 条内存、硬盘、网卡；host 不为空时是运行在 host 上的虚拟机 """
+    asset = models.Asset.objects.create(name='host-%s' % sn,
+                                        sn=sn,
+                                        idc=idc,
+                                        business_unit=business_unit)
+    server = models.Server.objects.create(asset=asset,
+                                          hosted_on=host,
+                                          model='PowerEdge R740',
+                                          os_type='Linux',
+                                          os_release='CentOS 7.6')
+    models.CPU.objects.create(asset=asset,
+                              cpu_model='Xeon Gold 6130',
+                              cpu_frequency=2.1,
+                              cpu_count=2,
+                              cpu_core_count=32)
+    models.RAM.objects.bulk_create([
+        models.RAM(asset=asset, slot='DIMM_A%d' % i, capacity=16)
+        for i in range(components)
+    ])
+    models.Disk.objects.bulk_create([
+        models.Disk(asset=asset, sn='%s-disk-%d' % (sn, i), capacity=3726)
+        for i in range(components)
+    ])
+    models.NIC.objects.bulk_create([
+        models.NIC(asset=asset,
+                   name='eth%d' % i,
+                   model='X710',
+                   mac='%s-mac-%d' % (sn, i)) for i in range(components)
+    ])
+    return server
+
+
+def make_fleet(prefix, count, components=4, idcs=(), business_units=()):
+    """ count 台物理机，每台上面运行一台虚拟机，轮流分配到各个机房和业务线 """
+    servers = []
+    for i in range(count):
+        idc = idcs[i % len(idcs)] if idcs else None
+        unit = business_units[i % len(business_units)] \
+            if business_units else None
+        host = make_server('%s-%d' % (prefix, i), components, idc, unit)
+        guest = make_server('%s-%d-vm' % (prefix, i), 1, idc, unit, host)
+        servers.extend([host, guest])
+    return servers
+
+
+def post_report(client, data, **extra):
+    """ 和客户端一样提交汇报数据，请求头 X-CMDB-SN 与数据中的SN一致 """
+    extra.setdefault('HTTP_X_CMDB_SN', data.get('sn') or '')
+    return client.post(reverse('assets:report'),
+                       {'asset_data': json.dumps(data)}, **extra)
+
+
+# 查询数测试放开签名和限流，并且不让最近汇报时间在测试中途写库
+QUERY_COUNT_SETTINGS = {
+    'REPORT_AUTH': {
+        'required': False
+    },
+    'REPORT_ADMISSION': {
+        'ip_burst': 10**6,
+        'ip_rate': 10**6,
+        'sn_burst': 10**6,
+        'sn_rate': 10**6,
+    },
+    'HEARTBEAT_FLUSH_INTERVAL': 3600,
+}
+
+
+@override_settings(**QUERY_COUNT_SETTINGS)
+class ReportQueryCountTest(TestCase):
+    """ 汇报接口各条路径的查询数
+    每条路径在不同的组件数量和资产总量下都必须是同一个固定值，查询数随组件数增长说明出现了 N+1。
+    修改了这些路径的查询后，如果增减是有意为之，同时修改这里的数字。
+    """
+
+    component_sizes = (1, 8, 48)
+    fleet_sizes = (0, 20)
+
+    # 以下数字包含 TestCase 把事务换成保存点产生的 SAVEPOINT/RELEASE 语句
+    # 新资产进入待审批区: 写汇报历史、查找资产、待审批区 update_or_create
+    new_asset_queries = 15
+    # 待审批区中的资产再次汇报相同的数据，不写汇报历史
+    repeated_new_asset_queries = 6
+    # 已上线资产第一次汇报，补上厂商，逐个比对 CPU、内存、硬盘、网卡和操作系统，全部组件都有变化
+    first_update_queries = 31
+    # 已上线资产汇报的数据没有变化: 汇报历史摘要、查找资产、组件摘要相同直接返回
+    unchanged_queries = 3
+    # 内存被修改、硬盘和网卡全部更换、操作系统升级，组件都是批量写入
+    changed_queries = 29
+    # 后台批准一个待审批区中的资产上线: 会话和用户、读出待审批区记录、创建资产和服务器、
+    # 组件全部批量新增、写入上线事件、删除待审批区记录
+    approval_queries = 28
+
+    def setUp(self):
+        cache.clear()
+        heartbeat.buffer.take()
+        self.idc = models.IDC.objects.create(name='IDC-A')
+        self.units = make_business_units(3, 3)
+        # 厂商字典每个进程只加载一次，不计入单次汇报的查询数
+        self.dell = models.Manufacturer.objects.create(name='Dell Inc.')
+        vendors.resolver.reload()
+
+    def post_report(self, data):
+        response = post_report(self.client, data)
+        self.assertEqual(response.status_code, 200)
+        result = response.json()
+        self.assertEqual(result['code'], 0, result)
+        return result
+
+    def each_size(self):
+        """ 依次扩大资产总量，每个资产总量下再遍历组件数量，返回 [(编号, 组件数量)] """
+        sizes = []
+        for fleet in self.fleet_sizes:
+            sizes.extend(('%d-%d' % (fleet, components), components)
+                         for components in self.component_sizes)
+        return sizes
+
+    def grow_fleet(self, key):
+        """ 资产总量扩大到编号中的数量 """
+        fleet = int(key.split('-')[0])
+        existing = models.Server.objects.filter(asset__sn__startswith='fleet-',
+                                                hosted_on=None).count()
+        make_fleet('fleet-%d' % existing, fleet - existing, idcs=[self.idc],
+                   business_units=self.units)
+
+    def test_new_asset_report(self):
+        for key, components in self.each_size():
+            self.grow_fleet(key)
+            data = build_report('NEW-%s' % key, components, components,
+                                components)
+            with self.subTest(size=key), self.assertNumQueries(
+                    self.new_asset_queries):
+                self.post_report(data)
+            with self.subTest(size=key), self.assertNumQueries(
+                    self.repeated_new_asset_queries):
+                self.post_report(data)
+        self.assertEqual(models.NewAssetApprovalZone.objects.count(),
+                         len(self.fleet_sizes) * len(self.component_sizes))
+
+    def test_online_asset_reports(self):
+        for key, components in self.each_size():
+            self.grow_fleet(key)
+            server = make_server('ONLINE-%s' % key, components, self.idc,
+                                 self.units[-1])
+            data = build_report(server.asset.sn, components, components,
+                                components)
+            with self.subTest(size=key), self.assertNumQueries(
+                    self.first_update_queries):
+                self.post_report(data)
+            with self.subTest(size=key), self.assertNumQueries(
+                    self.unchanged_queries):
+                self.post_report(data)
+
+            changed = build_report(server.asset.sn, components, components,
+                                   components)
+            changed['os_release'] = 'CentOS Linux release 8.2.2004 (Core)'
+            for ram in changed['RAM']:
+                ram['capacity'] = 32
+            with self.subTest(size=key), self.assertNumQueries(
+                    self.changed_queries):
+                self.post_report(changed)
+            self.assertEqual(
+                models.RAM.objects.filter(asset=server.asset,
+                                          capacity=32).count(), components)
+            self.assertEqual(
+                models.Disk.objects.filter(asset=server.asset).count(),
+                components)
+
+    def test_approve_new_asset(self):
+        admin = User.objects.create_superuser('approver', 'approver@cmdb.local',
+                                              'approver')
+        self.client.force_login(admin)
+        url = reverse('admin:assets_newassetapprovalzone_changelist')
+        for key, components in self.each_size():
+            self.grow_fleet(key)
+            sn = 'APPROVE-%s' % key
+            data = build_report(sn, components, components, components)
+            self.post_report(data)
+            zone = models.NewAssetApprovalZone.objects.get(sn=sn)
+            with self.subTest(size=key), self.assertNumQueries(
+                    self.approval_queries):
+                response = self.client.post(url, {
+                    'action': 'approve_selected_new_assets',
+                    '_selected_action': [zone.pk],
+                })
+            self.assertEqual(response.status_code, 302)
+            asset = models.Asset.objects.get(sn=sn)
+            self.assertEqual(asset.approved_by, admin)
+            self.assertEqual(asset.manufacturer, self.dell)
+            self.assertEqual(asset.server.os_release, zone.os_release)
+            for model in (models.RAM, models.Disk, models.NIC):
+                self.assertEqual(model.objects.filter(asset=asset).count(),
+                                 components)
+            self.assertIn('资产上线',
+                          asset.eventlog_set.values_list('name', flat=True))
+            self.assertFalse(
+                models.NewAssetApprovalZone.objects.filter(sn=sn).exists())
+            # 上线之后的下一次汇报数据没有变化
+            with self.subTest(size=key), self.assertNumQueries(
+                    self.unchanged_queries):
+                self.post_report(data)
+
+    def test_removed_components_do_not_reset_hash_per_row(self):
+        server = make_server('SHRINK', 48, self.idc)
+        self.post_report(build_report('SHRINK', 48, 48, 48))
+        with self.assertNumQueries(self.changed_queries - 1):
+            # 只剩一块硬盘，内存和网卡不变，操作系统不变
+            data = build_report('SHRINK', 48, 1, 48)
+            data['RAM'] = build_report('SHRINK', 48, 48, 48)['RAM']
+            self.post_report(data)
+        server.asset.refresh_from_db()
+        self.assertNotEqual(server.asset.component_hash, '')
+
+
+class AdminChangelistQueryCountTest(TestCase):
+    """ 后台列表页的查询数与资产数量无关，列表中的外键都要 join 出来或者由 list_select_related 指定 """
+
+    fleet_sizes = (3, 30)
+
+    # {后台列表页: 查询数}，包括会话和当前用户的 2 条查询，以及过滤器选项的查询
+    changelists = {
+        'asset': 6,
+        'server': 4,
+        'cpu': 4,
+        'ram': 4,
+        'disk': 4,
+        'nic': 4,
+        'eventlog': 4,
+        'businessunit': 5,
+        'newassetapprovalzone': 6,
+    }
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser('admin', 'admin@cmdb.local',
+                                                   'admin')
+        self.client.force_login(self.admin)
+        self.idcs = [models.IDC.objects.create(name='IDC-%d' % i)
+                     for i in range(3)]
+        self.units = make_business_units(3, 3)
+
+    def grow_fleet(self, size):
+        existing = models.Server.objects.filter(hosted_on=None).count()
+        servers = make_fleet('fleet-%d' % existing, size - existing,
+                             idcs=self.idcs, business_units=self.units)
+        for server in servers:
+            server.asset.approved_by = self.admin
+            server.asset.save(update_fields=['approved_by'])
+            models.EventLog.objects.create(name='硬件变更',
+                                           asset=server.asset,
+                                           event_type=1,
+                                           component='RAM',
+                                           user=self.admin)
+            models.NewAssetApprovalZone.objects.create(
+                sn='pending-%s' % server.asset.sn,
+                compressed_data=build_report(server.asset.sn, 2, 2, 2))
+
+    def test_changelist_query_counts(self):
+        for size in self.fleet_sizes:
+            self.grow_fleet(size)
+            for name, expected in self.changelists.items():
+                url = reverse('admin:assets_%s_changelist' % name)
+                with self.subTest(size=size, changelist=name), \
+                        self.assertNumQueries(expected):
+                    response = self.client.get(url)
+                    self.assertEqual(response.status_code, 200)
+
+
+class AdminFilterIndexTest(TestCase):
+    """ 大表后台列表页的过滤字段在库中都要是某个索引的第一列 """
+
+    def leading_columns(self, table):
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(
+                cursor, table)
+        return {
+            constraint['columns'][0]
+            for constraint in constraints.values()
+            if constraint['columns'] and (constraint['index'] or
+                                          constraint['unique'] or
+                                          constraint['primary_key'])
+        }
+
+    def test_list_filters_are_indexed(self):
+        for model, model_admin in admin.site._registry.items():
+            if not isinstance(model_admin, assets_admin.LargeTableAdmin):
+                continue
+            indexed = self.leading_columns(model._meta.db_table)
+            for name in model_admin.list_filter:
+                field = model._meta.get_field(name)
+                with self.subTest(model=model.__name__, field=name):
+                    self.assertIn(field.column, indexed)
+
+
+@override_settings(**QUERY_COUNT_SETTINGS)
+class ReportTimingTest(TestCase):
+    """ 最重的几条汇报路径的耗时上限
+    上限按测试用的 SQLite 内存数据库留了十倍左右的余量，只用来发现数量级的退化，不是性能指标。
+    """
+
+    components = 64
+    # 数据没有变化的汇报，平均每次的秒数上限
+    unchanged_budget = 0.05
+    # 组件全部更换的汇报，每次的秒数上限
+    changed_budget = 1.0
+
+    def setUp(self):
+        cache.clear()
+        heartbeat.buffer.take()
+        vendors.resolver.reload()
+        make_fleet('fleet', 20)
+        self.server = make_server('TIMING', self.components)
+
+    def post_report(self, data):
+        response = post_report(self.client, data)
+        self.assertEqual(response.json()['code'], 0)
+
+    def test_unchanged_report(self):
+        data = build_report('TIMING', self.components, self.components,
+                            self.components)
+        self.post_report(data)
+        rounds = 20
+        started = time.perf_counter()
+        for _ in range(rounds):
+            self.post_report(data)
+        elapsed = (time.perf_counter() - started) / rounds
+        self.assertLess(elapsed, self.unchanged_budget)
+
+    def test_changed_report(self):
+        for _ in range(3):
+            data = build_report('TIMING', self.components, self.components,
+                                self.components)
+            started = time.perf_counter()
+            self.post_report(data)
+            self.assertLess(time.perf_counter() - started,
+                            self.changed_budget)
+
+
+class VendorResolverTest(TestCase):
+    """ 厂商别名字典: 解析不访问数据库，汇报和待审批区使用标准厂商，批量整理合并重复厂商 """
+
+    def setUp(self):
+        cache.clear()
+        self.dell = models.Manufacturer.objects.create(name='Dell Inc.')
+        self.hpe = models.Manufacturer.objects.create(name='Hewlett-Packard')
+        models.ManufacturerAlias.objects.create(name='HP',
+                                                manufacturer=self.hpe)
+        vendors.resolver.reload()
+
+    def test_resolve_spellings_without_queries(self):
+        with self.assertNumQueries(0):
+            for name in ('Dell Inc.', 'DELL', 'Dell Inc', ' dell  inc. '):
+                self.assertEqual(vendors.resolver.resolve(name), self.dell.pk)
+            self.assertEqual(vendors.resolver.resolve('HP'), self.hpe.pk)
+            self.assertEqual(vendors.resolver.canonical('hp'),
+                             'Hewlett-Packard')
+            self.assertIsNone(vendors.resolver.resolve('Inspur'))
+            self.assertEqual(vendors.resolver.canonical(' Inspur '), 'Inspur')
+            self.assertIsNone(vendors.resolver.resolve(None))
+
+    def test_reload_after_version_bump(self):
+        models.ManufacturerAlias.objects.create(name='Inspur Electronic',
+                                                manufacturer=self.dell)
+        self.assertIsNone(vendors.resolver.resolve('Inspur Electronic'))
+        # TestCase 中 on_commit 回调不会执行，手动完成信号中的版本号自增
+        asset_cache.bump_version(vendors.VERSION_KEY)
+        self.assertEqual(vendors.resolver.resolve('Inspur Electronic'),
+                         self.dell.pk)
+
+    @override_settings(**QUERY_COUNT_SETTINGS)
+    def test_report_uses_standard_manufacturer(self):
+        data = build_report('VENDOR-1', 1, 1, 1)
+        data['manufacturer'] = 'DELL'
+        data['model'] = '  PowerEdge   R740 '
+        post_report(self.client, data)
+        zone = models.NewAssetApprovalZone.objects.get(sn='VENDOR-1')
+        self.assertEqual(zone.manufacturer, 'Dell Inc.')
+        self.assertEqual(zone.model, 'PowerEdge R740')
+
+        server = make_server('VENDOR-2', 1)
+        data = build_report('VENDOR-2', 1, 1, 1)
+        data['manufacturer'] = 'hp'
+        post_report(self.client, data)
+        server.asset.refresh_from_db()
+        self.assertEqual(server.asset.manufacturer_id, self.hpe.pk)
+
+    def test_numeric_manufacturer(self):
+        models.Manufacturer.objects.create(name='1234')
+        vendors.resolver.reload()
+        self.assertEqual(models.vendor_key(1234), '1234')
+        self.assertIsNotNone(vendors.resolver.resolve(1234))
+        # 格式校验会拒绝数字厂商，绕过校验直接调用也不能出错
+        data = build_report('VENDOR-3', 1, 1, 1)
+        data['manufacturer'] = 1234
+        asset_handler.NewAsset(None, data).add_to_new_assets_zone()
+        self.assertEqual(
+            models.NewAssetApprovalZone.objects.get(sn='VENDOR-3').manufacturer,
+            '1234')
+        server = make_server('VENDOR-4', 1)
+        data = build_report('VENDOR-4', 1, 1, 1)
+        data['manufacturer'] = 4321
+        asset_handler.UpdateAsset(None, server.asset, data).update()
+        server.asset.refresh_from_db()
+        self.assertIsNone(server.asset.manufacturer_id)
+
+    def test_normalize_command_merges_duplicates(self):
+        duplicate = models.Manufacturer.objects.create(name='DELL')
+        hp = models.Manufacturer.objects.create(name='HP Inc.')
+        assets = [make_server('MERGE-%d' % i, 1).asset for i in range(4)]
+        models.Asset.objects.filter(pk__in=[a.pk for a in assets[:3]]).update(
+            manufacturer=duplicate)
+        models.Asset.objects.filter(pk=assets[3].pk).update(manufacturer=hp)
+        models.NewAssetApprovalZone.objects.create(sn='Z1',
+                                                   manufacturer='DELL ',
+                                                   model='R740  xd')
+        models.NewAssetApprovalZone.objects.create(sn='Z2',
+                                                   manufacturer='Dell Inc.')
+
+        out = io.StringIO()
+        call_command('normalize_vendors', stdout=out)
+        self.assertEqual(
+            models.Asset.objects.filter(manufacturer=duplicate).count(), 3)
+
+        call_command('normalize_vendors', apply=True, delete_duplicates=True,
+                     stdout=out)
+        self.assertEqual(
+            models.Asset.objects.filter(manufacturer=self.dell).count(), 3)
+        self.assertEqual(
+            models.Asset.objects.get(pk=assets[3].pk).manufacturer_id,
+            self.hpe.pk)
+        self.assertFalse(
+            models.Manufacturer.objects.filter(
+                pk__in=[duplicate.pk, hp.pk]).exists())
+        self.assertEqual(
+            set(models.NewAssetApprovalZone.objects.values_list(
+                'manufacturer', flat=True)), {'Dell Inc.'})
+        self.assertEqual(
+            models.NewAssetApprovalZone.objects.get(sn='Z1').model, 'R740 xd')
+
+
+# 签名测试只放开限流，签名使用固定的测试密钥
+REPORT_AUTH_SETTINGS = dict(QUERY_COUNT_SETTINGS,
+                            REPORT_AUTH={
+                                'required': True,
+                                'max_skew': 300,
+                                'keys': {
+                                    'k1': 'secret-1'
+                                },
+                            })
+
+
+def signed_headers(body, secret=b'secret-1', timestamp=None, nonce='nonce-1',
+                   sn='AUTH-1', path='/assets/report/'):
+    """ 和客户端 Client/core/auth.py 一样生成签名请求头 """
+    timestamp = str(int(timestamp or time.time()))
+    return {
+        'HTTP_X_CMDB_SN': sn,
+        'HTTP_X_CMDB_KEY_ID': 'k1',
+        'HTTP_X_CMDB_TIMESTAMP': timestamp,
+        'HTTP_X_CMDB_NONCE': nonce,
+        'HTTP_X_CMDB_SIGNATURE': agent_auth.sign(secret, 'POST', path,
+                                                 timestamp, nonce, sn, body),
+    }
+
+
+@override_settings(**REPORT_AUTH_SETTINGS)
+class ReportAuthTest(TestCase):
+    """ 汇报签名: 签名错误、时间戳过期、重复的 nonce 和没有配置密钥都返回 401 """
+
+    def setUp(self):
+        cache.clear()
+        heartbeat.buffer.take()
+        self.factory = RequestFactory()
+
+    def make_request(self, **kwargs):
+        body = b'asset_data=%7B%7D'
+        return self.factory.post(
+            '/assets/report/', body,
+            content_type='application/x-www-form-urlencoded',
+            **signed_headers(body, **kwargs))
+
+    def test_valid_signature(self):
+        self.assertIsNone(agent_auth.get_key_ring().verify(
+            self.make_request()))
+
+    def test_bad_signature(self):
+        self.assertEqual(
+            agent_auth.get_key_ring().verify(
+                self.make_request(secret=b'wrong')), '签名错误')
+
+    def test_stale_timestamp(self):
+        self.assertEqual(
+            agent_auth.get_key_ring().verify(
+                self.make_request(timestamp=time.time() - 301)),
+            '时间戳已过期')
+
+    def test_replayed_nonce(self):
+        key_ring = agent_auth.get_key_ring()
+        self.assertIsNone(key_ring.verify(self.make_request()))
+        self.assertEqual(key_ring.verify(self.make_request()), '重复的请求')
+        self.assertIsNone(key_ring.verify(self.make_request(nonce='nonce-2')))
+
+    def test_report_view_rejects_unsigned_request(self):
+        data = build_report('AUTH-1', 1, 1, 1)
+        response = post_report(self.client, data)
+        self.assertEqual(response.status_code, 401)
+        self.assertFalse(
+            models.NewAssetApprovalZone.objects.filter(sn='AUTH-1').exists())
+
+    def test_empty_key_ring_rejects_every_report(self):
+        with override_settings(REPORT_AUTH={'required': True, 'keys': {}}):
+            self.assertEqual(
+                agent_auth.get_key_ring().verify(self.make_request()),
+                '服务器没有配置密钥')
+            data = build_report('AUTH-2', 1, 1, 1)
+            response = post_report(self.client, data)
+            self.assertEqual(response.status_code, 401)
+
+
+@override_settings(**REPORT_AUTH_SETTINGS)
+class ReportAdmissionTest(TestCase):
+    """ 准入控制: SN 请求头参与签名并且在签名验证之后才限流，来源IP只从可信代理的请求头中读取 """
+
+    def setUp(self):
+        cache.clear()
+        heartbeat.buffer.take()
+        self.factory = RequestFactory()
+
+    def signed_post(self, data, sn=None, nonce='nonce-1', **extra):
+        body = urlencode({'asset_data': json.dumps(data)}).encode()
+        headers = signed_headers(body, nonce=nonce,
+                                 sn=data['sn'] if sn is None else sn)
+        headers.update(extra)
+        return self.client.post(
+            reverse('assets:report'), body,
+            content_type='application/x-www-form-urlencoded', **headers)
+
+    def test_forged_sn_header_fails_signature(self):
+        data = build_report('ADM-1', 1, 1, 1)
+        response = self.signed_post(data, HTTP_X_CMDB_SN='ADM-OTHER')
+        self.assertEqual(response.status_code, 401)
+
+    def test_sn_header_must_match_report(self):
+        data = build_report('ADM-1', 1, 1, 1)
+        response = self.signed_post(data, sn='ADM-OTHER')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['code'], 1)
+        self.assertFalse(
+            models.NewAssetApprovalZone.objects.filter(sn='ADM-1').exists())
+
+    def test_unsigned_requests_do_not_consume_sn_tokens(self):
+        admission = dict(REPORT_AUTH_SETTINGS['REPORT_ADMISSION'],
+                         sn_burst=1, sn_rate=0.001)
+        data = build_report('ADM-2', 1, 1, 1)
+        with override_settings(REPORT_ADMISSION=admission):
+            for _ in range(3):
+                self.assertEqual(
+                    post_report(self.client, data).status_code, 401)
+            response = self.signed_post(data)
+            self.assertEqual(response.json()['code'], 0)
+            response = self.signed_post(data, nonce='nonce-2')
+            self.assertEqual(response.status_code, 429)
+
+    def test_client_ip_from_trusted_proxy(self):
+        controller = throttle.AdmissionController(
+            dict(throttle.get_config(), trusted_proxies=['10.0.0.1']))
+        forwarded = '1.1.1.1, 192.168.1.5'
+        request = self.factory.post('/', REMOTE_ADDR='10.0.0.1',
+                                    HTTP_X_FORWARDED_FOR=forwarded)
+        self.assertEqual(controller.client_ip(request), '192.168.1.5')
+        request = self.factory.post('/', REMOTE_ADDR='10.0.0.2',
+                                    HTTP_X_FORWARDED_FOR=forwarded)
+        self.assertEqual(controller.client_ip(request), '10.0.0.2')
+
+    def test_ip_bucket_per_client_behind_proxy(self):
+        controller = throttle.AdmissionController(
+            dict(throttle.get_config(), ip_burst=1, ip_rate=0.001,
+                 trusted_proxies=['10.0.0.1']))
+
+        def request(client):
+            return self.factory.post('/', REMOTE_ADDR='10.0.0.1',
+                                     HTTP_X_FORWARDED_FOR=client)
+
+        self.assertEqual(controller.check_ip(request('192.168.1.5')), 0)
+        self.assertEqual(controller.check_ip(request('192.168.1.6')), 0)
+        self.assertGreater(controller.check_ip(request('192.168.1.5')), 0)
+
+
+@override_settings(**QUERY_COUNT_SETTINGS)
+class AsgiApplicationTest(SimpleTestCase):
+    """ ASGI 入口: 请求体异步读完之后，所有请求都经过完整的中间件链，在线程池中处理 """
+
+    def setUp(self):
+        from DjangoCMDB import asgi
+        self.application = asgi.ASGIApplication()
+        self.addCleanup(self.application.executor.shutdown)
+
+    def call(self, scope, chunks):
+        messages = [{
+            'type': 'http.request',
+            'body': chunk,
+            'more_body': i < len(chunks) - 1
+        } for i, chunk in enumerate(chunks)]
+        sent = []
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message)
+
+        loop = asyncio.new_event_loop()
+        try:
+            loop.run_until_complete(self.application(scope, receive, send))
+        finally:
+            loop.close()
+        return sent
+
+    def test_report_passes_through_middleware(self):
+        sn = 'ASGI-1'
+        body = urlencode({
+            'asset_data': json.dumps(build_report(sn, 1, 1, 1))
+        }).encode()
+        scope = {
+            'type': 'http',
+            'method': 'POST',
+            'path': '/assets/report/',
+            'query_string': b'',
+            'headers': [
+                (b'content-type', b'application/x-www-form-urlencoded'),
+                (b'x-cmdb-sn', sn.encode()),
+            ],
+        }
+        pinned = []
+
+        def save_report(request, data):
+            pinned.append(db_router.is_pinned())
+            return HttpResponse('saved')
+
+        original = db_router.PrimaryPinningMiddleware.__call__
+        with mock.patch.object(views, 'save_report', save_report), \
+                mock.patch.object(db_router.PrimaryPinningMiddleware,
+                                  '__call__', autospec=True,
+                                  side_effect=original) as middleware:
+            sent = self.call(scope, [body[:100], body[100:]])
+        self.assertEqual(middleware.call_count, 1)
+        self.assertEqual(pinned, [True])
+        start, *chunks = sent
+        self.assertEqual(start['status'], 200)
+        # XFrameOptionsMiddleware 等中间件也都生效
+        self.assertIn((b'X-Frame-Options', b'SAMEORIGIN'), start['headers'])
+        self.assertEqual(b''.join(chunk['body'] for chunk in chunks), b'saved')
+        self.assertFalse(chunks[-1].get('more_body', False))
+
+    def test_body_too_large(self):
+        self.application.max_body_size = 10
+        sent = self.call({
+            'type': 'http',
+            'method': 'POST',
+            'path': '/assets/report/'
+        }, [b'x' * 8, b'x' * 8])
+        self.assertEqual(sent[0]['status'], 413)
+
+
+class AssetCacheTest(TestCase):
+    """ 资产详情和统计的缓存: 未命中时从主库重建，接口只对后台管理员开放 """
+
+    def setUp(self):
+        cache.clear()
+        db_router.unpin()
+
+    def tearDown(self):
+        db_router.unpin()
+
+    def test_save_then_read_returns_fresh_data(self):
+        asset = make_server('CACHE-1', 1).asset
+        self.assertEqual(asset_cache.get_asset_detail(asset.pk)['status'], 0)
+        summary = asset_cache.get_asset_summary()
+        asset.status = 1
+        asset.save()
+        models.Asset.objects.create(asset_type='networkdevice', sn='CACHE-2',
+                                    name='CACHE-2')
+        # TestCase 中 on_commit 回调不会执行，手动完成信号中的版本号自增
+        asset_cache.bump_version(asset_cache.ASSET_VERSION_KEY % asset.pk)
+        asset_cache.bump_version(asset_cache.LIST_VERSION_KEY)
+        # 下一个请求没有固定到主库，读操作会被路由到从库，但缓存必须从主库重建
+        db_router.unpin()
+        with mock.patch.object(db_router, 'get_replicas',
+                               return_value=['lagging-replica']):
+            self.assertEqual(
+                asset_cache.get_asset_detail(asset.pk)['status'], 1)
+            self.assertEqual(asset_cache.get_asset_summary()['total'],
+                             summary['total'] + 1)
+
+    def test_bump_in_another_process(self):
+        with tempfile.TemporaryDirectory() as location:
+            shared = {
+                'default': {
+                    'BACKEND':
+                    'django.core.cache.backends.filebased.FileBasedCache',
+                    'LOCATION': location,
+                }
+            }
+            with self.settings(CACHES=shared):
+                asset = make_server('CACHE-4', 1).asset
+                self.assertEqual(
+                    asset_cache.get_asset_detail(asset.pk)['status'], 0)
+                models.Asset.objects.filter(pk=asset.pk).update(status=1)
+                # 另一个工作进程写入之后自增版本号，它有自己的缓存连接，只共享缓存目录
+                other = FileBasedCache(location, {})
+                with mock.patch.object(asset_cache, 'cache', other):
+                    asset_cache.bump_version(asset_cache.ASSET_VERSION_KEY %
+                                             asset.pk)
+                self.assertEqual(
+                    asset_cache.get_asset_detail(asset.pk)['status'], 1)
+
+    def test_bump_never_reuses_a_version(self):
+        key = asset_cache.LIST_VERSION_KEY
+        seen = {asset_cache.get_version(key)}
+        with mock.patch('time.time', return_value=1000.0):
+            for _ in range(10):
+                asset_cache.bump_version(key)
+                seen.add(asset_cache.get_version(key))
+                # 版本号被缓存淘汰之后重建
+                cache.delete(key)
+                seen.add(asset_cache.get_version(key))
+        self.assertEqual(len(seen), 21)
+
+    def test_deploy_check_rejects_local_memory_cache(self):
+        locmem = {'default': {'BACKEND': checks.LOCMEM_BACKEND}}
+        with self.settings(CACHES=locmem):
+            self.assertEqual([e.id for e in checks.check_shared_cache(None)],
+                             ['assets.E001'])
+        memcached = {
+            'default': {
+                'BACKEND':
+                'django.core.cache.backends.memcached.MemcachedCache',
+                'LOCATION': ['127.0.0.1:11211'],
+            }
+        }
+        with self.settings(CACHES=memcached):
+            self.assertEqual(checks.check_shared_cache(None), [])
+
+    def test_views_require_staff(self):
+        asset = make_server('CACHE-3', 1).asset
+        urls = [
+            reverse('assets:detail', args=[asset.pk]),
+            reverse('assets:summary'),
+        ]
+        for url in urls:
+            self.assertEqual(self.client.get(url).status_code, 302)
+        user = User.objects.create_user('viewer', password='pw')
+        self.client.force_login(user)
+        for url in urls:
+            self.assertEqual(self.client.get(url).status_code, 302)
+        user.is_staff = True
+        user.save()
+        for url in urls:
+            self.assertEqual(self.client.get(url).status_code, 200)
+
+
+class ImportInventoryTest(TestCase):
+    """ 批量导入: SN 和名称都按清理之后的值去重，重名的资产改用SN作为名称 """
+
+    def setUp(self):
+        cache.clear()
+        self.tmp = tempfile.TemporaryDirectory()
+        models.Asset.objects.create(asset_type='server', sn='OLD-1',
+                                    name='web-01')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def import_file(self, name, content):
+        path = os.path.join(self.tmp.name, name)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        out = io.StringIO()
+        call_command('import_inventory', path, stdout=out)
+        return out.getvalue()
+
+    def test_import_csv(self):
+        out = self.import_file(
+            'assets.csv', 'sn,name,asset_type,manufacturer,tags,cpu_model\n'
+            'IMP-1,web-01,server,DELL,web;prod,Xeon\n'
+            'IMP-2,web-02,server,Dell Inc.,web,\n'
+            'IMP-3,web-02,server,,,\n'
+            'OLD-1,web-04,server,,,\n'
+            ',web-05,server,,,\n')
+        names = dict(
+            models.Asset.objects.filter(sn__startswith='IMP-').values_list(
+                'sn', 'name'))
+        self.assertEqual(names, {
+            'IMP-1': 'IMP-1',
+            'IMP-2': 'web-02',
+            'IMP-3': 'IMP-3'
+        })
+        self.assertIn('新增 3, 已存在跳过 1, 缺少SN 1, 名称重复改用SN 2', out)
+        self.assertEqual(models.Manufacturer.objects.count(), 1)
+        self.assertEqual(
+            models.Asset.objects.get(sn='IMP-1').tags.count(), 2)
+        self.assertEqual(models.CPU.objects.filter(
+            asset__sn='IMP-1').count(), 1)
+        self.assertEqual(models.Server.objects.filter(
+            asset__sn__startswith='IMP-').count(), 3)
+
+    def test_blank_asset_type_imports_a_server(self):
+        self.import_file(
+            'assets.csv', 'sn,name,asset_type,model\n'
+            'BLANK-1,blank-1,,R740\n'
+            'BLANK-2,blank-2, server ,R640\n'
+            'BLANK-3,blank-3,switch,\n')
+        self.assertEqual(
+            dict(models.Asset.objects.filter(
+                sn__startswith='BLANK-').values_list('sn', 'asset_type')),
+            {'BLANK-1': 'server', 'BLANK-2': 'server', 'BLANK-3': 'switch'})
+        self.assertEqual(
+            dict(models.Server.objects.filter(
+                asset__sn__startswith='BLANK-').values_list(
+                    'asset__sn', 'model')),
+            {'BLANK-1': 'R740', 'BLANK-2': 'R640'})
+
+    def test_ndjson_values_are_cleaned(self):
+        rows = [{'sn': ' NJ-1 ', 'name': 'nj-1 '}, {'sn': 'NJ-1'},
+                {'sn': ' OLD-1'}, {'sn': 'NJ-2', 'name': 'web-01'}]
+        out = self.import_file('assets.ndjson',
+                               '\n'.join(json.dumps(row) for row in rows))
+        self.assertEqual(
+            dict(models.Asset.objects.filter(
+                sn__startswith='NJ-').values_list('sn', 'name')),
+            {'NJ-1': 'nj-1', 'NJ-2': 'NJ-2'})
+        self.assertIn('新增 2, 已存在跳过 2', out)
+
+
+class TopologyTest(TestCase):
+    """ 虚拟机拓扑: 递归查询上下级、层数上限、迁移时拒绝成环，原生 SQL 按读写分离路由选择数据库 """
+
+    def setUp(self):
+        cache.clear()
+        db_router.unpin()
+        # host -> vm1 -> nested, host -> vm2
+        self.host = make_server('TOPO-HOST', 2)
+        self.vm1 = make_server('TOPO-VM1', 1, host=self.host)
+        self.vm2 = make_server('TOPO-VM2', 1, host=self.host)
+        self.nested = make_server('TOPO-NESTED', 1, host=self.vm1)
+        self.spare = make_server('TOPO-SPARE', 1)
+
+    def tearDown(self):
+        db_router.unpin()
+
+    def test_descendants(self):
+        self.assertEqual(
+            sorted(topology.guest_ids(self.host)),
+            sorted([self.vm1.pk, self.vm2.pk, self.nested.pk]))
+        self.assertEqual(
+            sorted(topology.guest_ids(self.host, recursive=False)),
+            sorted([self.vm1.pk, self.vm2.pk]))
+        self.assertEqual(topology.guest_ids(self.vm1), [self.nested.pk])
+        self.assertEqual(topology.guest_ids(self.nested), [])
+
+    def test_resources_roll_up_to_every_ancestor(self):
+        resources = topology.guest_resources(recursive=True)
+        self.assertEqual(resources[self.host.pk]['guests'], 3)
+        self.assertEqual(resources[self.host.pk]['ram'], 48)
+        self.assertEqual(resources[self.vm1.pk], {
+            'guests': 1,
+            'ram': 16,
+            'cores': 32
+        })
+        direct = topology.guest_resources([self.host.pk])
+        self.assertEqual(direct[self.host.pk]['guests'], 2)
+
+    def test_max_depth_is_reported(self):
+        parent = self.nested
+        for i in range(topology.MAX_DEPTH - 2):
+            parent = make_server('TOPO-CHAIN-%d' % i, 0, host=parent)
+        # host 下面正好 MAX_DEPTH 层，结果完整
+        self.assertEqual(len(topology.guest_ids(self.host)),
+                         topology.MAX_DEPTH + 1)
+        self.assertEqual(
+            topology.guest_resources([self.host.pk],
+                                     recursive=True)[self.host.pk]['guests'],
+            topology.MAX_DEPTH + 1)
+        # 再多一层时不返回被截断的结果
+        make_server('TOPO-CHAIN-LAST', 0, host=parent)
+        with self.assertRaises(topology.TopologyTooDeep):
+            topology.guest_ids(self.host)
+        with self.assertRaises(topology.TopologyTooDeep):
+            topology.guest_resources(recursive=True)
+        with self.assertRaises(topology.TopologyTooDeep):
+            topology.reassign([self.host.pk], self.spare)
+        self.assertIsNone(
+            models.Server.objects.get(pk=self.host.pk).hosted_on_id)
+        # 只统计直接下级时不受层数影响
+        self.assertEqual(
+            topology.guest_resources([self.host.pk])[self.host.pk]['guests'],
+            2)
+        # 数据中出现环时递归也会停止
+        models.Server.objects.filter(pk=self.host.pk).update(
+            hosted_on=self.nested)
+        with self.assertRaises(topology.TopologyTooDeep):
+            topology.guest_ids(self.vm1)
+
+    def test_requires_recursive_cte_support(self):
+        connection = mock.Mock(vendor='mysql', mysql_is_mariadb=False,
+                               mysql_version=(5, 7, 30))
+        with self.assertRaisesMessage(NotSupportedError, 'MySQL 8.0'):
+            topology._topology_cte(connection)
+        connection.mysql_version = (8, 0, 21)
+        connection.ops.quote_name = lambda name: '`%s`' % name
+        sql, params = topology._topology_cte(connection, [1])
+        self.assertIn('WITH RECURSIVE', sql)
+        self.assertEqual(params, [1, topology.MAX_DEPTH + 1])
+        connection.mysql_is_mariadb = True
+        connection.mysql_version = (10, 1, 48)
+        with self.assertRaisesMessage(NotSupportedError, 'MariaDB 10.2.2'):
+            topology._topology_cte(connection)
+
+    def test_reassign_rejects_cycles(self):
+        for target in (self.vm1, self.nested):
+            with self.assertRaises(ValueError):
+                topology.reassign([self.vm1.pk], target)
+        self.assertEqual(
+            models.Server.objects.get(pk=self.vm1.pk).hosted_on_id,
+            self.host.pk)
+
+    def test_reads_follow_router_and_reassign_uses_primary(self):
+        with mock.patch.object(db_router, 'get_replicas',
+                               return_value=['lagging-replica']), \
+                mock.patch.object(topology.router, 'db_for_read',
+                                  return_value='default') as db_for_read:
+            topology.guest_ids(self.host)
+            db_for_read.assert_called_with(models.Server)
+        db_router.unpin()
+        # 从库不存在，迁移中任何一条读操作走了从库都会报错
+        with mock.patch.object(db_router, 'get_replicas',
+                               return_value=['lagging-replica']):
+            self.assertEqual(topology.evacuate(self.host, self.spare), 2)
+        self.assertEqual(
+            sorted(topology.guest_ids(self.spare, recursive=False)),
+            sorted([self.vm1.pk, self.vm2.pk]))
+
+
+class LicenseUtilisationTest(TestCase):
+    """ 授权统计: 系统版本变化后计数随之调整，补齐计数时不覆盖已经缓存的值 """
+
+    def setUp(self):
+        cache.clear()
+        self.servers = [make_server('LIC-%d' % i, 0) for i in range(3)]
+        models.Software.objects.create(sub_asset_type=0, license_num=2,
+                                       version='CentOS 7.6')
+        models.Software.objects.create(sub_asset_type=0, license_num=5,
+                                       version='CentOS 8.2')
+
+    def installed(self):
+        return {
+            row['version']: row['installed']
+            for row in licenses.utilisation()
+        }
+
+    def test_counts_follow_os_changes(self):
+        self.assertEqual(self.installed(), {'CentOS 7.6': 3, 'CentOS 8.2': 0})
+        # TestCase 中 on_commit 回调不会执行，这里让它立即执行
+        with mock.patch('django.db.transaction.on_commit',
+                        side_effect=lambda func: func()):
+            server = self.servers[0]
+            server.os_release = 'CentOS 8.2'
+            server.save()
+            with self.assertNumQueries(1):
+                # 只读软件表，计数全部来自缓存
+                self.assertEqual(self.installed(), {
+                    'CentOS 7.6': 2,
+                    'CentOS 8.2': 1
+                })
+            self.servers[1].delete()
+        self.assertEqual(self.installed(), {'CentOS 7.6': 1, 'CentOS 8.2': 1})
+
+    def test_versions_match_exactly(self):
+        models.Software.objects.create(sub_asset_type=0, license_num=1,
+                                       version='CentOS 7')
+        models.Software.objects.create(sub_asset_type=0, license_num=1,
+                                       version='centos-7.6')
+        installed = self.installed()
+        # 规范化之后相同的写法计入同一个授权，版本号的前缀不算匹配
+        self.assertEqual(installed['centos-7.6'], 3)
+        self.assertEqual(installed['CentOS 7'], 0)
+
+    def test_fill_does_not_overwrite_cached_count(self):
+        key = models.license_key('CentOS 7.6')
+        cache_key = licenses._count_key(
+            asset_cache.get_version(licenses.VERSION_KEY), key)
+        cache.set(cache_key, 4)
+        # 模拟读缓存时还没有计数，统计期间别的进程写入了更新的计数
+        with mock.patch.object(licenses.cache, 'get_many', return_value={}):
+            self.assertEqual(licenses.install_counts([key]), {key: 3})
+        self.assertEqual(cache.get(cache_key), 4)
+
+    def test_view_requires_staff(self):
+        url = reverse('assets:licenses')
+        self.assertEqual(self.client.get(url).status_code, 302)
+        self.client.force_login(
+            User.objects.create_user('admin', password='pw', is_staff=True))
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['over_deployed'], 1)
+
+    def test_schema_versions_for_os_release(self):
+        data = build_report('LIC-SCHEMA', 1, 1, 1)
+        data['os_release'] = 'x' * 200
+        data['schema_version'] = 1
+        self.assertEqual(report_schema.validator.validate(data), [])
+        data['schema_version'] = 2
+        errors = report_schema.validator.validate(data)
+        self.assertEqual([(e['code'], e['field']) for e in errors],
+                         [(report_schema.TOO_LONG, 'os_release')])
+
+    @override_settings(**QUERY_COUNT_SETTINGS)
+    def test_v1_os_release_truncated_on_save(self):
+        data = build_report('LIC-LONG', 1, 1, 1)
+        data['os_release'] = 'x' * 200
+        self.assertEqual(post_report(self.client, data).json()['code'], 0)
+        self.assertEqual(
+            models.NewAssetApprovalZone.objects.get(
+                sn='LIC-LONG').os_release, 'x' * 64)
+
+
+class ExpiryCalendarTest(TestCase):
+    """ 到期日历: 查询范围不能超过最近一次重建时覆盖的月份 """
+
+    def setUp(self):
+        self.client.force_login(
+            User.objects.create_user('admin', password='pw', is_staff=True))
+        start = expiry.month_start(timezone.localdate())
+        self.idc = models.IDC.objects.create(name='IDC-E')
+        for months, count in ((1, 2), (5, 1)):
+            for i in range(count):
+                models.Asset.objects.create(
+                    asset_type='server', sn='EXP-%d-%d' % (months, i),
+                    name='EXP-%d-%d' % (months, i), idc=self.idc,
+                    expire_day=expiry.add_months(start, months))
+        contract = models.Contract.objects.create(
+            sn='C-1', name='C-1', price=0, license_num=10,
+            end_day=expiry.add_months(start, 1))
+        models.Asset.objects.filter(sn='EXP-1-0').update(contract=contract)
+
+    def get(self, **params):
+        return self.client.get(reverse('assets:expiry'), params)
+
+    def test_months_capped_by_refresh_horizon(self):
+        expiry.refresh_buckets(3)
+        response = self.get(months=3)
+        self.assertEqual(response.status_code, 200)
+        buckets = response.json()['buckets']
+        self.assertEqual(
+            [(row['kind'], row['count'], row['license_num'])
+             for row in buckets], [('asset', 2, 0), ('contract', 1, 10)])
+        response = self.get(months=6)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('1 到 3', response.json()['error'])
+
+        expiry.refresh_buckets(6)
+        response = self.get(months=6, group='idc')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            sum(row['count'] for row in response.json()['buckets']
+                if row['kind'] == 'asset'), 3)
+        self.assertEqual(self.get(months=7).status_code, 400)
+
+    def test_invalid_parameters(self):
+        expiry.refresh_buckets()
+        self.assertEqual(self.get(months=0).status_code, 400)
+        self.assertEqual(self.get(months='x').status_code, 400)
+        self.assertEqual(self.get(group='rack').status_code, 400)
+        self.assertEqual(self.get(months=expiry.DEFAULT_HORIZON).status_code,
+                         200)
+
+    def test_view_requires_staff(self):
+        self.client.logout()
+        self.assertEqual(self.get().status_code, 302)
+
+
+class ReportSchemaTest(SimpleTestCase):
+    """ 汇报数据校验: 合法数据、各类错误和格式版本协商 """
+
+    def codes(self, data):
+        return [(e['code'], e['field'])
+                for e in report_schema.validator.validate(data)]
+
+    def test_valid_report(self):
+        data = build_report('SCHEMA-1', 2, 2, 2)
+        self.assertEqual(self.codes(data), [])
+        # 数字插槽按字符串接受，没有定义在格式中的字段原样保留
+        data['RAM'][0]['slot'] = 3
+        data['extra'] = {'anything': 1}
+        self.assertEqual(self.codes(data), [])
+
+    def test_invalid_fields(self):
+        data = build_report('SCHEMA-2', 1, 1, 1)
+        del data['sn']
+        data['asset_type'] = 'laptop'
+        data['cpu_count'] = 'two'
+        data['ram_size'] = -1
+        data['model'] = 'x' * 129
+        data['RAM'][0]['slot'] = None
+        data['nic'] = 'eth0'
+        self.assertEqual(self.codes(data), [
+            (report_schema.REQUIRED, 'sn'),
+            (report_schema.INVALID_CHOICE, 'asset_type'),
+            (report_schema.TOO_LONG, 'model'),
+            (report_schema.OUT_OF_RANGE, 'ram_size'),
+            (report_schema.INVALID_TYPE, 'cpu_count'),
+            (report_schema.REQUIRED, 'RAM[0].slot'),
+            (report_schema.INVALID_TYPE, 'nic'),
+        ])
+
+    def test_errors_are_capped(self):
+        data = build_report('SCHEMA-3', 1, 1, 100)
+        for ram in data['RAM']:
+            ram['capacity'] = 'big'
+        self.assertEqual(len(self.codes(data)), report_schema.MAX_ERRORS)
+
+    def test_parse_errors(self):
+        parse = report_schema.validator.parse
+        self.assertEqual(parse(None)[1][0]['code'], report_schema.REQUIRED)
+        self.assertEqual(parse('{')[1][0]['code'],
+                         report_schema.INVALID_JSON)
+        self.assertEqual(parse('[]')[1][0]['code'], report_schema.NOT_OBJECT)
+        self.assertEqual(parse('{}')[1][0]['code'], report_schema.EMPTY)
+
+    def test_version_negotiation(self):
+        data = build_report('SCHEMA-4', 1, 1, 1)
+        for version in (1, 2):
+            data['schema_version'] = version
+            self.assertEqual(self.codes(data), [])
+        for version in (3, '1', True):
+            data['schema_version'] = version
+            self.assertEqual(self.codes(data),
+                             [(report_schema.UNSUPPORTED_VERSION,
+                               'schema_version')])
+        del data['schema_version']
+        data['os_release'] = 'x' * 100
+        # 没有声明版本的旧客户端按版本 1 校验
+        self.assertEqual(self.codes(data), [])
+
+    def test_disk_without_sn_is_accepted(self):
+        data = build_report('SCHEMA-5', 1, 2, 1)
+        data['physical_disk_driver'][1]['sn'] = None
+        self.assertEqual(self.codes(data), [])
+
+    def test_addresses_are_parsed(self):
+        data = build_report('SCHEMA-6', 3, 1, 1)
+        data['nic'][0].update(ip_address=['10.0.0.1', 'fe80::1'],
+                              net_mask=['255.255.255.0', '64'])
+        data['nic'][1].update(ip_address='', net_mask='')
+        self.assertEqual(self.codes(data), [])
+        data['nic'][0]['ip_address'] = ['10.0.0.1', 'not-an-ip-address']
+        data['nic'][1]['ip_address'] = '10.0.0.256'
+        data['nic'][2]['net_mask'] = '255.255.255.0 '
+        self.assertEqual(self.codes(data), [
+            (report_schema.INVALID_TYPE, 'nic[0].ip_address[1]'),
+            (report_schema.INVALID_TYPE, 'nic[1].ip_address'),
+            (report_schema.INVALID_TYPE, 'nic[2].net_mask'),
+        ])
+        # 前缀长度只能用于掩码
+        data = build_report('SCHEMA-7', 1, 1, 1)
+        data['nic'][0]['ip_address'] = '24'
+        self.assertEqual(self.codes(data),
+                         [(report_schema.INVALID_TYPE, 'nic[0].ip_address')])
+
+    def test_values_the_database_rejects(self):
+        data = report_schema.validator.parse(json.dumps(
+            dict(build_report('SCHEMA-8', 1, 3, 1), ram_size='²')).replace(
+                '"capacity": 3726', '"capacity": NaN', 1))[0]
+        data['physical_disk_driver'][1]['capacity'] = float('inf')
+        data['physical_disk_driver'][2]['interface_type'] = 'FOOBAR'
+        data['manufacturer'] = 1234
+        data['physical_disk_driver'][0]['slot'] = 1.5
+        self.assertEqual(self.codes(data), [
+            (report_schema.INVALID_TYPE, 'manufacturer'),
+            (report_schema.INVALID_TYPE, 'ram_size'),
+            (report_schema.INVALID_TYPE, 'physical_disk_driver[0].slot'),
+            (report_schema.INVALID_TYPE, 'physical_disk_driver[0].capacity'),
+            (report_schema.INVALID_TYPE, 'physical_disk_driver[1].capacity'),
+            (report_schema.INVALID_CHOICE,
+             'physical_disk_driver[2].interface_type'),
+        ])
+
+
+@override_settings(**QUERY_COUNT_SETTINGS)
+class DiskWithoutSnTest(TestCase):
+    """ 没有SN的虚拟机硬盘在入库时忽略，其余数据照常更新 """
+
+    def setUp(self):
+        cache.clear()
+        heartbeat.buffer.take()
+
+    def test_disk_without_sn_is_ignored(self):
+        server = make_server('VM-DISK', 1)
+        data = build_report('VM-DISK', 1, 2, 1)
+        data['physical_disk_driver'][0]['sn'] = None
+        result = post_report(self.client, data).json()
+        self.assertEqual(result['code'], 0)
+        self.assertEqual([(w['code'], w['field']) for w in result['warnings']],
+                         [(report_schema.IGNORED,
+                           'physical_disk_driver[0].sn')])
+        self.assertEqual(
+            list(models.Disk.objects.filter(asset=server.asset).values_list(
+                'sn', flat=True)), [data['physical_disk_driver'][1]['sn']])
+
+
+class ArchiveEventLogTest(TestCase):
+    """ 事件日志归档: 归档之后从热表删除，删除失败时不产生归档文件，中断留下的临时文件在下次归档时处理 """
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.archive_dir = self.tmp.name
+        asset = make_server('ARCHIVE-1', 0).asset
+        event_log.bulk_log([
+            models.EventLog(name='旧事件%d' % i, asset=asset, datail='x')
+            for i in range(5)
+        ] + [models.EventLog(name='新事件', asset=asset, datail='y')])
+        old = timezone.now() - datetime.timedelta(days=100)
+        models.EventLog.objects.exclude(name='新事件').update(date=old)
+        self.asset = asset
+        self.before = timezone.now() - datetime.timedelta(days=90)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def archive(self):
+        # TestCase 中 on_commit 回调不会执行，这里让它立即执行
+        with mock.patch('django.db.transaction.on_commit',
+                        side_effect=lambda func, using=None: func()):
+            return event_log.archive_events(self.before, chunk_size=2,
+                                            archive_dir=self.archive_dir)
+
+    def archived_names(self):
+        return sorted(event['name'] for event in
+                      event_log.iter_archived_events(
+                          self.asset.id, archive_dir=self.archive_dir))
+
+    def test_archive_then_delete(self):
+        self.assertEqual(self.archive(), 5)
+        self.assertEqual(
+            list(models.EventLog.objects.values_list('name', flat=True)),
+            ['新事件'])
+        self.assertEqual(self.archived_names(),
+                         ['旧事件%d' % i for i in range(5)])
+        self.assertFalse([
+            name for name in os.listdir(self.archive_dir)
+            if name.endswith('.tmp')
+        ])
+        out = io.StringIO()
+        call_command('archive_eventlog', asset='ARCHIVE-1',
+                     archive_dir=self.archive_dir, stdout=out)
+        self.assertIn('共 5 条归档事件', out.getvalue())
+
+    def test_failed_delete_publishes_nothing(self):
+        with mock.patch('django.db.models.query.QuerySet.delete',
+                        side_effect=DatabaseError('locked')):
+            with self.assertRaises(DatabaseError):
+                self.archive()
+        self.assertEqual(models.EventLog.objects.count(), 6)
+        self.assertEqual(self.archived_names(), [])
+        # 再次归档时丢弃上一次的临时文件，每个事件只归档一次
+        self.assertEqual(self.archive(), 5)
+        self.assertEqual(self.archived_names(),
+                         ['旧事件%d' % i for i in range(5)])
+
+    def test_committed_batch_is_published_on_recovery(self):
+        rows = list(
+            models.EventLog.objects.filter(date__lt=self.before).order_by(
+                'id').values(*event_log.ARCHIVE_FIELDS)[:2])
+        path = event_log.archive_path(self.archive_dir, rows[0]['date'],
+                                      rows[0]['id'])
+        event_log.write_archive(path + '.tmp', rows)
+        # 删除已经提交，改名之前进程退出
+        models.EventLog.objects.filter(id__in=[r['id'] for r in rows]).delete()
+        self.assertEqual(self.archive(), 3)
+        self.assertEqual(self.archived_names(),
+                         ['旧事件%d' % i for i in range(5)])
+
+
+class ReportHistoryTest(TestCase):
+    """ 汇报历史: 压缩存储可以原样读回，相同内容共用数据块，按自然键比较组件 """
+
+    def test_round_trip_and_dedup(self):
+        t0 = timezone.now() - datetime.timedelta(hours=2)
+        first = build_report('HIST-1', 2, 2, 2)
+        self.assertIsNotNone(report_history.record_report('HIST-1', first, t0))
+        # 内容相同时不写库
+        with self.assertNumQueries(1):
+            self.assertIsNone(
+                report_history.record_report('HIST-1', json.loads(
+                    json.dumps(first))))
+        second = dict(first, os_release='CentOS 8.2')
+        t1 = t0 + datetime.timedelta(hours=1)
+        report_history.record_report('HIST-1', second, t1)
+        # 另一台资产汇报了完全相同的数据，复用数据块
+        report_history.record_report('HIST-2', second, t1)
+        self.assertEqual(models.ReportBlob.objects.count(), 2)
+
+        self.assertEqual(report_history.state_at('HIST-1', t0), first)
+        self.assertEqual(
+            report_history.state_at('HIST-1',
+                                    t0 + datetime.timedelta(minutes=30)),
+            first)
+        self.assertEqual(report_history.state_at('HIST-1', t1), second)
+        self.assertIsNone(
+            report_history.state_at('HIST-1',
+                                    t0 - datetime.timedelta(seconds=1)))
+
+        versions = list(report_history.timeline('HIST-1'))
+        self.assertEqual(len(versions), 2)
+        self.assertEqual(
+            report_history.diff_versions(*versions)['changed'], {
+                'os_release': (first['os_release'], 'CentOS 8.2')
+            })
+
+    def test_diff_reports_by_natural_key(self):
+        old = build_report('HIST-3', 2, 2, 2)
+        new = json.loads(json.dumps(old))
+        # 内存条顺序变化不算修改，一条容量变化，一块硬盘更换
+        new['RAM'].reverse()
+        new['RAM'][0]['capacity'] = 32
+        new['physical_disk_driver'][1]['sn'] = 'NEW-DISK'
+        new['memo'] = 'rack 3'
+        del new['cpu_count']
+        changes = report_history.diff_reports(old, new)
+        self.assertEqual(changes['changed'],
+                         {'RAM[DIMM_A1].capacity': (16, 32)})
+        old_disk = old['physical_disk_driver'][1]
+        self.assertEqual(changes['removed'], {
+            'physical_disk_driver[%s]' % old_disk['sn']: old_disk,
+            'cpu_count': 2,
+        })
+        self.assertEqual(changes['added'], {
+            'physical_disk_driver[NEW-DISK]': new['physical_disk_driver'][1],
+            'memo': 'rack 3',
+        })
+
+
+class CompressedReportDataTest(TestCase):
+    """ 待审批区的压缩字段: 读写都是 dict，库中是压缩后的字节，旧的明文数据由迁移转存 """
+
+    def test_field_round_trip(self):
+        data = build_report('ZIP-1', 8, 8, 8)
+        models.NewAssetApprovalZone.objects.create(sn='ZIP-1',
+                                                   compressed_data=data)
+        zone = models.NewAssetApprovalZone.objects.get(sn='ZIP-1')
+        self.assertEqual(zone.compressed_data, data)
+        self.assertEqual(zone.report_data, data)
+        # 库中保存的是压缩后的字节
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT compressed_data FROM %s WHERE sn = %%s' %
+                models.NewAssetApprovalZone._meta.db_table, ['ZIP-1'])
+            raw = bytes(cursor.fetchone()[0])
+        self.assertLess(len(raw), len(json.dumps(data)) / 2)
+        self.assertEqual(json.loads(zlib.decompress(raw).decode()), data)
+
+    def test_migration_moves_plain_json_and_back(self):
+        migration = importlib.import_module(
+            'assets.migrations.0013_compress_report_data')
+        schema_editor = mock.Mock(connection=connection)
+        plain = [build_report('ZIP-PLAIN-%d' % i, 1, 1, 1) for i in range(3)]
+        for data in plain:
+            models.NewAssetApprovalZone.objects.create(sn=data['sn'],
+                                                       data=json.dumps(data))
+        models.NewAssetApprovalZone.objects.create(
+            sn='ZIP-DONE', compressed_data={'sn': 'ZIP-DONE'})
+        with mock.patch.object(migration, 'CHUNK_SIZE', 2):
+            migration.compress_report_data(apps, schema_editor)
+        for data in plain:
+            zone = models.NewAssetApprovalZone.objects.get(sn=data['sn'])
+            self.assertEqual(zone.data, '')
+            self.assertEqual(zone.compressed_data, data)
+        self.assertEqual(
+            models.NewAssetApprovalZone.objects.get(sn='ZIP-DONE').report_data,
+            {'sn': 'ZIP-DONE'})
+
+        with mock.patch.object(migration, 'CHUNK_SIZE', 2):
+            migration.decompress_report_data(apps, schema_editor)
+        self.assertFalse(
+            models.NewAssetApprovalZone.objects.filter(
+                compressed_data__isnull=False).exists())
+        for data in plain:
+            zone = models.NewAssetApprovalZone.objects.get(sn=data['sn'])
+            self.assertEqual(json.loads(zone.data), data)
+            self.assertEqual(zone.report_data, data)
+
+
+class ReportScheduleTest(TestCase):
+    """ 汇报间隔: 按资产状态和负载计算，结果总是限制在 [min, max] 之内 """
+
+    def setUp(self):
+        self.config = dict(report_schedule.DEFAULTS, jitter=0)
+        self.meter = report_schedule.RateMeter()
+        patcher = mock.patch.object(report_schedule, 'meter', self.meter)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def interval(self, sn=None, **kwargs):
+        return report_schedule.next_interval(sn, config=self.config, **kwargs)
+
+    def record(self, sn, days_ago):
+        models.ReportVersion.objects.create(
+            sn=sn,
+            blob=models.ReportBlob.objects.create(digest='%s-%s' %
+                                                  (sn, days_ago),
+                                                  data=b'',
+                                                  size=0),
+            reported_at=timezone.now() - datetime.timedelta(days=days_ago))
+
+    def test_intervals_by_state(self):
+        self.assertEqual(self.interval(), 3600)
+        self.assertEqual(self.interval('SCHED-NEW', online=False), 600)
+        # 没有汇报历史或者本次有变化
+        self.assertEqual(self.interval('SCHED-1'), 1800)
+        self.record('SCHED-2', 2)
+        self.assertEqual(self.interval('SCHED-2'), 3600 * 3)
+        self.assertEqual(self.interval('SCHED-2', changed=True), 1800)
+        for days in (1, 2, 3):
+            self.record('SCHED-FLAP', days)
+        self.assertEqual(self.interval('SCHED-FLAP'), 600)
+
+    def test_clamped_to_min_and_max(self):
+        # 稳定很久的服务器不超过 max
+        self.record('SCHED-OLD', 365)
+        self.assertEqual(self.interval('SCHED-OLD'), 86400)
+        # 负载很高时所有间隔都被拉长，但仍然不超过 max
+        now = time.time()
+        for _ in range(int(self.config['target_rate'] * 60 * 100)):
+            self.meter.hit(now)
+        self.assertAlmostEqual(report_schedule.load_factor(self.config), 100,
+                               delta=1)
+        self.assertEqual(self.interval(), 86400)
+        # 抖动不会让间隔低于 min
+        self.meter.slots = [0] * self.meter.seconds
+        self.config.update(jitter=0.9)
+        for _ in range(50):
+            interval = self.interval('SCHED-NEW', online=False)
+            self.assertGreaterEqual(interval, self.config['min'])
+            self.assertLessEqual(interval, self.config['min'] * 1.9)
+
+    def test_rate_meter_window(self):
+        now = 1000000
+        for second in range(10):
+            self.meter.hit(now + second)
+        self.assertAlmostEqual(self.meter.rate(now + 9), 10 / 60.0)
+        # 一分钟之前的计数不再计入
+        self.assertAlmostEqual(self.meter.rate(now + 65), 4 / 60.0)
+
+
+class StaleAssetsTest(TestCase):
+    """ 最近汇报时间: 心跳在内存中合并后批量写库，stale_assets 按机房列出长时间没有汇报的资产 """
+
+    def setUp(self):
+        self.idc = models.IDC.objects.create(name='IDC-S')
+        self.fresh = make_server('STALE-FRESH', 0, self.idc).asset
+        self.stale = make_server('STALE-OLD', 0, self.idc).asset
+        self.lost = make_server('STALE-LOST', 0).asset
+        self.never = make_server('STALE-NEVER', 0).asset
+        self.offline = make_server('STALE-OFFLINE', 0).asset
+        models.Asset.objects.filter(pk=self.offline.pk).update(status=1)
+
+    def test_heartbeats_coalesce_into_one_update(self):
+        now = timezone.now()
+        buffer = heartbeat.HeartbeatBuffer(flush_interval=3600)
+        buffer.beat(self.fresh.pk, now - datetime.timedelta(minutes=5))
+        buffer.beat(self.fresh.pk, now)
+        buffer.beat(self.stale.pk, now - datetime.timedelta(days=5))
+        self.assertEqual(models.Asset.objects.filter(
+            last_seen__isnull=False).count(), 0)
+        with self.assertNumQueries(1):
+            self.assertEqual(buffer.flush(), 2)
+        self.fresh.refresh_from_db()
+        self.assertEqual(self.fresh.last_seen, now)
+        self.assertEqual(buffer.flush(), 0)
+
+    def test_timer_flushes_without_further_beats(self):
+        now = timezone.now()
+        buffer = heartbeat.HeartbeatBuffer(flush_interval=3600)
+        with mock.patch.object(heartbeat.threading, 'Timer') as timer:
+            buffer.beat(self.fresh.pk, now)
+            buffer.beat(self.stale.pk, now)
+            # 一个周期内只启动一个定时器
+            timer.assert_called_once_with(3600, buffer.run_timer)
+            timer.return_value.start.assert_called_once_with()
+            # 定时器到期时没有新的汇报，缓冲也会写库
+            self.assertEqual(buffer.flush_scheduled(), 2)
+            self.assertIsNone(buffer.timer)
+            self.fresh.refresh_from_db()
+            self.assertEqual(self.fresh.last_seen, now)
+
+            # 写库失败的记录放回缓冲，并在下一个周期重试
+            buffer.beat(self.fresh.pk, now)
+            with mock.patch.object(models.Asset.objects, 'bulk_update',
+                                   side_effect=DatabaseError), \
+                    self.assertLogs('assets.heartbeat', 'ERROR'):
+                self.assertEqual(buffer.flush_scheduled(), 0)
+            self.assertEqual(timer.call_count, 3)
+            self.assertEqual(buffer.flush_scheduled(), 1)
+            self.assertEqual(timer.call_count, 3)
+
+    def test_stale_assets_grouped_by_idc(self):
+        now = timezone.now()
+        for asset, days in ((self.fresh, 0), (self.stale, 5), (self.lost, 10),
+                            (self.offline, 10)):
+            models.Asset.objects.filter(pk=asset.pk).update(
+                last_seen=now - datetime.timedelta(days=days))
+        out = io.StringIO()
+        call_command('stale_assets', days=3, stdout=out)
+        lines = out.getvalue().splitlines()
+        self.assertEqual(lines[0], '未分配机房: 1')
+        self.assertIn('STALE-LOST', lines[1])
+        self.assertEqual(lines[2], 'IDC-S: 1')
+        self.assertIn('STALE-OLD', lines[3])
+        self.assertTrue(lines[4].startswith('共 2 个资产'))
+
+        out = io.StringIO()
+        call_command('stale_assets', days=3, never=True, summary=True,
+                     stdout=out)
+        self.assertEqual(out.getvalue().splitlines()[:2],
+                         ['未分配机房: 2', 'IDC-S: 1'])
+
+
+@skipUnless(capacity.np is not None, '需要 numpy')
+class CapacityReportTest(TestCase):
+    """ 容量分析: 快照按列写出和读回，按分组汇总，错误的列名给出命令错误 """
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'inventory.npz')
+        idc = models.IDC.objects.create(name='IDC-C')
+        for i in range(3):
+            make_server('CAP-%d' % i, 2, idc if i else None)
+        call_command('snapshot_inventory', output=self.path,
+                     stdout=io.StringIO())
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def report(self, **options):
+        out = io.StringIO()
+        call_command('capacity_report', self.path, stdout=out, **options)
+        return out.getvalue().splitlines()
+
+    def test_snapshot_round_trip(self):
+        snapshot = capacity.Snapshot(self.path)
+        self.assertEqual(snapshot.size, 3)
+        result = snapshot.group_sum('idc')
+        self.assertEqual(result['IDC-C']['assets'], 2)
+        self.assertEqual(result['IDC-C']['ram_gb'], 64)
+        self.assertEqual(result['IDC-C']['cpu_cores'], 64)
+        self.assertEqual(result['']['disk_gb'], 3726 * 2)
+
+    def test_report_output(self):
+        lines = self.report(by='idc')
+        self.assertEqual(len(lines), 3)
+        self.assertEqual(lines[1].split()[:3], ['-', '1', '32'])
+        self.assertEqual(lines[2].split()[:3], ['IDC-C', '2', '64'])
+        lines = self.report(by='idc', percentile='ram_gb')
+        self.assertEqual(lines[2].split(), ['IDC-C', '32.0', '32.0', '32.0'])
+        lines = self.report(by='idc', trend='disk_gb')
+        self.assertEqual(lines[2].split()[-1], '%.1f' % (3726 * 4))
+
+    def test_unknown_column(self):
+        for option in ('percentile', 'trend'):
+            with self.assertRaises(CommandError):
+                self.report(**{option: 'no_such_column'})
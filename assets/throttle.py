@@ -0,0 +1,198 @@
+import math
+import threading
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.http import HttpResponse
+
+DEFAULTS = {
+    # 每个来源IP: 桶容量和每秒补充的令牌数，同一个出口IP后面可能有很多台服务器
+    'ip_burst': 60,
+    'ip_rate': 1.0,
+    # 每个SN: 正常情况下一台服务器几个小时才汇报一次
+    'sn_burst': 3,
+    'sn_rate': 1.0 / 300,
+    # 单个进程同时处理的汇报请求数
+    'max_concurrency': 16,
+    # local: 令牌桶保存在进程内存中；cache: 保存在 Django 缓存中，多进程共享
+    'backend': 'local',
+    'cache_alias': 'default',
+    # 进程内最多保存的令牌桶数量，超过后清理已经补满的桶
+    'max_buckets': 100000,
+    # 经过反向代理部署时，来源IP从代理写入的请求头中读取（取最后一个地址，即代理看到的客户端地址），
+    # 只有 REMOTE_ADDR 在 trusted_proxies 中时才使用这个请求头，否则客户端可以伪造来源IP
+    'ip_header': 'HTTP_X_FORWARDED_FOR',
+    'trusted_proxies': [],
+}
+
+
+def get_config():
+    config = dict(DEFAULTS)
+    config.update(getattr(settings, 'REPORT_ADMISSION', {}))
+    return config
+
+
+class LocalBuckets(object):
+    """ 进程内的令牌桶，{key: (令牌数, 上次更新时间)} """
+
+    def __init__(self, max_buckets, idle_timeout):
+        self.max_buckets = max_buckets
+        # 超过这个时间没有请求的桶一定已经补满，与不存在的桶等价
+        self.idle_timeout = idle_timeout
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def take(self, key, rate, burst, now):
+        """ 取一个令牌，成功返回 0，否则返回需要等待的秒数 """
+        with self.lock:
+            tokens, last = self.buckets.get(key, (burst, now))
+            tokens = min(burst, tokens + (now - last) * rate)
+            if tokens >= 1:
+                self.buckets[key] = (tokens - 1, now)
+                wait = 0
+            else:
+                self.buckets[key] = (tokens, now)
+                wait = (1 - tokens) / rate
+            if len(self.buckets) > self.max_buckets:
+                self.buckets = {
+                    key: value
+                    for key, value in self.buckets.items()
+                    if now - value[1] < self.idle_timeout
+                }
+            return wait
+
+
+class CacheBuckets(object):
+    """ 保存在 Django 缓存中的令牌桶，多个进程共享
+    读取和写回之间没有加锁，并发很高时会多放过几个请求，对限流来说可以接受。
+    """
+
+    def __init__(self, alias):
+        self.cache = caches[alias]
+
+    def take(self, key, rate, burst, now):
+        key = 'cmdb:throttle:%s' % key
+        tokens, last = self.cache.get(key, (burst, now))
+        tokens = min(burst, tokens + (now - last) * rate)
+        timeout = int(burst / rate) + 1
+        if tokens >= 1:
+            self.cache.set(key, (tokens - 1, now), timeout)
+            return 0
+        self.cache.set(key, (tokens, now), timeout)
+        return (1 - tokens) / rate
+
+
+class AdmissionController(object):
+    """ 汇报接口的准入控制，整个进程共用一个
+    签名验证之前检查进程内并发数和来源IP的令牌桶，签名验证之后再检查SN的令牌桶，
+    任何一项超限都直接返回 429 和 Retry-After，这些检查只使用请求头和客户端地址，不解析请求体，也不访问数据库。
+    SN 从请求头 X-CMDB-SN 中读取，这个请求头参与签名，伪造别的服务器的SN会在签名验证时被拒绝，
+    不会消耗那台服务器的令牌。
+    """
+
+    def __init__(self, config=None):
+        self.config = config or get_config()
+        if self.config['backend'] == 'cache':
+            self.buckets = CacheBuckets(self.config['cache_alias'])
+        else:
+            self.buckets = LocalBuckets(
+                self.config['max_buckets'],
+                max(self.config['ip_burst'] / self.config['ip_rate'],
+                    self.config['sn_burst'] / self.config['sn_rate']))
+        self.slots = threading.BoundedSemaphore(
+            self.config['max_concurrency'])
+
+    def acquire(self):
+        """ 占用一个并发名额，没有空闲名额时立即返回 False """
+        return self.slots.acquire(blocking=False)
+
+    def release(self):
+        self.slots.release()
+
+    def client_ip(self, request):
+        remote = request.META.get('REMOTE_ADDR', '')
+        if remote in self.config['trusted_proxies']:
+            forwarded = request.META.get(self.config['ip_header'] or '', '')
+            forwarded = forwarded.split(',')[-1].strip()
+            if forwarded:
+                return forwarded
+        return remote
+
+    def check_ip(self, request):
+        """ 返回需要等待的秒数，0 表示放行 """
+        config = self.config
+        return self.buckets.take('ip:%s' % self.client_ip(request),
+                                 config['ip_rate'], config['ip_burst'],
+                                 time.time())
+
+    def check_sn(self, request):
+        """ 签名验证通过之后调用，返回需要等待的秒数 """
+        sn = request.META.get('HTTP_X_CMDB_SN')
+        if not sn:
+            return 0
+        return self.buckets.take('sn:%s' % sn, self.config['sn_rate'],
+                                 self.config['sn_burst'], time.time())
+
+
+def too_many_requests(wait):
+    response = HttpResponse('汇报过于频繁, 请稍后再试!', status=429)
+    response['Retry-After'] = str(max(1, int(math.ceil(wait))))
+    return response
+
+
+# 进程内的准入控制器，配置在第一次请求时读取，修改 REPORT_ADMISSION 配置时清空，下一次请求按新配置重建
+_state = {}
+_lock = threading.Lock()
+
+
+@receiver(setting_changed)
+def reset_admission_control(setting, **kwargs):
+    if setting == 'REPORT_ADMISSION':
+        _state.clear()
+
+
+def get_controller():
+    if 'controller' not in _state:
+        with _lock:
+            if 'controller' not in _state:
+                _state['controller'] = AdmissionController()
+    return _state['controller']
+
+
+def admission_control(view):
+    """ 视图装饰器，放在签名验证之前：检查并发数和来源IP，视图返回之后才释放并发名额 """
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if request.method != 'POST':
+            return view(request, *args, **kwargs)
+        controller = get_controller()
+        if not controller.acquire():
+            return too_many_requests(1)
+        try:
+            wait = controller.check_ip(request)
+            if wait:
+                return too_many_requests(wait)
+            return view(request, *args, **kwargs)
+        finally:
+            controller.release()
+
+    return wrapper
+
+
+def sn_admission(view):
+    """ 视图装饰器，放在签名验证之后：按SN限流，未通过签名的请求不会消耗任何SN的令牌 """
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if request.method == 'POST':
+            wait = get_controller().check_sn(request)
+            if wait:
+                return too_many_requests(wait)
+        return view(request, *args, **kwargs)
+
+    return wrapper
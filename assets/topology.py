@@ -0,0 +1,178 @@
+from django.db import NotSupportedError, connections, router, transaction
+from . import asset_cache
+from . import event_log
+from . import models
+
+# 递归查询的最大层数，防止 hosted_on 数据出现环时无限递归；超过这个层数时抛出 TopologyTooDeep
+MAX_DEPTH = 16
+
+
+class TopologyTooDeep(ValueError):
+    """ 虚拟机拓扑超过 MAX_DEPTH 层，或者 hosted_on 数据中出现了环，查询结果不完整 """
+
+
+def _tables(connection):
+    quote = connection.ops.quote_name
+    return {
+        'server': quote(models.Server._meta.db_table),
+        'ram': quote(models.RAM._meta.db_table),
+        'cpu': quote(models.CPU._meta.db_table),
+    }
+
+
+def _check_support(connection):
+    """ 递归 CTE 需要 MySQL 8.0、MariaDB 10.2.2 或 SQLite 3.8.3 以上的版本
+    Django 2.2 本身要求 SQLite 3.8.3，只有 MySQL 需要在这里检查。
+    """
+    if connection.vendor != 'mysql':
+        return
+    if connection.mysql_is_mariadb:
+        required, name = (10, 2, 2), 'MariaDB 10.2.2'
+    else:
+        required, name = (8, 0), 'MySQL 8.0'
+    if connection.mysql_version < required:
+        raise NotSupportedError(
+            '虚拟机拓扑查询使用 WITH RECURSIVE，需要 %s 或以上版本，当前为 %s' %
+            (name, '.'.join(str(part) for part in connection.mysql_version)))
+
+
+def _check_depth(depth):
+    if depth is not None and depth > MAX_DEPTH:
+        raise TopologyTooDeep('虚拟机拓扑超过 %d 层，hosted_on 数据中可能存在环' %
+                              MAX_DEPTH)
+
+
+def _topology_cte(connection, host_ids=None, depth=MAX_DEPTH + 1):
+    """ 生成 WITH RECURSIVE 子句，topo(root_id, guest_id, depth) 表示 guest 直接或间接运行在 root 上
+    MySQL 8、SQLite 3.8.3 和 PostgreSQL 都支持递归 CTE，整棵拓扑只需一条 SQL。
+    默认多查一层，结果中出现 depth 大于 MAX_DEPTH 的行说明拓扑被截断，由 _check_depth 报错。
+    """
+    _check_support(connection)
+    params = []
+    where = 'hosted_on_id IS NOT NULL'
+    if host_ids is not None:
+        where = 'hosted_on_id IN (%s)' % ', '.join(['%s'] * len(host_ids))
+        params.extend(host_ids)
+    sql = '''
+        WITH RECURSIVE topo(root_id, guest_id, depth) AS (
+            SELECT hosted_on_id, id, 1 FROM {server} WHERE {where}
+            UNION ALL
+            SELECT topo.root_id, s.id, topo.depth + 1
+            FROM {server} s JOIN topo ON s.hosted_on_id = topo.guest_id
+            WHERE topo.depth < %s
+        )
+    '''.format(where=where, **_tables(connection))
+    params.append(depth)
+    return sql, params
+
+
+def guest_ids(host, recursive=True, using=None):
+    """ 运行在宿主机上的全部虚拟机 id，recursive 为 True 时包含嵌套虚拟化中的下级虚拟机
+    原生 SQL 不经过数据库路由，using 为空时按读写分离路由选择数据库，和 ORM 查询一致。
+    下级超过 MAX_DEPTH 层时抛出 TopologyTooDeep，不返回被截断的结果。
+    """
+    host_id = getattr(host, 'pk', host)
+    using = using or router.db_for_read(models.Server)
+    if not recursive:
+        return list(
+            models.Server.objects.using(using).filter(
+                hosted_on_id=host_id).values_list('pk', flat=True))
+    connection = connections[using]
+    sql, params = _topology_cte(connection, [host_id])
+    with connection.cursor() as cursor:
+        cursor.execute(
+            sql + 'SELECT guest_id, MAX(depth) FROM topo GROUP BY guest_id',
+            params)
+        rows = cursor.fetchall()
+    _check_depth(max((depth for _, depth in rows), default=None))
+    return [guest_id for guest_id, _ in rows]
+
+
+def guests(host, recursive=True):
+    """ 运行在宿主机上的全部虚拟机，带出资产信息，共两条查询 """
+    return models.Server.objects.filter(
+        pk__in=guest_ids(host, recursive)).select_related('asset')
+
+
+def guest_resources(host_ids=None, recursive=False):
+    """ 按宿主机汇总虚拟机数量、内存(GB)和CPU核数，一条 SQL 完成
+    recursive 为 False 时只统计直接运行在宿主机上的虚拟机，嵌套虚拟机的资源已经包含在上级虚拟机中，不会重复计算；
+    为 True 时统计宿主机下的全部虚拟机，拓扑超过 MAX_DEPTH 层时抛出 TopologyTooDeep。host_ids 为 None 时统计所有宿主机。
+    返回 {宿主机 server id: {'guests': 数量, 'ram': 内存合计, 'cores': 核数合计}}
+    """
+    if host_ids is not None and not host_ids:
+        return {}
+    connection = connections[router.db_for_read(models.Server)]
+    # 只统计直接下级时不需要递归
+    sql, params = _topology_cte(connection, host_ids,
+                                MAX_DEPTH + 1 if recursive else 1)
+    sql += '''
+        SELECT topo.root_id, COUNT(*), COALESCE(SUM(ram.total), 0),
+               COALESCE(SUM(cpu.cpu_core_count), 0), MAX(topo.depth)
+        FROM topo
+        JOIN {server} g ON g.id = topo.guest_id
+        LEFT JOIN (SELECT asset_id, SUM(capacity) AS total
+                   FROM {ram} GROUP BY asset_id) ram ON ram.asset_id = g.asset_id
+        LEFT JOIN {cpu} cpu ON cpu.asset_id = g.asset_id
+        {where}
+        GROUP BY topo.root_id
+    '''.format(where='' if recursive else 'WHERE topo.depth = 1',
+               **_tables(connection))
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+    _check_depth(max((row[4] for row in rows), default=None))
+    return {
+        root_id: {
+            'guests': count,
+            'ram': int(ram),
+            'cores': int(cores)
+        }
+        for root_id, count, ram, cores, _ in rows
+    }
+
+
+def reassign(server_ids, target_host, user=None):
+    """ 把一批虚拟机迁移到新的宿主机上，一条 UPDATE 完成，并批量写入事件日志
+    目标宿主机不能是被迁移虚拟机本身或它们的下级虚拟机，否则会形成环。返回迁移的数量。
+    被迁移虚拟机的下级超过 MAX_DEPTH 层时无法完整检查，抛出 TopologyTooDeep，不做迁移。
+    环的检查和迁移都在主库的同一个事务中完成，不能用从库上可能过期的拓扑做判断。
+    """
+    server_ids = list(server_ids)
+    target_id = getattr(target_host, 'pk', target_host)
+    if not server_ids:
+        return 0
+    using = router.db_for_write(models.Server)
+    connection = connections[using]
+    with transaction.atomic(using=using):
+        if target_id is not None:
+            sql, params = _topology_cte(connection, server_ids)
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    sql + 'SELECT COUNT(CASE WHEN guest_id = %s THEN 1 END), '
+                    'MAX(depth) FROM topo', params + [target_id])
+                nested, depth = cursor.fetchone()
+            _check_depth(depth)
+            if nested or target_id in server_ids:
+                raise ValueError('目标宿主机不能是被迁移的虚拟机或其下级虚拟机')
+
+        queryset = models.Server.objects.using(using).filter(pk__in=server_ids)
+        moved = list(queryset.values_list('asset_id', 'hosted_on_id'))
+        count = queryset.update(hosted_on_id=target_id)
+        asset_cache.bump_asset_versions(asset_id for asset_id, _ in moved)
+        with event_log.EventLogWriter(batch_size=1000, using=using) as writer:
+            for asset_id, old_host_id in moved:
+                writer.add('虚拟机迁移',
+                           asset=models.Asset(pk=asset_id),
+                           event_type=0,
+                           component='hosted_on',
+                           detail='宿主机 %s -> %s' % (old_host_id, target_id),
+                           user=user)
+    return count
+
+
+def evacuate(host, target_host, user=None):
+    """ 宿主机下线维护时，把它上面直接运行的全部虚拟机迁移到另一台宿主机 """
+    return reassign(guest_ids(host, recursive=False,
+                              using=router.db_for_write(models.Server)),
+                    target_host, user=user)
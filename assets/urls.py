@@ -5,4 +5,8 @@ app_name = 'assets'
 
 urlpatterns = [
     path('report/', views.report, name='report'),
+    path('detail/<int:asset_id>/', views.asset_detail, name='detail'),
+    path('summary/', views.asset_summary, name='summary'),
+    path('licenses/', views.license_utilisation, name='licenses'),
+    path('expiry/', views.expiry_calendar, name='expiry'),
 ]
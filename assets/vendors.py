@@ -0,0 +1,84 @@
+import re
+import threading
+
+from django.db import transaction
+from . import asset_cache
+from . import models
+
+# 厂商或别名变化时加一，各进程据此重新加载厂商字典
+VERSION_KEY = 'cmdb:vendor:ver'
+
+_SPACES = re.compile(r'\s+')
+
+
+def clean_model(value):
+    """ 型号只合并多余的空白，大小写和写法保持原样 """
+    if not value:
+        return value
+    return _SPACES.sub(' ', str(value)).strip()
+
+
+class VendorResolver(object):
+    """ 进程内的厂商字典
+    第一次使用时用两条查询加载全部厂商和别名，得到 {规范化键: 厂商id}，之后解析厂商名称只查字典；
+    厂商或别名变化时共享缓存中的版本号加一，各进程在下一次解析时发现版本变化再重新加载。
+    """
+
+    def __init__(self):
+        self.version = None
+        # (规范化键到厂商id, 厂商id到名称)，整体替换，读取时不需要加锁
+        self.table = ({}, {})
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def load():
+        names = dict(
+            models.Manufacturer.objects.order_by('id').values_list(
+                'id', 'name'))
+        ids = {}
+        for manufacturer_id, name in names.items():
+            # 规范化键相同的重复厂商，归到最早创建的那一个
+            ids.setdefault(models.vendor_key(name), manufacturer_id)
+        # 别名优先于厂商名称本身
+        ids.update(
+            models.ManufacturerAlias.objects.values_list(
+                'key', 'manufacturer_id'))
+        return ids, names
+
+    def refresh(self):
+        version = asset_cache.get_version(VERSION_KEY)
+        if version == self.version:
+            return
+        with self.lock:
+            if version != self.version:
+                self.table = self.load()
+                self.version = version
+
+    def reload(self):
+        """ 不比较版本号，立即重新加载 """
+        self.version = None
+        self.refresh()
+
+    def resolve(self, name):
+        """ 厂商名称对应的厂商id，无法识别时返回 None """
+        key = models.vendor_key(name)
+        if not key:
+            return None
+        self.refresh()
+        return self.table[0].get(key)
+
+    def canonical(self, name):
+        """ 厂商的标准名称，无法识别时返回去掉首尾空白的原名称 """
+        manufacturer_id = self.resolve(name)
+        names = self.table[1]
+        if manufacturer_id in names:
+            return names[manufacturer_id]
+        return name.strip() if isinstance(name, str) else name
+
+
+resolver = VendorResolver()
+
+
+def invalidate():
+    """ 厂商或别名变化后调用，事务提交后让所有进程的厂商字典失效 """
+    transaction.on_commit(lambda: asset_cache.bump_version(VERSION_KEY))
@@ -1,42 +1,152 @@
+from django.contrib.admin.views.decorators import staff_member_required
 from django.shortcuts import render, HttpResponse
+from django.http import Http404, JsonResponse
 
 # Create your views here.
 from django.views.decorators.csrf import csrf_exempt
-import json
 from . import models
+from . import agent_auth
+from . import asset_cache
 from . import asset_handler
+from . import db_router
+from . import expiry
+from . import heartbeat
+from . import licenses
+from . import report_history
+from . import report_schema
+from . import report_schedule
+from . import throttle
+
+
+def report_response(message, code=0, sn=None, online=True, changed=False,
+                    errors=None, warnings=None):
+    """ 汇报接口的结构化返回，next_report_in 告诉客户端多少秒之后再汇报 """
+    result = {
+        'code': code,
+        'message': message,
+        'next_report_in': report_schedule.next_interval(
+            sn, online=online, changed=changed),
+    }
+    if errors:
+        result['errors'] = errors
+    if warnings:
+        result['warnings'] = warnings
+    return JsonResponse(result, json_dumps_params={'ensure_ascii': False})
 
 
 @csrf_exempt
+@throttle.admission_control
+@agent_auth.signature_required
+@throttle.sn_admission
+@db_router.use_primary
 def report(request):
     """
-    通过csrf_exempt装饰器，跳过Django的csrf安全机制，让post的数据能被接收，但这又会带来新的安全问题。
-    可以在客户端，使用自定义的认证token，进行身份验证。这部分工作，请根据实际情况，自己进行。
+    通过csrf_exempt装饰器，跳过Django的csrf安全机制，让post的数据能被接收。
+    客户端使用 HMAC 对请求签名，signature_required 在解析数据之前验证签名，未签名或签名错误的请求返回 401。
+    准入控制分两步: 签名验证之前按来源IP限流，签名验证之后按请求头 X-CMDB-SN 限流，
+    这个请求头必须与汇报数据中的SN一致。
+    返回 JSON: {"code": 0, "message": "...", "next_report_in": 秒数}，code 不为 0 表示数据有误，
+    此时 errors 中是逐个字段的错误 [{"code": "required", "field": "sn", "message": "..."}]，参见 report_schema。
+    入库时被忽略的组件（例如没有SN的硬盘）以同样的格式放在 warnings 中，code 为 ignored。
     :param request:
     :return:
     """
     if request.method == "POST":
-        asset_data = request.POST.get('asset_data')
-        data = json.loads(asset_data)
-        # 数据检查
-        if not data:
-            return HttpResponse('没有数据!')
-        if not issubclass(dict, type(data)):
-            return HttpResponse('数据必须为字典格式!')
-        # 是否携带了关键的SN号
-        sn = data.get('sn', None)
-        if sn:
-            # 进入审批阶段
-            # 首先判断是否在上线资产总存在该sn
-            asset_obj = models.Asset.objects.filter(sn=sn)
-            if asset_obj:
-                # 进入已上线资产的数据更新流程
-                pass
-                return HttpResponse('资产数据已经更新!')
-            else:  # 如果已上线资产中没有，那么说明是未批准资产，进入新资产待审批区，更新或者创建资产
-                obj = asset_handler.NewAsset(request, data)
-                response = obj.add_to_new_assets_zone()
-                return HttpResponse(response)
-        else:
-            return HttpResponse('没有资产SN序列号, 请检查数据!')
+        data, error = parse_report(request)
+        if error is not None:
+            return error
+        return save_report(request, data)
     return HttpResponse('200 ok')
+
+
+def parse_report(request):
+    """ 数据检查，在任何数据库操作之前完成，返回 (数据, None)，数据有误时返回 (None, 错误响应) """
+    report_schedule.meter.hit()
+    data, errors = report_schema.validator.parse(request.POST.get('asset_data'))
+    if errors:
+        return None, report_response('数据有误, 请检查数据!', code=1, errors=errors)
+    # 限流按签名过的请求头 X-CMDB-SN 进行，数据中的SN不同说明请求头与数据不是同一台服务器
+    if request.META.get('HTTP_X_CMDB_SN', '') != (data['sn'] or ''):
+        return None, report_response('请求头中的SN与汇报数据不一致!', code=1)
+    return data, None
+
+
+def save_report(request, data):
+    """ 校验通过的汇报数据入库 """
+    # 是否携带了关键的SN号
+    sn = data['sn']
+    if not sn:
+        return report_response('没有资产SN序列号, 请检查数据!', code=1)
+    # 保存汇报数据的历史版本，内容没有变化时不写库
+    changed = report_history.record_report(sn, data) is not None
+    # 进入审批阶段
+    # 首先判断是否在上线资产总存在该sn
+    asset_obj = models.Asset.objects.filter(sn=sn).first()
+    if asset_obj:
+        # 记录最近汇报时间，先缓冲在内存中，定期批量写库
+        heartbeat.buffer.beat(asset_obj.pk)
+        # 进入已上线资产的数据更新流程，硬件没有变化时只做一次摘要比较
+        obj = asset_handler.UpdateAsset(request, asset_obj, data)
+        response = obj.update()
+        return report_response(response, sn=sn, changed=changed,
+                               warnings=obj.warnings)
+    else:  # 如果已上线资产中没有，那么说明是未批准资产，进入新资产待审批区，更新或者创建资产
+        obj = asset_handler.NewAsset(request, data)
+        response = obj.add_to_new_assets_zone()
+        return report_response(response, sn=sn, online=False)
+
+
+@staff_member_required
+def asset_detail(request, asset_id):
+    """ 资产详情，包括服务器信息和各类组件，读取版本化的缓存，只对后台管理员开放 """
+    detail = asset_cache.get_asset_detail(asset_id)
+    if detail is None:
+        raise Http404('资产不存在!')
+    return JsonResponse(detail, json_dumps_params={'ensure_ascii': False})
+
+
+@staff_member_required
+def asset_summary(request):
+    """ 资产数量统计，只对后台管理员开放 """
+    return JsonResponse(asset_cache.get_asset_summary(),
+                        json_dumps_params={'ensure_ascii': False})
+
+
+@staff_member_required
+def license_utilisation(request):
+    """ 软件授权使用情况，over_deployed 为 true 表示安装数量超过了授权数量，只对后台管理员开放 """
+    rows = licenses.utilisation()
+    return JsonResponse(
+        {
+            'licenses': rows,
+            'over_deployed': sum(1 for row in rows if row['over_deployed']),
+        },
+        json_dumps_params={'ensure_ascii': False})
+
+
+@staff_member_required
+def expiry_calendar(request):
+    """ 过保和合同到期日历，只对后台管理员开放
+    参数 months: 未来几个月，默认 6；group: month、idc、business_unit 或 all，默认 month。
+    数据来自定期重建的日历表，refreshed_at 是最近一次重建的时间；
+    months 不能超过最近一次重建时覆盖的范围（expiry_calendar --refresh --horizon），否则返回 400。
+    """
+    try:
+        months = int(request.GET.get('months', 6))
+    except ValueError:
+        months = 0
+    group = request.GET.get('group', 'month')
+    refreshed_at, horizon = expiry.coverage()
+    if not 0 < months <= horizon:
+        return JsonResponse({'error': 'months 必须在 1 到 %d 之间' % horizon},
+                            status=400,
+                            json_dumps_params={'ensure_ascii': False})
+    if group not in expiry.GROUP_FIELDS:
+        return JsonResponse({'error': '不支持的分组: %s' % group}, status=400,
+                            json_dumps_params={'ensure_ascii': False})
+    return JsonResponse(
+        {
+            'refreshed_at': refreshed_at,
+            'buckets': expiry.calendar(months, group),
+        },
+        json_dumps_params={'ensure_ascii': False})